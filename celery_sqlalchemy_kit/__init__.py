@@ -5,4 +5,8 @@ from celery_sqlalchemy_kit import SyncTask
 
 from .base_task import SyncTask as SyncTask # noqa
 from .base_task import AsyncTask as AsyncTask # noqa
+from .base_task import BatchTask as BatchTask # noqa
+from .base_task import AsyncBatchTask as AsyncBatchTask # noqa
+from .base_task import BatchItem as BatchItem # noqa
+from .base_task import ManyResult as ManyResult # noqa
 from .scheduler import RoutineScheduler as RoutineScheduler # noqa
\ No newline at end of file
@@ -1,13 +1,222 @@
 import asyncio
+import cProfile
 import os
+import random
+import threading
+import time
+import types
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Tuple
 
 from celery import Task
+from celery._state import _task_stack
+from celery.exceptions import Retry
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
 from celery.utils.log import get_logger
+from celery.utils.time import maybe_iso8601, maybe_make_aware
+from celery.worker.state import revoked as revoked_tasks
 from celery.schedules import crontab
+from celery.worker.strategy import hybrid_to_proto2
+from kombu.serialization import dumps
+
+from .metrics import Metrics, metrics_from_config
 
 
 logger = get_logger(__name__)
 
+# Long-lived event loop of this worker process, running in a background thread.
+# Async DB connection pools and HTTP clients bound to it can be reused across tasks.
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_thread: threading.Thread | None = None
+_loop_pid: int | None = None
+_loop_lock = threading.Lock()
+# Async DBs with connection pools by URI, pool settings and event loop, shared by all async tasks on the loop
+_async_dbs: Dict[Tuple, Any] = {}
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the event loop of this worker process and start it, if it is not running yet.
+    A loop inherited from a parent process (fork) is not reused.
+    """
+    global _loop, _loop_thread, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid() or not _loop_thread.is_alive():
+            _forget_async_dbs()
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name="celery-async-loop", daemon=True)
+            _loop_thread.start()
+            _loop_pid = os.getpid()
+        return _loop
+
+
+def run_in_event_loop(coro):
+    """Run a coroutine on the event loop of this worker process and wait for its result."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. time limit exceeded: do not leave the coroutine running
+        future.cancel()
+        raise
+
+
+def stop_event_loop():
+    """Cancel pending tasks, shut down the event loop of this worker process and wait for its thread."""
+    global _loop, _loop_thread, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            return
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = _loop_pid = None
+    try:
+        asyncio.run_coroutine_threadsafe(_shutdown_loop(), loop).result(timeout=30)
+    except Exception as e:
+        logger.error(e, exc_info=True)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=30)
+    loop.close()
+
+
+def get_async_db(async_db_uri: str, pool_size: int, max_overflow: int):
+    """
+    Return the async DB for 'async_db_uri' and the pool settings on the running event loop
+    and create it on first use. Its pool is bound to the loop, so it is closed when the loop is stopped
+    and neither used by a new loop nor by a forked worker process.
+    """
+    key = (async_db_uri, pool_size, max_overflow, asyncio.get_running_loop())
+    async_db = _async_dbs.get(key)
+    if async_db is None:
+        from .db.async_session import AsyncSessionWrapper
+
+        async_db = _async_dbs[key] = AsyncSessionWrapper(async_db_uri, pool_size=pool_size, max_overflow=max_overflow)
+    return async_db
+
+
+def _forget_async_dbs():
+    """
+    Drop the async DBs of former event loops, e.g. of a loop whose thread died or inherited from the parent process.
+    Their connections are not closed, they belong to a loop that does not run anymore in this process.
+    """
+    for async_db in _async_dbs.values():
+        async_db.engine.sync_engine.dispose(close=False)
+    _async_dbs.clear()
+
+
+async def _shutdown_loop():
+    loop = asyncio.get_running_loop()
+    for key in [key for key in _async_dbs if key[3] is loop]:
+        await _async_dbs.pop(key).close()
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await asyncio.get_running_loop().shutdown_asyncgens()
+    await asyncio.get_running_loop().shutdown_default_executor()
+
+
+@worker_process_init.connect
+def _start_worker_loop(**kwargs):
+    get_event_loop()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _stop_worker_loop(**kwargs):
+    stop_event_loop()
+
+
+class TaskRun:
+    """Measurements of one run of a task, if task metrics are enabled or the run is profiled."""
+
+    def __init__(self, profiler: cProfile.Profile | None):
+        self.profiler = profiler
+        self.thread_id = threading.get_ident()
+        self.result = None
+        #: wall and CPU time of the steps of the coroutine of an async task on the event loop
+        self.loop_busy = 0.0
+        self.loop_cpu = 0.0
+        self.loop_thread_id: int | None = None
+
+
+# run of the task executed by the current thread, if it is measured
+_task_run: ContextVar[TaskRun | None] = ContextVar("task_run", default=None)
+
+
+@types.coroutine
+def _wrap_steps(coro, enter: Callable[[], Any], leave: Callable[[Any], None]):
+    """Await 'coro' and call 'enter' before and 'leave' with the value returned by 'enter' after each of its steps."""
+    value, error = None, None
+    while True:
+        state = enter()
+        try:
+            future = coro.send(value) if error is None else coro.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            leave(state)
+        try:
+            value, error = (yield future), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            # e.g. cancellation
+            value, error = None, e
+
+
+async def _measured(coro, run: TaskRun):
+    """
+    Await 'coro' and add the time of each of its steps on the event loop to 'run'.
+    The steps are profiled, if the run is profiled and the event loop runs in a thread of its own.
+    """
+    run.loop_thread_id = threading.get_ident()
+    profiler = run.profiler if run.loop_thread_id != run.thread_id else None
+
+    def enter():
+        if profiler is not None:
+            profiler.enable()
+        return time.perf_counter(), time.thread_time()
+
+    def leave(start):
+        if profiler is not None:
+            profiler.disable()
+        run.loop_busy += time.perf_counter() - start[0]
+        run.loop_cpu += time.thread_time() - start[1]
+
+    return await _wrap_steps(coro, enter, leave)
+
+
+async def _with_request(coro, task: Task, request):
+    """
+    Await 'coro' with 'task' as current task and 'request' as its request during each of its steps.
+    Celery keeps both per thread, so they are not set on the thread of the persistent event loop otherwise.
+    """
+
+    def enter():
+        _task_stack.push(task)
+        task.request_stack.push(request)
+
+    def leave(_):
+        task.request_stack.pop()
+        _task_stack.pop()
+
+    return await _wrap_steps(coro, enter, leave)
+
+
+class ManyResult(NamedTuple):
+    """Results of AsyncTask.execute_many, in order of the items. Failed items are None in 'results'."""
+
+    results: List[Any]
+    #: Exceptions of failed items by index, asyncio.TimeoutError if an item timed out
+    errors: Dict[int, BaseException]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
 
 class SyncTask(Task):
     """
@@ -25,6 +234,12 @@ class SyncTask(Task):
     schedule: int | dict | None = None
     options: dict = {}
     kwargs: dict = {}
+    #: Exporter of the task metrics, None if disabled (see 'worker_metrics')
+    metrics: Metrics | None
+    #: Fraction of runs profiled with cProfile, defaults to 'worker_profile_rate', 0 disables the profiler
+    profile_rate: float | None = None
+    #: Directory the profiles are written to, defaults to 'worker_profile_dir'
+    profile_dir: str | None = None
 
     def __init__(self):
         if self.app.conf.get("celery_max_retry"):
@@ -37,9 +252,81 @@ class SyncTask(Task):
         else:
             self.retry_delay = int(os.getenv("DEFAULT_CELERY_RETRY_DELAY", 300))
 
+        self.metrics = metrics_from_config(
+            self.app.conf.get("worker_metrics") or os.getenv("WORKER_METRICS"), namespace="celery_worker"
+        )
+        if self.profile_rate is None:
+            self.profile_rate = float(self.app.conf.get("worker_profile_rate") or os.getenv("WORKER_PROFILE_RATE", 0))
+        if self.profile_dir is None:
+            self.profile_dir = (
+                self.app.conf.get("worker_profile_dir") or os.getenv("WORKER_PROFILE_DIR", "celery-profiles")
+            )
+
         if self.schedule:
             self.schedule_task()
 
+    def __call__(self, *args, **kwargs):
+        """
+        Run the task. If task metrics are enabled, its wall and CPU time, the size of its result and retries
+        and failures are exported. A fraction 'profile_rate' of the runs is profiled and written to 'profile_dir'.
+        """
+        profiler = cProfile.Profile() if self.profile_rate and random.random() < self.profile_rate else None
+        if self.metrics is None and profiler is None:
+            return super().__call__(*args, **kwargs)
+        run = TaskRun(profiler)
+        token = _task_run.set(run)
+        profile_here = profiler is not None and self._profile_in_caller_thread()
+        failure = None
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            if profile_here:
+                profiler.enable()
+            result = super().__call__(*args, **kwargs)
+            if result is not None:
+                run.result = result
+            return result
+        except Retry:
+            failure = "task_retries"
+            raise
+        except Exception:
+            failure = "task_failures"
+            raise
+        finally:
+            wall, cpu = time.perf_counter() - start, time.thread_time() - cpu_start
+            if profile_here:
+                profiler.disable()
+            _task_run.reset(token)
+            self._finish_run(run, wall, cpu, failure)
+
+    def _profile_in_caller_thread(self) -> bool:
+        # the task runs in the thread calling it
+        return True
+
+    def _finish_run(self, run: TaskRun, wall: float, cpu: float, failure: str | None):
+        """Export the metrics of a run and write its profile. Errors are logged, they must not fail the task."""
+        try:
+            if run.loop_thread_id is not None and run.loop_thread_id != run.thread_id:
+                # the steps of an async task ran on the event loop of the worker process
+                cpu += run.loop_cpu
+            if self.metrics is not None:
+                self.metrics.observe("task_duration_seconds", wall, task=self.name)
+                self.metrics.observe("task_cpu_seconds", cpu, task=self.name)
+                if run.loop_thread_id is not None:
+                    self.metrics.observe("task_loop_busy_seconds", run.loop_busy, task=self.name)
+                if failure is not None:
+                    self.metrics.increment(failure, task=self.name)
+                elif run.result is not None:
+                    _, _, data = dumps(run.result, serializer=self.app.conf.result_serializer)
+                    self.metrics.observe("task_result_bytes", len(data), task=self.name)
+            if run.profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                file_name = f"{self.name}-{int(time.time() * 1000)}-{self.request.id or 'local'}.prof"
+                path = os.path.join(self.profile_dir, file_name.replace(os.sep, "_"))
+                run.profiler.dump_stats(path)
+                logger.info(f"Profile of {self.name} ({wall:.3f}s wall, {cpu:.3f}s CPU) written to {path}.")
+        except Exception as e:
+            logger.error(f"Could not export metrics of {self.name}: {e!r}", exc_info=True)
+
     def run(self, *args, **kwargs):
         """The body of the task executed by workers."""
         raise NotImplementedError("Synchronous Tasks must define the run method.")
@@ -70,31 +357,343 @@ class AsyncTask(SyncTask):
     If no schedule is set, the task is not being scheduled.
     All tasks can be executed on demand by using standard celery methods
     like 'async_apply()', 'delay()' or 'send_task()'.
+
+    By default all async tasks of a worker process run on one long-lived event loop.
+    Set 'celery_persistent_loop' to False to run every task in a new event loop with 'asyncio.run'.
+
+    Set 'use_async_session' to True to get an async DB session passed to 'execute' as keyword argument 'session'.
+    The session comes from a pool shared by all tasks of the worker process (see 'worker_async_db_uri')
+    and is committed after 'execute' returns or rolled back if it raises.
+
+    Use 'execute_many' in 'execute' to process many sub-items concurrently with a limit of
+    'concurrency' items at a time and a timeout of 'item_timeout' seconds per item.
     """
 
+    persistent_loop: bool
+    use_async_session: bool = False
+    async_db_uri: str | None
+    async_db_pool_size: int
+    async_db_max_overflow: int
+    #: Maximum number of items processed at a time by execute_many, defaults to the async DB pool size
+    concurrency: int | None = None
+    #: Timeout in seconds per item of execute_many, no timeout if None
+    item_timeout: float | None = None
+
+    def __init__(self):
+        super().__init__()
+        if self.app.conf.get("celery_persistent_loop") is not None:
+            self.persistent_loop = bool(self.app.conf.get("celery_persistent_loop"))
+        else:
+            self.persistent_loop = os.getenv("CELERY_PERSISTENT_LOOP", "true").lower() in ("1", "true", "yes")
+
+        self.async_db_uri = self.app.conf.get("worker_async_db_uri") or os.getenv("WORKER_ASYNC_DB_URI")
+        self.async_db_pool_size = int(
+            self.app.conf.get("worker_async_db_pool_size") or os.getenv("WORKER_ASYNC_DB_POOL_SIZE", 5)
+        )
+        self.async_db_max_overflow = int(
+            self.app.conf.get("worker_async_db_max_overflow") or os.getenv("WORKER_ASYNC_DB_MAX_OVERFLOW", 10)
+        )
+        if self.concurrency is None:
+            self.concurrency = int(
+                self.app.conf.get("worker_async_concurrency")
+                or os.getenv("WORKER_ASYNC_CONCURRENCY", self.async_db_pool_size)
+            )
+        if self.item_timeout is None:
+            item_timeout = self.app.conf.get("worker_async_item_timeout") or os.getenv("WORKER_ASYNC_ITEM_TIMEOUT")
+            self.item_timeout = float(item_timeout) if item_timeout else None
+
     def run(self, *args, **kwargs):
         try:
-            asyncio.run(self.run_execute(*args, **kwargs))
+            result = self.run_coroutine(self.run_execute(*args, **kwargs))
         except Exception as e:
             raise self.retry(exc=e, max_retries=self.max_retries, retry_delay=self.retry_delay)
+        # the result is only logged, its size is exported if task metrics are enabled
+        run = _task_run.get()
+        if run is not None:
+            run.result = result
+
+    def run_coroutine(self, coro):
+        """
+        Run a coroutine on the persistent event loop or, if disabled, in a new event loop.
+        On the persistent event loop, the coroutine sees the request of the task as 'self.request'
+        and the task as 'current_task', like in the thread of the worker.
+        If the run of the task is measured, the time of the steps of the coroutine on the event loop is measured.
+        """
+        if self.persistent_loop:
+            coro = _with_request(coro, self, self.request)
+        run = _task_run.get()
+        if run is not None:
+            coro = _measured(coro, run)
+        if self.persistent_loop:
+            return run_in_event_loop(coro)
+        return asyncio.run(coro)
+
+    def _profile_in_caller_thread(self) -> bool:
+        # on the persistent event loop, the steps of the coroutine are profiled in the thread of the loop
+        return not self.persistent_loop
 
     async def run_execute(self, *args, **kwargs):
-        # If all your async tasks use the same type of async db connection, you can override this method
-        # to set up a session here. You can then pass the session to the 'execute' method
-        # asyncDBSession = AsyncDBSession(scheduler_db_uri=async_db_uri)
-        # await asyncDBSession.connect()
         try:
-            result = await self.execute(*args, **kwargs)
+            if self.use_async_session:
+                # changes in database are rolled back, if an error occurs
+                async with self.async_session() as session:
+                    result = await self.execute(*args, session=session, **kwargs)
+            else:
+                result = await self.execute(*args, **kwargs)
         except Exception as e:
             logger.error(e, exc_info=True)
-            # if an async db connection is used,
-            # rollback the session in this except block, to avoid changes in database when an error occurs
-            # await asyncDBSession.rollback()
             raise e
         else:
             if result:
                 logger.info(result)
+            return result
+
+    @asynccontextmanager
+    async def async_session(self):
+        """
+        Provide an async DB session, that is committed on success and rolled back on error.
+        On the persistent event loop, sessions come from the pool of the worker process.
+        Otherwise, a new engine is created for the event loop of this task and disposed afterwards.
+        """
+        if not self.async_db_uri:
+            raise RuntimeError("No async DB URI provided (worker_async_db_uri / WORKER_ASYNC_DB_URI).")
+        if self.persistent_loop:
+            async_db = get_async_db(self.async_db_uri, self.async_db_pool_size, self.async_db_max_overflow)
+            async with async_db.session() as session:
+                yield session
+        else:
+            from .db.async_session import AsyncSessionWrapper
+
+            async_db = AsyncSessionWrapper(self.async_db_uri, pool_size=1, max_overflow=0)
+            try:
+                async with async_db.session() as session:
+                    yield session
+            finally:
+                await async_db.close()
 
     async def execute(self, *args, **kwargs):
         """The body of the task executed by workers."""
         raise NotImplementedError("Asynchronous Tasks must define the execute method.")
+
+    async def execute_many(
+        self,
+        func: Callable[[Any], Awaitable[Any]],
+        items: Iterable[Any],
+        concurrency: int | None = None,
+        timeout: float | None = None,
+    ) -> ManyResult:
+        """
+        Await func(item) for all items with at most 'concurrency' items running at a time.
+        An item failing or exceeding its timeout does not stop the others.
+        Only 'concurrency' coroutines are created at a time, so 'items' may be a lazy iterable.
+
+        **Parameters**
+
+        * `func`: Coroutine function called with one item
+        * `items`: Items to process
+        * `concurrency`: Maximum number of items running at a time, defaults to 'concurrency' of the task
+        * `timeout`: Timeout in seconds per item, defaults to 'item_timeout' of the task
+
+        **Returns**
+
+        ManyResult with the results in order of the items and the exceptions of failed items by index
+        """
+        concurrency = concurrency or self.concurrency or 1
+        timeout = timeout if timeout is not None else self.item_timeout
+        results: List[Any] = []
+        errors: Dict[int, BaseException] = {}
+        pending = enumerate(items)
+
+        async def worker():
+            # workers share one iterator, so items are taken in order and 'index' is always len(results)
+            for index, item in pending:
+                results.append(None)
+                try:
+                    if timeout is not None:
+                        results[index] = await asyncio.wait_for(func(item), timeout)
+                    else:
+                        results[index] = await func(item)
+                except Exception as e:
+                    errors[index] = e
+
+        workers = [worker() for _ in range(concurrency)]
+        if self.persistent_loop:
+            # the workers run as tasks of their own on the event loop, outside the steps of 'execute'
+            workers = [_with_request(coro, self, self.request) for coro in workers]
+        await asyncio.gather(*workers)
+        if errors:
+            logger.warning(
+                f"{self.name}: {len(errors)} of {len(results)} items failed, "
+                f"first error at item {min(errors)}: {errors[min(errors)]!r}"
+            )
+        return ManyResult(results, errors)
+
+
+class BatchItem(NamedTuple):
+    """One buffered call of a BatchTask."""
+
+    id: str
+    args: tuple
+    kwargs: dict
+    retries: int = 0
+
+
+class BatchTask(SyncTask):
+    """
+    This Task class buffers incoming calls on the worker and runs them in batches.
+    Write your custom task by inheriting from this class and defining its 'run_batch' method.
+    It gets a list of BatchItems and has to return one result per item in the same order.
+    Return an exception instead of a result to mark a single item as failed. Only failed items are retried.
+
+    A batch is run when 'flush_every' calls or 'max_batch_bytes' of message bodies are buffered
+    or 'flush_interval' seconds passed. Messages are acknowledged when their batch is started
+    (or finished, if 'acks_late' is set), so the prefetch limit of the worker must allow at least
+    'flush_every' messages, e.g. 'worker_prefetch_multiplier = 0'.
+    Revoked and expired calls are acknowledged and marked as revoked when they are received
+    and again when their batch is started, they are not run.
+    Callbacks, chords, rate limits and revoking by stamped headers are not supported for batch tasks.
+    """
+
+    #: Maximum number of calls per batch
+    flush_every: int = 100
+    #: Maximum time in seconds a call waits in buffer
+    flush_interval: float = 1.0
+    #: Maximum size in bytes of the buffered message bodies per batch, no limit if None
+    max_batch_bytes: int | None = None
+
+    def run(self, *args, **kwargs):
+        """Run a single call as batch of one, e.g. if the task is called eagerly."""
+        result = self.run_batch([BatchItem(id=self.request.id, args=args, kwargs=kwargs)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def run_batch(self, items: List[BatchItem]) -> List[Any]:
+        """The body of the batch task executed by workers."""
+        raise NotImplementedError("Batch Tasks must define the run_batch method.")
+
+    def apply_batch(self, items: List[BatchItem]):
+        """
+        Run a batch and store the result of every item in the result backend.
+        Failed items are sent again with a countdown of 'retry_delay', until 'max_retries' is reached.
+        """
+        logger.info(f"Running batch of {len(items)} calls of {self.name}.")
+        try:
+            results = self.run_batch(items)
+            if len(results) != len(items):
+                raise ValueError(f"run_batch returned {len(results)} results for {len(items)} items.")
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            results = [e] * len(items)
+        for item, result in zip(items, results):
+            if isinstance(result, Exception):
+                self.on_item_failure(item, result)
+            else:
+                self.backend.mark_as_done(item.id, result)
+
+    def on_item_failure(self, item: BatchItem, exc: Exception):
+        if item.retries < self.max_retries:
+            self.backend.mark_as_retry(item.id, exc)
+            self.apply_async(
+                item.args, item.kwargs, task_id=item.id, retries=item.retries + 1, countdown=self.retry_delay
+            )
+        else:
+            logger.error(f"Call {item.id} of {self.name} failed after {item.retries} retries: {exc!r}")
+            self.backend.mark_as_failure(item.id, exc)
+
+    def Strategy(self, task, app, consumer):
+        """Worker strategy, that buffers incoming messages instead of executing each of them in the pool."""
+        buffer = []
+        buffer_bytes = 0
+
+        def discard_revoked(item: BatchItem, ack, expires: datetime | None) -> bool:
+            # like the default strategy of celery: revoked and expired calls are not run
+            expired = expires is not None and datetime.now(timezone.utc) >= expires
+            if not expired and item.id not in revoked_tasks:
+                return False
+            reason = "expired" if expired else "revoked"
+            logger.info(f"Discarding {reason} call {item.id} of {task.name}.")
+            task.backend.mark_as_revoked(item.id, reason)
+            ack(logger, consumer.connection_errors)
+            return True
+
+        def flush():
+            nonlocal buffer_bytes
+            if not buffer:
+                return
+            batch = [(item, ack) for item, ack, expires in buffer if not discard_revoked(item, ack, expires)]
+            buffer.clear()
+            buffer_bytes = 0
+            if not batch:
+                return
+            items = [item for item, _ in batch]
+            acks = [ack for _, ack in batch]
+
+            def on_accepted(*args, **kwargs):
+                if not task.acks_late:
+                    [ack(logger, consumer.connection_errors) for ack in acks]
+
+            def on_return(*args, **kwargs):
+                if task.acks_late:
+                    [ack(logger, consumer.connection_errors) for ack in acks]
+
+            consumer.pool.apply_async(
+                _apply_batch, args=(task, items), accept_callback=on_accepted, callback=on_return
+            )
+
+        def put(item: BatchItem, ack, expires: datetime | None, size: int, from_eta: bool = False):
+            nonlocal buffer_bytes
+            if from_eta:
+                consumer.qos.decrement_eventually()
+                if discard_revoked(item, ack, expires):
+                    return
+            buffer.append((item, ack, expires))
+            buffer_bytes += size
+            if len(buffer) >= task.flush_every or (task.max_batch_bytes and buffer_bytes >= task.max_batch_bytes):
+                flush()
+
+        def task_message_handler(message, body, ack, reject, callbacks, **kwargs):
+            payload = message.payload
+            if isinstance(payload, dict):
+                # message protocol 1
+                payload, headers, _, _ = hybrid_to_proto2(message, payload)
+            else:
+                headers = message.headers
+            args, task_kwargs, _ = payload
+            item = BatchItem(
+                id=headers["id"], args=tuple(args), kwargs=task_kwargs, retries=headers.get("retries") or 0
+            )
+            expires = maybe_make_aware(maybe_iso8601(headers["expires"])) if headers.get("expires") else None
+            if discard_revoked(item, ack, expires):
+                return
+            size = len(message.body or b"")
+            if headers.get("eta"):
+                # e.g. retries: buffer the call when it is due
+                consumer.qos.increment_eventually()
+                consumer.timer.call_at(
+                    maybe_iso8601(headers["eta"]), put, (item, ack, expires, size, True), priority=6
+                )
+                return
+            put(item, ack, expires, size)
+
+        consumer.timer.call_repeatedly(task.flush_interval, flush)
+        return task_message_handler
+
+
+class AsyncBatchTask(BatchTask, AsyncTask):
+    """
+    Async variant of the BatchTask.
+    Write your custom task by inheriting from this class and defining its async 'execute_batch' method.
+    """
+
+    def run_batch(self, items: List[BatchItem]) -> List[Any]:
+        return self.run_coroutine(self.execute_batch(items))
+
+    async def execute_batch(self, items: List[BatchItem]) -> List[Any]:
+        """The body of the batch task executed by workers."""
+        raise NotImplementedError("Asynchronous Batch Tasks must define the execute_batch method.")
+
+
+def _apply_batch(task: BatchTask, items: List[BatchItem]):
+    # executed in the worker pool
+    return task.apply_batch(items)
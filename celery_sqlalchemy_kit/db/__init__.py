@@ -1,5 +1,12 @@
 from .model import Routine as Routine # noqa
+from .model import SchedulerLease as SchedulerLease # noqa
+from .model import SchedulerMember as SchedulerMember # noqa
 from .session import SessionWrapper as SessionWrapper # noqa
+from .session import LeaseLostError as LeaseLostError # noqa
 from .crud import CRUDRoutine as CRUDRoutine # noqa
 from .crud import crud as crud # noqa
 from .model import Base as Base # noqa
+from .model import schedule_cache_info as schedule_cache_info # noqa
+from .notify import NOTIFY_CHANNEL as NOTIFY_CHANNEL # noqa
+from .notify import install_notify_trigger as install_notify_trigger # noqa
+from .notify import notify_trigger_installed as notify_trigger_installed # noqa
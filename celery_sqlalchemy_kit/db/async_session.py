@@ -0,0 +1,46 @@
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+
+class AsyncSessionWrapper:
+    """
+    Async counterpart of the SessionWrapper for async tasks.
+    Holds one async engine with a connection pool, that is shared by all tasks of a worker process.
+    Requires the optional dependency 'sqlalchemy[asyncio]' and an async driver like asyncpg.
+    """
+
+    def __init__(
+        self,
+        async_db_uri: str,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_recycle: int = 1800,
+    ):
+        self.engine = create_async_engine(
+            async_db_uri,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+            pool_recycle=pool_recycle,
+        )
+        self.session_maker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """
+        Provide a session from the pool. It is committed if the block succeeds
+        and rolled back if an exception is raised.
+        """
+        async with self.session_maker() as session:
+            try:
+                yield session
+                await session.commit()
+            except BaseException:
+                await session.rollback()
+                raise
+
+    async def close(self):
+        await self.engine.dispose()
@@ -1,10 +1,27 @@
-from typing import List, Dict, Any, Type
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Iterator, Set, Tuple, Type
 from uuid import UUID, uuid4
 
-from sqlalchemy import select, delete
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    select, insert, delete, func, update, values, column, bindparam, case, cast, literal, union_all, and_, or_,
+    DateTime, Integer,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, defer
 
 from . import Routine
+from ..sharding import shard_key
+
+#: JSON columns of table 'routines' only needed to build schedule entries, skipped by reads with load_json=False
+JSON_COLUMNS = ("kwargs", "options")
+
+
+def _stored_as(stored: datetime | None, written: datetime | None) -> bool:
+    """Whether 'stored' was read from a DateTime column 'written' to, which may store no fractions of seconds."""
+    if stored is None or written is None:
+        return stored is written
+    written = written.replace(tzinfo=None)
+    return stored == written or (stored.microsecond == 0 and abs(stored - written) < timedelta(seconds=1))
 
 
 class CRUDRoutine:
@@ -22,26 +39,141 @@ class CRUDRoutine:
 
     @staticmethod
     def get_multiple(
-            db: Session, *, skip: int = 0, limit: int = 100, name: str = None, active: bool = None
+            db: Session,
+            *,
+            skip: int = 0,
+            limit: int | None = None,
+            name: str = None,
+            names: List[str] = None,
+            active: bool = None,
     ) -> List[Routine]:
         """
         Find Routines in Database.
                         **Parameters**
         * `db`: Database Session
         * `skip`: How many rows should be skipped.
-        * `limit`: Maximum number of returned Routines.
+        * `limit`: Maximum number of returned Routines. No limit if None.
         * `name`: Filter search by name of Routine.
+        * `names`: Filter search by multiple names of Routines.
         * `active`: Filter search by active status. True = active, False = inactive
         """
         stmt = select(Routine)
         if name:
             stmt = stmt.where(Routine.name == name)
+        if names is not None:
+            stmt = stmt.where(Routine.name.in_(names))
         if active:
             stmt = stmt.where(Routine.active == active)
         stmt = stmt.offset(skip).limit(limit).execution_options(populate_existing=True)
         result = db.execute(stmt)
         return result.scalars().all()
 
+    @staticmethod
+    def _without_json() -> list:
+        # accessing a skipped column raises instead of silently loading it row by row
+        return [defer(getattr(Routine, key), raiseload=True) for key in JSON_COLUMNS]
+
+    @staticmethod
+    def _in_shard(shard_ranges: List[Tuple[int, int | None]]):
+        """Condition for Routines with 'shard_key' in one of 'shard_ranges' or unknown (NULL)."""
+        return or_(
+            Routine.shard_key.is_(None),
+            *(
+                Routine.shard_key >= start if end is None else and_(Routine.shard_key >= start, Routine.shard_key < end)
+                for start, end in shard_ranges
+            ),
+        )
+
+    @staticmethod
+    def iter_multiple(
+            db: Session,
+            *,
+            active: bool = None,
+            batch_size: int = 1000,
+            load_json: bool = True,
+            shard_ranges: List[Tuple[int, int | None]] | None = None,
+    ) -> Iterator[Routine]:
+        """
+        Stream all Routines from Database in keyset-paginated batches ordered by id.
+        Only one batch is held in memory at a time.
+                        **Parameters**
+        * `db`: Database Session
+        * `active`: Filter search by active status. True = active, False = inactive, None = all
+        * `batch_size`: Number of Routines fetched per query.
+        * `load_json`: Whether to load columns 'kwargs' and 'options'. Accessing them raises, if False.
+        * `shard_ranges`: Only Routines with 'shard_key' in one of these ranges (see HashRing.ranges) or unknown.
+        """
+        last_id = None
+        while True:
+            stmt = select(Routine)
+            if not load_json:
+                stmt = stmt.options(*CRUDRoutine._without_json())
+            if active is not None:
+                stmt = stmt.where(Routine.active == active)
+            if shard_ranges is not None:
+                stmt = stmt.where(CRUDRoutine._in_shard(shard_ranges))
+            if last_id is not None:
+                stmt = stmt.where(Routine.id > last_id)
+            # no server side cursor (yield_per), since it can not be used with isolation level AUTOCOMMIT
+            stmt = stmt.order_by(Routine.id).limit(batch_size).execution_options(populate_existing=True)
+            result = db.execute(stmt)
+            count = 0
+            for routine in result.scalars():
+                last_id = routine.id
+                count += 1
+                yield routine
+            if count < batch_size:
+                return
+
+    @staticmethod
+    def get_names(db: Session) -> Set[str]:
+        """
+        Find the names of all Routines, active and inactive, without loading the Routines.
+        """
+        result = db.execute(select(Routine.name))
+        return set(result.scalars())
+
+    @staticmethod
+    def get_due(
+            db: Session,
+            *,
+            until: datetime,
+            load_json: bool = True,
+            shard_ranges: List[Tuple[int, int | None]] | None = None,
+    ) -> List[Routine]:
+        """
+        Find active Routines due until 'until' (UTC), using the index on 'active' and 'next_run_at'.
+        Routines with unknown 'next_run_at' (NULL) are included. Both conditions are queried with UNION ALL,
+        since databases only use the leading column 'active' of the index for 'next_run_at <= until OR IS NULL'.
+                        **Parameters**
+        * `db`: Database Session
+        * `until`: Latest 'next_run_at' of the returned Routines.
+        * `load_json`: Whether to load columns 'kwargs' and 'options'. Accessing them raises, if False.
+        * `shard_ranges`: Only Routines with 'shard_key' in one of these ranges (see HashRing.ranges) or unknown.
+        """
+        columns = [c for c in Routine.__table__.c if load_json or c.key not in JSON_COLUMNS]
+        in_shard = [CRUDRoutine._in_shard(shard_ranges)] if shard_ranges is not None else []
+        due = union_all(
+            select(*columns).where(Routine.active == True, Routine.next_run_at <= until, *in_shard),  # noqa
+            select(*columns).where(Routine.active == True, Routine.next_run_at.is_(None), *in_shard),  # noqa
+        )
+        stmt = select(Routine).from_statement(due).execution_options(populate_existing=True)
+        if not load_json:
+            stmt = stmt.options(*CRUDRoutine._without_json())
+        result = db.execute(stmt)
+        return result.scalars().all()
+
+    @staticmethod
+    def get_revision(db: Session) -> Tuple[int, datetime | None]:
+        """
+        Cheap probe to detect changes in table 'routines'.
+        Returns the number of routines and the latest 'updated_at' timestamp.
+        """
+        stmt = select(func.count(Routine.id), func.max(Routine.updated_at))
+        result = db.execute(stmt)
+        count, updated_at = result.one()
+        return count, updated_at
+
     @staticmethod
     def find_by_name(db: Session, name: str) -> Routine:
         stmt = select(Routine)
@@ -63,6 +195,37 @@ class CRUDRoutine:
         """
         db.add_all(routines_in)
 
+    @staticmethod
+    def create_multiple_if_missing(db: Session, *, routines_in: List[Routine]) -> None:
+        """
+        Create multiple Routines in Database with one bulk INSERT, skipping Routines whose name already exists.
+        PostgreSQL and SQLite get INSERT ... ON CONFLICT (name) DO NOTHING, MySQL INSERT IGNORE,
+        so that several schedulers can create the same Routines at the same time.
+        """
+        if not routines_in:
+            return
+        rows = [
+            {
+                "id": routine.id or uuid4(),
+                "name": routine.name,
+                "task": routine.task,
+                "schedule": routine.schedule,
+                "kwargs": routine.kwargs,
+                "options": routine.options,
+            }
+            for routine in routines_in
+        ]
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            stmt = postgresql.insert(Routine).on_conflict_do_nothing(index_elements=["name"])
+        elif dialect == "sqlite":
+            stmt = sqlite.insert(Routine).on_conflict_do_nothing(index_elements=["name"])
+        elif dialect in ("mysql", "mariadb"):
+            stmt = insert(Routine).prefix_with("IGNORE")
+        else:
+            stmt = insert(Routine)
+        db.execute(stmt, rows)
+
     def update(self, db: Session, *, db_obj: Routine, obj_in: Dict[str, Any]) -> Any:
         """
         Update routine in Database.
@@ -72,13 +235,204 @@ class CRUDRoutine:
         * `obj_in`: Updated Routine as dict.
         """
         obj_data = [a for a in dir(db_obj) if not a.startswith("_") and not callable(getattr(db_obj, a))]
-        update_data = obj_in
+        update_data = dict(obj_in)
+        if "schedule" in update_data and "next_run_at" not in update_data:
+            # the scheduler computes it again
+            update_data["next_run_at"] = None
+        if "name" in update_data and "shard_key" not in update_data:
+            update_data["shard_key"] = shard_key(update_data["name"])
         for field in obj_data:
             if field in update_data:
                 setattr(db_obj, field, update_data[field])
         db.add(db_obj)
         return self.get_by_id(db, entry_id=db_obj.id)
 
+    @staticmethod
+    def update_run_stats(db: Session, *, updates: List[Dict[str, Any]], only_newer: bool = False) -> None:
+        """
+        Update 'last_run_at', 'total_run_count' and 'next_run_at' of multiple routines with a single statement.
+        PostgreSQL gets one UPDATE ... FROM (VALUES ...), other databases one executemany.
+        Column 'updated_at' is kept, since these are no changes of the routine itself.
+                **Parameters**
+
+        * `updates`: List of dicts with keys 'id', 'last_run_at', 'total_run_count' and optionally 'next_run_at'.
+        * `only_newer`: Only update routines whose 'total_run_count' in DB is lower than in the update,
+          e.g. for updates that may be outdated.
+        """
+        if not updates:
+            return
+        table = Routine.__table__
+        if db.get_bind().dialect.name == "postgresql":
+            run_stats = values(
+                column("id", table.c.id.type),
+                column("last_run_at", DateTime),
+                column("total_run_count", Integer),
+                column("next_run_at", DateTime),
+                name="run_stats",
+            ).data([(u["id"], u["last_run_at"], u["total_run_count"], u.get("next_run_at")) for u in updates])
+            # plain VALUES have no column types in PostgreSQL, e.g. NULL would be of type text
+            stmt = update(table).where(table.c.id == cast(run_stats.c.id, table.c.id.type))
+            if only_newer:
+                stmt = stmt.where(
+                    func.coalesce(table.c.total_run_count, 0) < cast(run_stats.c.total_run_count, Integer)
+                )
+            stmt = (
+                stmt.values(
+                    last_run_at=cast(run_stats.c.last_run_at, DateTime),
+                    total_run_count=cast(run_stats.c.total_run_count, Integer),
+                    next_run_at=cast(run_stats.c.next_run_at, DateTime),
+                    updated_at=table.c.updated_at,
+                )
+            )
+            db.execute(stmt)
+        else:
+            stmt = update(table).where(table.c.id == bindparam("b_id"))
+            if only_newer:
+                stmt = stmt.where(func.coalesce(table.c.total_run_count, 0) < bindparam("b_total_run_count"))
+            stmt = (
+                stmt.values(
+                    last_run_at=bindparam("b_last_run_at"),
+                    total_run_count=bindparam("b_total_run_count"),
+                    next_run_at=bindparam("b_next_run_at"),
+                    updated_at=table.c.updated_at,
+                )
+            )
+            db.execute(
+                stmt,
+                [
+                    {
+                        "b_id": u["id"],
+                        "b_last_run_at": u["last_run_at"],
+                        "b_total_run_count": u["total_run_count"],
+                        "b_next_run_at": u.get("next_run_at"),
+                    }
+                    for u in updates
+                ],
+            )
+
+    @staticmethod
+    def update_next_run_at(db: Session, *, updates: List[Dict[str, Any]]) -> None:
+        """
+        Update 'next_run_at' of multiple routines with one executemany.
+        Column 'updated_at' is kept, since these are no changes of the routine itself.
+                **Parameters**
+
+        * `updates`: List of dicts with keys 'id' and 'next_run_at'.
+        """
+        if not updates:
+            return
+        table = Routine.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(next_run_at=bindparam("b_next_run_at"), updated_at=table.c.updated_at)
+        )
+        db.execute(stmt, [{"b_id": u["id"], "b_next_run_at": u["next_run_at"]} for u in updates])
+
+    @staticmethod
+    def update_shard_keys(db: Session, *, names: List[str]) -> None:
+        """
+        Write 'shard_key' of multiple routines by name with one executemany, e.g. of routines inserted without
+        SQLAlchemy. Column 'updated_at' is kept, since these are no changes of the routine itself.
+        """
+        if not names:
+            return
+        table = Routine.__table__
+        stmt = (
+            update(table)
+            .where(table.c.name == bindparam("b_name"))
+            .values(shard_key=bindparam("b_shard_key"), updated_at=table.c.updated_at)
+        )
+        db.execute(stmt, [{"b_name": name, "b_shard_key": shard_key(name)} for name in names])
+
+    @staticmethod
+    def claim_runs(db: Session, *, claims: List[Dict[str, Any]]) -> Set[UUID]:
+        """
+        Atomically claim the next run of multiple routines: 'last_run_at' and 'total_run_count' are only updated,
+        if 'total_run_count' in DB still is the expected count, i.e. no other scheduler ran the routine meanwhile.
+        PostgreSQL gets one UPDATE ... FROM (VALUES ...) RETURNING, other databases one UPDATE ... WHERE id IN (...)
+        with RETURNING where supported. Otherwise, e.g. on MySQL, the run stats are read again if not all claims
+        succeeded: a claim of another scheduler with the same 'last_run_at' (at the precision of the column)
+        cannot be told apart from the own one.
+                **Parameters**
+
+        * `claims`: List of dicts with keys 'id', 'last_run_at', 'total_run_count', 'expected_run_count'
+          and optionally 'next_run_at'.
+
+        **Returns**
+
+        The ids of the claimed routines
+        """
+        if not claims:
+            return set()
+        table = Routine.__table__
+        if db.get_bind().dialect.name == "postgresql":
+            run_claims = values(
+                column("id", table.c.id.type),
+                column("last_run_at", DateTime),
+                column("total_run_count", Integer),
+                column("expected_run_count", Integer),
+                column("next_run_at", DateTime),
+                name="run_claims",
+            ).data(
+                [
+                    (c["id"], c["last_run_at"], c["total_run_count"], c["expected_run_count"], c.get("next_run_at"))
+                    for c in claims
+                ]
+            )
+            stmt = (
+                update(table)
+                .where(
+                    table.c.id == cast(run_claims.c.id, table.c.id.type),
+                    func.coalesce(table.c.total_run_count, 0) == cast(run_claims.c.expected_run_count, Integer),
+                )
+                .values(
+                    last_run_at=cast(run_claims.c.last_run_at, DateTime),
+                    total_run_count=cast(run_claims.c.total_run_count, Integer),
+                    next_run_at=cast(run_claims.c.next_run_at, DateTime),
+                    updated_at=table.c.updated_at,
+                )
+                .returning(table.c.id)
+            )
+            return set(db.execute(stmt).scalars())
+        # one UPDATE ... WHERE id IN (...) with a CASE per column, instead of one round trip per routine
+        def by_id(key, type_):
+            return case(*[(table.c.id == c["id"], literal(c.get(key), type_)) for c in claims])
+
+        stmt = (
+            update(table)
+            .where(
+                table.c.id.in_([c["id"] for c in claims]),
+                func.coalesce(table.c.total_run_count, 0) == by_id("expected_run_count", Integer),
+            )
+            .values(
+                last_run_at=by_id("last_run_at", DateTime),
+                total_run_count=by_id("total_run_count", Integer),
+                next_run_at=by_id("next_run_at", DateTime),
+                updated_at=table.c.updated_at,
+            )
+        )
+        if db.get_bind().dialect.update_returning:
+            return set(db.execute(stmt.returning(table.c.id)).scalars())
+        # e.g. MySQL: all claims succeeded, or the run stats in DB tell which ones did
+        if db.execute(stmt).rowcount == len(claims):
+            return {c["id"] for c in claims}
+        run_stats = CRUDRoutine.get_run_stats(db=db, ids=[c["id"] for c in claims])
+        claimed = set()
+        for claim in claims:
+            last_run_at, total_run_count = run_stats.get(claim["id"], (None, None))
+            if total_run_count == claim["total_run_count"] and _stored_as(last_run_at, claim["last_run_at"]):
+                claimed.add(claim["id"])
+        return claimed
+
+    @staticmethod
+    def get_run_stats(db: Session, *, ids: List[UUID]) -> Dict[UUID, Tuple[datetime | None, int | None]]:
+        """
+        Find 'last_run_at' and 'total_run_count' of multiple routines by id.
+        """
+        stmt = select(Routine.id, Routine.last_run_at, Routine.total_run_count).where(Routine.id.in_(ids))
+        return {row.id: (row.last_run_at, row.total_run_count) for row in db.execute(stmt)}
+
     def get_by_id(self, db: Session, entry_id: UUID) -> Routine | None:
         stmt = select(self.model).where(self.model.id == entry_id).execution_options(populate_existing=True)
         result = db.execute(stmt)
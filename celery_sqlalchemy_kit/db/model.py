@@ -1,9 +1,69 @@
+import hashlib
+import json
 import uuid
+from functools import lru_cache
 
 from celery.schedules import crontab
-from sqlalchemy import Column, String, JSON, DateTime, Integer, Boolean
+from sqlalchemy import Column, String, JSON, DateTime, Integer, BigInteger, Boolean, Index, CHAR, func
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import as_declarative
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator
+
+from ..sharding import shard_key
+
+
+class GUID(TypeDecorator):
+    """
+    UUID type, that is native on PostgreSQL and stored as 32 hex characters on other databases like SQLite.
+    Values are uuid.UUID objects on all databases.
+    """
+
+    impl = CHAR(32)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(UUID(as_uuid=True))
+        return dialect.type_descriptor(CHAR(32))
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == "postgresql":
+            return value
+        if not isinstance(value, uuid.UUID):
+            value = uuid.UUID(str(value))
+        return value.hex
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(value)
+
+
+class db_now(FunctionElement):
+    """
+    Current time of the database, like func.now(). On SQLite in UTC with milliseconds,
+    since CURRENT_TIMESTAMP has a resolution of seconds and changes within a second would share 'updated_at'.
+    """
+
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(db_now)
+def _compile_db_now(element, compiler, **kwargs):
+    return compiler.process(func.now(), **kwargs)
+
+
+@compiles(db_now, "sqlite")
+def _compile_db_now_sqlite(element, compiler, **kwargs):
+    # the storage format of SQLAlchemy, '%f' are seconds with milliseconds
+    return "STRFTIME('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
+def _name_shard_key(context) -> int:
+    return shard_key(context.get_current_parameters()["name"])
 
 
 @as_declarative()
@@ -19,9 +79,13 @@ class Base:
 
 class Routine(Base):
     __tablename__ = "routines"
+    __table_args__ = (
+        # due routines: WHERE active AND next_run_at <= ... / WHERE active AND next_run_at IS NULL
+        Index("ix_routines_active_next_run_at", "active", "next_run_at"),
+    )
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    name = Column(String(50), index=True, nullable=False)
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+    name = Column(String(50), index=True, unique=True, nullable=False)
     task = Column(String(50), nullable=False)
     schedule = Column(JSON, nullable=False)
     last_run_at = Column(DateTime, index=True)
@@ -29,22 +93,92 @@ class Routine(Base):
     active = Column(Boolean, default=True, nullable=False)
     kwargs = Column(JSON)
     options = Column(JSON)
+    # next due time in UTC, maintained by the scheduler; NULL if unknown, e.g. for new or edited routines
+    next_run_at = Column(DateTime)
+    # bumped on every change made through SQLAlchemy, used by the scheduler to detect changes cheaply
+    updated_at = Column(DateTime, server_default=db_now(), onupdate=db_now(), index=True)
+    # position of 'name' on the hash ring of sharding, so that beat instances only select their share of routines;
+    # written on inserts and renames through SQLAlchemy, NULL if unknown
+    shard_key = Column(BigInteger, default=_name_shard_key, index=True)
+
+    @property
+    def content_hash(self) -> str:
+        """Hash of the columns that define the schedule entry of this routine."""
+        content = json.dumps([self.task, self.schedule, self.kwargs, self.options], sort_keys=True, default=str)
+        return hashlib.md5(content.encode()).hexdigest()
+
+    @property
+    def version_hash(self) -> str:
+        """
+        Hash of the columns read on every reload, without 'kwargs' and 'options'.
+        Changes with 'updated_at' on every change made through SQLAlchemy.
+        """
+        content = json.dumps([self.task, self.schedule, self.updated_at], sort_keys=True, default=str)
+        return hashlib.md5(content.encode()).hexdigest()
 
     @property
     def schedule_object(self):
-        if "timedelta" in self.schedule:
-            return self.schedule["timedelta"]
-        minute = self.schedule["minute"] if "minute" in self.schedule else "*"
-        hour = self.schedule["hour"] if "hour" in self.schedule else "*"
-        day_of_week = self.schedule["day_of_week"] if "day_of_week" in self.schedule else "*"
-        day_of_month = self.schedule["day_of_month"] if "day_of_month" in self.schedule else "*"
-        month_of_year = self.schedule["month_of_year"] if "month_of_year" in self.schedule else "*"
-        if all(x == "*" for x in [minute, hour, day_of_week, day_of_month, month_of_year]):
-            raise TypeError("No schedule set.")
-        return crontab(
-            minute=minute,
-            hour=hour,
-            day_of_week=day_of_week,
-            day_of_month=day_of_month,
-            month_of_year=month_of_year,
-        )
+        return self.schedule_for()
+
+    def schedule_for(self, app=None):
+        """Interval in seconds or crontab of the routine, compiled for the celery app 'app' (see compile_schedule)."""
+        return compile_schedule(json.dumps(self.schedule, sort_keys=True), app)
+
+
+class SchedulerLease(Base):
+    """Lease held by the leading beat instance, if leader election is enabled."""
+
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(50), primary_key=True)
+    holder = Column(String(255))
+    # incremented whenever the lease changes hands, writes of a former holder are rejected by it
+    fencing_token = Column(Integer, nullable=False, default=0)
+    expires_at = Column(DateTime)
+
+
+class SchedulerMember(Base):
+    """Beat instance sharing the routines with the other members of its group, if sharding is enabled."""
+
+    __tablename__ = "scheduler_members"
+
+    member = Column(String(255), primary_key=True)
+    name = Column(String(50), index=True, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+#: Maximum number of compiled schedules kept in memory
+SCHEDULE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def compile_schedule(schedule_json: str, app=None):
+    """
+    Compile the JSON schedule of a routine to an interval in seconds or a crontab of the celery app 'app'.
+    Results are cached by the canonicalized JSON (sorted keys) and the app, so routines sharing a schedule
+    share one crontab. Compiled crontabs must not be changed. ScheduleEntry sets 'app' of its schedule,
+    which leaves a crontab unchanged, if it was compiled for the app of the entry.
+    """
+    schedule = json.loads(schedule_json)
+    if "timedelta" in schedule:
+        return schedule["timedelta"]
+    minute = schedule["minute"] if "minute" in schedule else "*"
+    hour = schedule["hour"] if "hour" in schedule else "*"
+    day_of_week = schedule["day_of_week"] if "day_of_week" in schedule else "*"
+    day_of_month = schedule["day_of_month"] if "day_of_month" in schedule else "*"
+    month_of_year = schedule["month_of_year"] if "month_of_year" in schedule else "*"
+    if all(x == "*" for x in [minute, hour, day_of_week, day_of_month, month_of_year]):
+        raise TypeError("No schedule set.")
+    return crontab(
+        minute=minute,
+        hour=hour,
+        day_of_week=day_of_week,
+        day_of_month=day_of_month,
+        month_of_year=month_of_year,
+        app=app,
+    )
+
+
+def schedule_cache_info():
+    """Hits, misses and size of the cache of compiled schedules."""
+    return compile_schedule.cache_info()
@@ -0,0 +1,50 @@
+from sqlalchemy import DDL, text
+from sqlalchemy.engine import Connection
+
+#: Channel that is notified with the name of a changed routine
+NOTIFY_CHANNEL = "routines_changed"
+
+# Only changes of columns that define a schedule entry are notified.
+# Updates of 'last_run_at' and 'total_run_count' by the scheduler itself are not.
+notify_function = DDL(
+    f"""
+CREATE OR REPLACE FUNCTION routines_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', OLD.name);
+    ELSE
+        PERFORM pg_notify('{NOTIFY_CHANNEL}', NEW.name);
+        IF TG_OP = 'UPDATE' AND OLD.name IS DISTINCT FROM NEW.name THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', OLD.name);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+)
+drop_notify_trigger = DDL("DROP TRIGGER IF EXISTS routines_notify ON routines")
+create_notify_trigger = DDL(
+    "CREATE TRIGGER routines_notify "
+    "AFTER INSERT OR DELETE OR UPDATE OF name, task, schedule, active, kwargs, options ON routines "
+    "FOR EACH ROW EXECUTE PROCEDURE routines_notify()"
+)
+
+
+def install_notify_trigger(connection: Connection) -> None:
+    """
+    Install the trigger, that notifies channel NOTIFY_CHANNEL about changed routines, on an existing table.
+    Only available for PostgreSQL.
+    """
+    if connection.dialect.name != "postgresql":
+        raise RuntimeError("Notifications about changed routines are only available for PostgreSQL.")
+    for ddl in (notify_function, drop_notify_trigger, create_notify_trigger):
+        connection.execute(ddl)
+
+
+def notify_trigger_installed(connection: Connection) -> bool:
+    """Whether the trigger, that notifies channel NOTIFY_CHANNEL about changed routines, is installed."""
+    if connection.dialect.name != "postgresql":
+        return False
+    stmt = text("SELECT 1 FROM pg_trigger WHERE tgname = 'routines_notify' AND tgrelid = to_regclass('routines')")
+    return connection.execute(stmt).first() is not None
@@ -1,46 +1,181 @@
+import threading
 import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Tuple
 
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.exc import SQLAlchemyError, OperationalError, DBAPIError, InterfaceError
+from sqlalchemy import create_engine, event, MetaData, text, select, update, insert, delete
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, DBAPIError, InterfaceError, IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, StaticPool
 from celery.utils.log import get_logger
 
+from .model import SchedulerLease, SchedulerMember
+from ..metrics import Metrics
+
 logger = get_logger(__name__)
 
 
+class LeaseLostError(Exception):
+    """The lease is not held anymore by the holder that tried to write with it."""
+
+
+#: engines created by SessionWrappers and the number of wrappers using them, by URI and pool settings
+_engines: Dict[Tuple, Tuple[Engine, int]] = {}
+_engines_lock = threading.Lock()
+
+#: pragmas set on every new connection to an SQLite DB: readers and the writer do not block each other in WAL mode,
+#: and commits only sync the write-ahead log at checkpoints, which is safe in WAL mode apart from power loss
+SQLITE_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL", "temp_store": "MEMORY"}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+    finally:
+        cursor.close()
+
+
+def _acquire_engine(key: Tuple, scheduler_db_uri: str, **kwargs) -> Engine:
+    """Return the engine for 'key' and create it on first use. Wrappers with the same key share its pool."""
+    with _engines_lock:
+        if key in _engines:
+            engine, users = _engines[key]
+        else:
+            engine, users = create_engine(scheduler_db_uri, future=True, **kwargs), 0
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", _set_sqlite_pragmas)
+        _engines[key] = (engine, users + 1)
+        return engine
+
+
+def _dispose_engine_if_unshared(key: Tuple):
+    """Dispose the pool of the engine for 'key', if only one wrapper uses it."""
+    with _engines_lock:
+        engine, users = _engines.get(key, (None, 0))
+        if users == 1:
+            engine.dispose()
+
+
+def _release_engine(key: Tuple):
+    """Dispose the engine for 'key', when its last wrapper is closed."""
+    with _engines_lock:
+        engine, users = _engines[key]
+        if users > 1:
+            _engines[key] = (engine, users - 1)
+            return
+        del _engines[key]
+    engine.dispose()
+
+
 class SessionWrapper:
     """
     Session Wrapper for the celery scheduler.
     Allows operations in db on autocommit.
+    If the connection breaks, it is established again by a background thread (see renew),
+    the session must not be used while 'degraded' is True.
+    Wrappers with the same URI and pool settings share one engine and its pool.
+    SQLite DBs are opened in WAL mode with the pragmas in SQLITE_PRAGMAS, so that a single beat can schedule
+    from a local file. In-memory SQLite DBs use one connection for all sessions.
+
+                    **Parameters**
+    * `scheduler_db_uri`: URI of the DB, not needed if 'engine' is given.
+    * `engine`: Existing engine to use, e.g. to share the pool of the application. It is not disposed on close.
+    * `pool_size`: Number of connections kept in the pool.
+    * `max_overflow`: Number of connections opened in addition to 'pool_size' at peak times.
+    * `pool_recycle`: Seconds after which connections are replaced.
+    * `pool_pre_ping`: Whether connections are tested before they are used.
+    * `pool_timeout`: Seconds to wait for a connection of the pool.
+    * `connect_timeout`: Seconds to wait for a new connection, passed to the driver. Not passed if None
+      and not used for SQLite.
+    * `busy_timeout`: Seconds to wait for the lock of an SQLite DB, that is written by another connection,
+      before 'database is locked' is raised. Only used for SQLite.
+    * `null_pool`: Whether connections are opened and closed on every use instead of pooled,
+      e.g. behind an external pooler like pgbouncer. 'pool_size', 'max_overflow' and 'pool_timeout' are ignored.
+    * `metrics`: Exporter of the pool checkout times and reconnects (see celery_sqlalchemy_kit.metrics).
     """
 
     session: Session
     db_tries: int = 0
+    listen_connection: Connection | None = None
+    listen_channel: str | None = None
+    #: monotonic time since when the DB is unavailable, None if connected
+    degraded_since: float | None = None
+    _reconnect_thread: threading.Thread | None = None
 
-    def __init__(self, scheduler_db_uri: str):
-        self.engine = create_engine(
-            scheduler_db_uri,
-            pool_size=2,
-            max_overflow=10,
-            pool_pre_ping=True,
-            pool_recycle=1800,
-            future=True,
-            isolation_level="AUTOCOMMIT",
-            connect_args={"connect_timeout": 5},
-        )
+    def __init__(
+            self,
+            scheduler_db_uri: str | None = None,
+            *,
+            engine: Engine | None = None,
+            pool_size: int = 2,
+            max_overflow: int = 10,
+            pool_recycle: int = 1800,
+            pool_pre_ping: bool = True,
+            pool_timeout: float = 30,
+            connect_timeout: int | None = 5,
+            busy_timeout: float = 5,
+            null_pool: bool = False,
+            metrics: Metrics | None = None,
+    ):
+        self._engine_key = None
+        if engine is None:
+            if not scheduler_db_uri:
+                raise ValueError("Either scheduler_db_uri or engine is needed.")
+            kwargs = {"pool_pre_ping": pool_pre_ping, "pool_recycle": pool_recycle}
+            url = make_url(scheduler_db_uri)
+            sqlite_memory = url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+            if sqlite_memory:
+                # every connection would open its own empty DB
+                kwargs["poolclass"] = StaticPool
+            elif null_pool:
+                kwargs["poolclass"] = NullPool
+            else:
+                kwargs.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+            if url.get_backend_name() == "sqlite":
+                # connections are established again by a background thread and then used by beat
+                kwargs["connect_args"] = {"timeout": busy_timeout, "check_same_thread": False}
+            elif connect_timeout is not None:
+                kwargs["connect_args"] = {"connect_timeout": connect_timeout}
+            self._engine_key = (scheduler_db_uri, repr(sorted(kwargs.items())))
+            engine = _acquire_engine(self._engine_key, scheduler_db_uri, **kwargs)
+        # shares the pool of 'engine', only connections of this wrapper run on autocommit
+        self.engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
         self._establish_session_with_retry()
 
+    @property
+    def degraded(self) -> bool:
+        """Whether the DB is unavailable and the connection is being established again in the background."""
+        return self.degraded_since is not None
+
+    def connect(self) -> Connection:
+        """Check out a connection of the pool. The time waited for it is exported, if metrics are enabled."""
+        if self.metrics is None:
+            return self.engine.connect()
+        start = time.perf_counter()
+        connection = self.engine.connect()
+        self.metrics.observe("pool_checkout_seconds", time.perf_counter() - start)
+        return connection
+
     def _establish_session_with_retry(self):
-        """Create a fresh connection and session, retrying until the DB becomes available."""
+        """Create a fresh connection and session on startup, retrying until the DB becomes available."""
         delay = 1
         while True:
             try:
-                self.connection = self.engine.connect()
+                self.connection = self.connect()
                 self.session = Session(bind=self.connection, expire_on_commit=False)
                 self.db_tries = 0
                 return
             except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
                 self.db_tries += 1
+                if self.metrics is not None:
+                    self.metrics.increment("db_reconnect_failures")
                 logger.warning(
                     "DB connect failed (try %s); retrying in %ss",
                     self.db_tries, delay, exc_info=True
@@ -49,35 +184,233 @@ class SessionWrapper:
                 delay = min(delay * 2, 30)
 
     def renew(self):
-        """Dispose broken connections and recreate session with exponential backoff."""
+        """
+        Dispose broken connections and recreate the session in a background thread with exponential backoff.
+        Does not block: the circuit is open, i.e. 'degraded' is True, until the DB is available again.
+        """
+        with self._lock:
+            if self.degraded_since is not None:
+                # the background thread is reconnecting already
+                return
+            self.degraded_since = time.monotonic()
+        logger.warning("DB unavailable, reconnecting in the background.")
+        if self.metrics is not None:
+            self.metrics.increment("db_renews")
+            self.metrics.set("db_degraded", 1)
         # Best-effort cleanup of current handles
         try:
             try:
                 self.session.close()
             except Exception:
                 pass
-            try:
-                self.connection.close()
-            except Exception:
-                pass
-            # Force pool to drop any stale/broken sockets
-            self.engine.dispose()
+            for connection in (self.connection, self.listen_connection):
+                # broken connections of this wrapper are discarded instead of returned to the pool
+                try:
+                    if connection is not None:
+                        connection.invalidate()
+                        connection.close()
+                except Exception:
+                    pass
+            # Drop other stale sockets of the pool, unless it is shared with other wrappers or the application,
+            # whose pooled connections are tested before use
+            if self._engine_key is not None:
+                _dispose_engine_if_unshared(self._engine_key)
         except Exception:
             pass
-        # Reconnect until DB is back
-        self._establish_session_with_retry()
+        self._reconnect_thread = threading.Thread(target=self._reconnect, name="scheduler-db-reconnect", daemon=True)
+        self._reconnect_thread.start()
+
+    def _reconnect(self):
+        """Reconnect until the DB is back or the wrapper is closed, then close the circuit."""
+        delay = 1
+        while not self._closed.is_set():
+            try:
+                connection = self.connect()
+            except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
+                self.db_tries += 1
+                if self.metrics is not None:
+                    self.metrics.increment("db_reconnect_failures")
+                logger.warning("DB reconnect failed (try %s); retrying in %ss", self.db_tries, delay)
+                self._closed.wait(delay)
+                delay = min(delay * 2, 30)
+                continue
+            with self._lock:
+                self.connection = connection
+                # the session was closed by renew, it is kept so that references to it stay valid
+                self.session.bind = connection
+                if self.listen_channel:
+                    # the connection is established again on next poll
+                    self.listen_connection = None
+                logger.info(
+                    "DB available again after %.1fs (%s failed tries).",
+                    time.monotonic() - self.degraded_since, self.db_tries,
+                )
+                self.db_tries = 0
+                self.degraded_since = None
+            if self.metrics is not None:
+                self.metrics.set("db_degraded", 0)
+            return
+
+    def listen(self, channel: str):
+        """
+        LISTEN on a PostgreSQL notification channel with a dedicated connection.
+        Only supported with psycopg2.
+        """
+        self.listen_channel = channel
+        self.listen_connection = self.connect()
+        dbapi_connection = self.listen_connection.connection.dbapi_connection
+        if not hasattr(dbapi_connection, "poll") or not hasattr(dbapi_connection, "notifies"):
+            self.listen_connection.close()
+            self.listen_connection = None
+            self.listen_channel = None
+            raise RuntimeError("LISTEN/NOTIFY is only supported with PostgreSQL and psycopg2.")
+        self.listen_connection.execute(text(f'LISTEN "{channel}"'))
+
+    def poll_notifications(self) -> List[str] | None:
+        """
+        Return the payloads of all notifications received since the last call, without blocking.
+        Returns None, if the listening connection had to be established again and notifications may be lost.
+        """
+        if self.listen_connection is None:
+            self.listen(self.listen_channel)
+            return None
+        dbapi_connection = self.listen_connection.connection.dbapi_connection
+        try:
+            dbapi_connection.poll()
+        except Exception as e:
+            # raise the driver error as SQLAlchemy error, like all other db errors
+            raise OperationalError("LISTEN", {}, e) from e
+        payloads = [notify.payload for notify in dbapi_connection.notifies]
+        dbapi_connection.notifies.clear()
+        return payloads
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> int | None:
+        """
+        Acquire or renew the lease 'name' for 'holder' for 'ttl' seconds.
+        A lease held by another holder can only be taken over after it expired or was released.
+        Expiry times are UTC timestamps of the clients, so their clocks must be synchronized.
+
+                **Parameters**
+
+        * `name`: Name of the lease
+        * `holder`: Unique id of the instance trying to acquire the lease
+        * `ttl`: Seconds until the lease expires, if it is not renewed
+
+        **Returns**
+
+        The fencing token of the lease if 'holder' holds it now, otherwise None.
+        The token is incremented whenever the lease changes hands.
+        """
+        table = SchedulerLease.__table__
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expires_at = now + timedelta(seconds=ttl)
+        lease = self.session.execute(
+            select(table.c.holder, table.c.fencing_token, table.c.expires_at).where(table.c.name == name)
+        ).first()
+        if lease is None:
+            try:
+                self.session.execute(
+                    insert(table).values(name=name, holder=holder, fencing_token=1, expires_at=expires_at)
+                )
+            except IntegrityError:
+                # inserted concurrently by another holder
+                self.session.rollback()
+                return None
+            return 1
+        if lease.holder == holder:
+            token = lease.fencing_token
+        elif lease.holder is None or lease.expires_at is None or lease.expires_at < now:
+            token = lease.fencing_token + 1
+        else:
+            return None
+        # compare and set: fails, if the lease changed hands in the meantime
+        result = self.session.execute(
+            update(table)
+            .where(table.c.name == name, table.c.fencing_token == lease.fencing_token)
+            .values(holder=holder, fencing_token=token, expires_at=expires_at)
+        )
+        return token if result.rowcount == 1 else None
+
+    def release_lease(self, name: str, holder: str):
+        """Release the lease 'name', if it is held by 'holder', so that another holder can take it over at once."""
+        table = SchedulerLease.__table__
+        self.session.execute(
+            update(table).where(table.c.name == name, table.c.holder == holder).values(holder=None, expires_at=None)
+        )
+
+    def join_group(self, name: str, member: str, ttl: float) -> List[str]:
+        """
+        Register or renew 'member' in group 'name' for 'ttl' seconds and remove expired members.
+
+                **Parameters**
+
+        * `name`: Name of the group
+        * `member`: Unique id of the instance
+        * `ttl`: Seconds until the membership expires, if it is not renewed
+
+        **Returns**
+
+        The sorted ids of all members of the group
+        """
+        table = SchedulerMember.__table__
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        expires_at = now + timedelta(seconds=ttl)
+        self.session.execute(delete(table).where(table.c.name == name, table.c.expires_at < now))
+        result = self.session.execute(
+            update(table).where(table.c.member == member).values(name=name, expires_at=expires_at)
+        )
+        if result.rowcount == 0:
+            self.session.execute(insert(table).values(member=member, name=name, expires_at=expires_at))
+        members = self.session.execute(select(table.c.member).where(table.c.name == name).order_by(table.c.member))
+        return list(members.scalars())
+
+    def leave_group(self, name: str, member: str):
+        """Remove 'member' from group 'name', so that the other members take over its share at once."""
+        table = SchedulerMember.__table__
+        self.session.execute(delete(table).where(table.c.name == name, table.c.member == member))
+
+    @contextmanager
+    def fenced_session(self, name: str, holder: str, token: int) -> Iterator[Session]:
+        """
+        Provide a session in a transaction, that is only committed if 'holder' still holds the lease 'name'
+        with fencing token 'token'. The lease row is locked until the end of the transaction,
+        so the lease cannot change hands while writing. Raises LeaseLostError, if the lease is not held anymore.
+        """
+        table = SchedulerLease.__table__
+        with self.connect() as connection:
+            # the engine runs on autocommit, this connection needs a real transaction
+            connection = connection.execution_options(isolation_level=self.engine.dialect.default_isolation_level)
+            with connection.begin():
+                session = Session(bind=connection, expire_on_commit=False)
+                try:
+                    stmt = (
+                        select(table.c.name)
+                        .where(table.c.name == name, table.c.holder == holder, table.c.fencing_token == token)
+                        .with_for_update()
+                    )
+                    if session.execute(stmt).first() is None:
+                        raise LeaseLostError(f"Lease {name} with fencing token {token} is not held by {holder}.")
+                    yield session
+                    session.flush()
+                finally:
+                    session.close()
 
     def close(self):
+        self._closed.set()
         try:
+            if self.listen_connection is not None:
+                self.listen_connection.close()
             self.session.close()
         finally:
             try:
                 self.connection.close()
             finally:
-                try:
-                    self.engine.dispose()
-                except Exception:
-                    pass
+                if self._engine_key is not None:
+                    key, self._engine_key = self._engine_key, None
+                    try:
+                        _release_engine(key)
+                    except Exception:
+                        pass
 
 
 metadata = MetaData()
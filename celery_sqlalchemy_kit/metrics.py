@@ -0,0 +1,195 @@
+"""
+Metrics of the hot paths of RoutineScheduler and SessionWrapper and of the runs of tasks, exported by a pluggable
+exporter.
+
+Metrics are disabled by default and cost nothing then: beat and the tasks only measure if they have an exporter.
+Enable them with 'scheduler_metrics' / 'worker_metrics' = "prometheus" / "opentelemetry" or pass an instance
+of a subclass of 'Metrics' to export them to another monitoring system.
+"""
+import threading
+from typing import Dict, Tuple
+
+from celery.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+#: name: (kind, description, labels) of all metrics. Kinds are 'histogram', 'counter' and 'gauge'.
+METRICS: Dict[str, Tuple[str, str, Tuple[str, ...]]] = {
+    "tick_duration_seconds": ("histogram", "Duration of a tick of beat, including reloads of the schedule", ()),
+    "schedule_load_duration_seconds": ("histogram", "Duration of reloads of the schedule from db", ()),
+    "schedule_load_rows": ("gauge", "Number of routines read from db by the last reload of the schedule", ()),
+    "sync_duration_seconds": ("histogram", "Duration of writing run stats to db", ()),
+    "sync_batch_size": ("histogram", "Number of routines whose run stats are written with one statement", ()),
+    "sync_backlog": ("gauge", "Number of routines whose run stats are not written to db yet", ()),
+    "db_degraded": ("gauge", "1 while the db is unavailable and the connection is established again, otherwise 0", ()),
+    "db_renews": ("counter", "Number of times the connection to db broke and was renewed", ()),
+    "db_reconnect_failures": ("counter", "Number of failed tries to connect to db", ()),
+    "pool_checkout_seconds": ("histogram", "Time to check out a connection of the pool, including connecting", ()),
+    "dispatch_lateness_seconds": (
+        "histogram", "Time between the due time of a routine and sending its task", ("task", "routine")
+    ),
+    "publish_batch_duration_seconds": ("histogram", "Time to send the tasks of all entries due in a tick", ()),
+    "publish_batch_size": ("histogram", "Number of tasks sent in one tick", ()),
+    # runs of SyncTasks and AsyncTasks
+    "task_duration_seconds": ("histogram", "Wall time of a run of a task", ("task",)),
+    "task_cpu_seconds": ("histogram", "CPU time of a run of a task, including its steps on the event loop", ("task",)),
+    "task_loop_busy_seconds": ("histogram", "Time the event loop spent running the steps of an async task", ("task",)),
+    "task_result_bytes": ("histogram", "Size of the serialized result of a task", ("task",)),
+    "task_retries": ("counter", "Number of runs of a task ending with a retry", ("task",)),
+    "task_failures": ("counter", "Number of runs of a task ending with an exception other than a retry", ("task",)),
+}
+
+#: buckets of the histograms in seconds, sizes and bytes have their own
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+BYTES_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+_HISTOGRAM_BUCKETS = {
+    "sync_batch_size": SIZE_BUCKETS, "publish_batch_size": SIZE_BUCKETS, "task_result_bytes": BYTES_BUCKETS
+}
+
+#: exporters created from config, by name, namespace and port, since metrics can only be registered once
+_exporters: Dict[Tuple, "Metrics"] = {}
+_exporters_lock = threading.Lock()
+
+
+class Metrics:
+    """
+    Exporter of the metrics in METRICS. This base class discards all values,
+    subclass it and override 'observe', 'increment' and 'set' to export them to another monitoring system.
+    All methods are called on the hot paths of beat and the workers and must not block.
+    """
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Record 'value' in histogram 'name'."""
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        """Increment counter 'name' by 'value'."""
+
+    def set(self, name: str, value: float, **labels: str):
+        """Set gauge 'name' to 'value'."""
+
+
+class PrometheusMetrics(Metrics):
+    """
+    Exports the metrics with prometheus_client, prefixed with 'namespace'.
+    Needs the optional dependency prometheus-client: pip install celery-sqlalchemy-kit[prometheus]
+
+                **Parameters**
+    * `registry`: Registry of the metrics, the default registry of prometheus_client if None.
+    * `namespace`: Prefix of the names of the metrics.
+    * `port`: If set, the metrics are served on this port by a thread of prometheus_client.
+    * `per_routine`: Whether the lateness is labeled with the name of the routine besides the task.
+      Every routine gets a histogram of its own then, only use it for a moderate number of routines.
+    """
+
+    def __init__(self, registry=None, namespace: str = "celery_beat", port: int | None = None, per_routine=False):
+        import prometheus_client
+
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+        self.per_routine = per_routine
+        self._metrics = {}
+        for name, (kind, description, labels) in METRICS.items():
+            if not per_routine:
+                labels = tuple(label for label in labels if label != "routine")
+            kwargs = {"namespace": namespace, "registry": registry, "labelnames": labels}
+            if kind == "histogram":
+                buckets = _HISTOGRAM_BUCKETS.get(name, BUCKETS)
+                metric = prometheus_client.Histogram(name, description, buckets=buckets, **kwargs)
+            elif kind == "counter":
+                metric = prometheus_client.Counter(name, description, **kwargs)
+            else:
+                metric = prometheus_client.Gauge(name, description, **kwargs)
+            self._metrics[name] = metric
+        if port is not None:
+            prometheus_client.start_http_server(port, registry=registry)
+            logger.info(f"Serving metrics on port {port}.")
+
+    def _metric(self, name: str, labels: dict):
+        metric = self._metrics[name]
+        if not labels:
+            return metric
+        if not self.per_routine:
+            labels.pop("routine", None)
+        return metric.labels(**labels)
+
+    def observe(self, name: str, value: float, **labels: str):
+        self._metric(name, labels).observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        self._metric(name, labels).inc(value)
+
+    def set(self, name: str, value: float, **labels: str):
+        self._metric(name, labels).set(value)
+
+
+class OpenTelemetryMetrics(Metrics):
+    """
+    Exports the metrics with the OpenTelemetry metrics API, prefixed with 'namespace'.
+    The meter provider, e.g. with an OTLP exporter, is configured by your application.
+    Needs the optional dependency opentelemetry-api: pip install celery-sqlalchemy-kit[opentelemetry]
+
+                **Parameters**
+    * `meter`: Meter creating the instruments, the meter 'celery_sqlalchemy_kit' of the global provider if None.
+    * `namespace`: Prefix of the names of the metrics.
+    * `per_routine`: Whether the lateness has the name of the routine as attribute besides the task.
+    """
+
+    def __init__(self, meter=None, namespace: str = "celery_beat", per_routine=False):
+        from opentelemetry import metrics
+
+        if meter is None:
+            meter = metrics.get_meter("celery_sqlalchemy_kit")
+        self.per_routine = per_routine
+        self._instruments = {}
+        for name, (kind, description, _) in METRICS.items():
+            unit = "s" if name.endswith("_seconds") else "By" if name.endswith("_bytes") else "1"
+            full_name = f"{namespace}.{name}" if namespace else name
+            if kind == "histogram":
+                instrument = meter.create_histogram(full_name, unit=unit, description=description)
+            elif kind == "counter":
+                instrument = meter.create_counter(full_name, unit=unit, description=description)
+            else:
+                instrument = meter.create_gauge(full_name, unit=unit, description=description)
+            self._instruments[name] = instrument
+
+    def _attributes(self, labels: dict) -> dict | None:
+        if not labels:
+            return None
+        if not self.per_routine:
+            labels.pop("routine", None)
+        return labels
+
+    def observe(self, name: str, value: float, **labels: str):
+        self._instruments[name].record(value, attributes=self._attributes(labels))
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        self._instruments[name].add(value, attributes=self._attributes(labels))
+
+    def set(self, name: str, value: float, **labels: str):
+        self._instruments[name].set(value, attributes=self._attributes(labels))
+
+
+def metrics_from_config(metrics, port: int | None = None, namespace: str = "celery_beat") -> Metrics | None:
+    """
+    Exporter for config 'scheduler_metrics' / 'worker_metrics': None if disabled, the instance itself
+    if it is a Metrics instance, or the exporter named "prometheus" or "opentelemetry".
+    Exporters created by name are shared by all callers with the same name, namespace and port.
+    """
+    if metrics is None or isinstance(metrics, Metrics):
+        return metrics
+    name = str(metrics).lower()
+    if name in ("", "0", "false", "no", "none"):
+        return None
+    if name not in ("prometheus", "opentelemetry", "otel"):
+        raise ValueError(
+            f"Unknown metrics exporter {metrics}, use 'prometheus', 'opentelemetry' or a Metrics instance."
+        )
+    key = (name, namespace, port)
+    with _exporters_lock:
+        if key not in _exporters:
+            if name == "prometheus":
+                _exporters[key] = PrometheusMetrics(namespace=namespace, port=port)
+            else:
+                _exporters[key] = OpenTelemetryMetrics(namespace=namespace)
+        return _exporters[key]
@@ -0,0 +1,26 @@
+"""
+Alembic migrations of the tables of this package, for users who set 'create_table' to False.
+They keep their own version table, so they do not interfere with the migrations of your project.
+
+Upgrade with 'python -m celery_sqlalchemy_kit.migrations' (uses SCHEDULER_DB_URI) or by calling 'upgrade()'.
+Needs alembic: pip install celery-sqlalchemy-kit[migrations]
+"""
+import os
+
+#: Name of the alembic version table of this package
+VERSION_TABLE = "celery_sqlalchemy_kit_version"
+
+
+def upgrade(scheduler_db_uri: str, revision: str = "head"):
+    """
+    Upgrade the tables of this package in the given DB to 'revision'.
+    Tables created by 'create_table' of an earlier version are upgraded as well.
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", os.path.dirname(__file__))
+    # passed as attribute, since the config would interpolate '%' in the URI
+    config.attributes["scheduler_db_uri"] = scheduler_db_uri
+    command.upgrade(config, revision)
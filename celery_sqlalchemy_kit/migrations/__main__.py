@@ -0,0 +1,10 @@
+import os
+import sys
+
+from . import upgrade
+
+if __name__ == "__main__":
+    db_uri = os.getenv("SCHEDULER_DB_URI")
+    if not db_uri:
+        raise RuntimeError("No scheduler DB URI provided (SCHEDULER_DB_URI).")
+    upgrade(db_uri, revision=sys.argv[1] if len(sys.argv) > 1 else "head")
@@ -0,0 +1,19 @@
+import os
+
+from alembic import context
+from sqlalchemy import create_engine, pool
+
+from celery_sqlalchemy_kit.db import Base
+from celery_sqlalchemy_kit.migrations import VERSION_TABLE
+
+db_uri = context.config.attributes.get("scheduler_db_uri") or os.getenv("SCHEDULER_DB_URI")
+
+if context.is_offline_mode():
+    # the revisions inspect the existing tables
+    raise RuntimeError("The migrations of celery-sqlalchemy-kit can only run online.")
+
+engine = create_engine(db_uri, poolclass=pool.NullPool)
+with engine.connect() as connection:
+    context.configure(connection=connection, target_metadata=Base.metadata, version_table=VERSION_TABLE)
+    with context.begin_transaction():
+        context.run_migrations()
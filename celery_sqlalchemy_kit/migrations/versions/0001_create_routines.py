@@ -0,0 +1,40 @@
+"""Create table routines as of version 0.2.0
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # the table may have been created by 'create_table' before
+    if sa.inspect(op.get_bind()).has_table("routines"):
+        return
+    op.create_table(
+        "routines",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("name", sa.String(50), nullable=False),
+        sa.Column("task", sa.String(50), nullable=False),
+        sa.Column("schedule", sa.JSON(), nullable=False),
+        sa.Column("last_run_at", sa.DateTime()),
+        sa.Column("total_run_count", sa.Integer()),
+        sa.Column("active", sa.Boolean(), nullable=False),
+        sa.Column("kwargs", sa.JSON()),
+        sa.Column("options", sa.JSON()),
+    )
+    op.create_index("ix_routines_name", "routines", ["name"])
+    op.create_index("ix_routines_last_run_at", "routines", ["last_run_at"])
+
+
+def downgrade() -> None:
+    op.drop_table("routines")
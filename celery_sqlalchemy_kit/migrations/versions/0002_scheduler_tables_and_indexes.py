@@ -0,0 +1,75 @@
+"""Add change tracking, next_run_at, unique names, indexes for scheduler queries and tables for several beats
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # parts may have been created by 'create_table' already
+    columns = {column["name"] for column in inspector.get_columns("routines")}
+    indexes = {index["name"]: index for index in inspector.get_indexes("routines")}
+
+    duplicates = bind.execute(
+        sa.text("SELECT name FROM routines GROUP BY name HAVING count(*) > 1")
+    ).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Names of routines must be unique, delete the duplicates first: {duplicates}")
+
+    # SQLite recreates the table: keep the type of 'id', that SQLite reflects as NUMERIC
+    reflect_args = [sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True)]
+    with op.batch_alter_table("routines", reflect_args=reflect_args) as batch_op:
+        if "updated_at" not in columns:
+            batch_op.add_column(sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()))
+            batch_op.create_index("ix_routines_updated_at", ["updated_at"])
+        if "next_run_at" not in columns:
+            batch_op.add_column(sa.Column("next_run_at", sa.DateTime()))
+        if not indexes.get("ix_routines_name", {}).get("unique"):
+            if "ix_routines_name" in indexes:
+                batch_op.drop_index("ix_routines_name")
+            batch_op.create_index("ix_routines_name", ["name"], unique=True)
+        if "ix_routines_active_next_run_at" not in indexes:
+            batch_op.create_index("ix_routines_active_next_run_at", ["active", "next_run_at"])
+
+    if not inspector.has_table("scheduler_leases"):
+        op.create_table(
+            "scheduler_leases",
+            sa.Column("name", sa.String(50), primary_key=True),
+            sa.Column("holder", sa.String(255)),
+            sa.Column("fencing_token", sa.Integer(), nullable=False),
+            sa.Column("expires_at", sa.DateTime()),
+        )
+    if not inspector.has_table("scheduler_members"):
+        op.create_table(
+            "scheduler_members",
+            sa.Column("member", sa.String(255), primary_key=True),
+            sa.Column("name", sa.String(50), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+        )
+        op.create_index("ix_scheduler_members_name", "scheduler_members", ["name"])
+
+
+def downgrade() -> None:
+    op.drop_table("scheduler_members")
+    op.drop_table("scheduler_leases")
+    reflect_args = [sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True)]
+    with op.batch_alter_table("routines", reflect_args=reflect_args) as batch_op:
+        batch_op.drop_index("ix_routines_active_next_run_at")
+        batch_op.drop_index("ix_routines_name")
+        batch_op.create_index("ix_routines_name", ["name"])
+        batch_op.drop_index("ix_routines_updated_at")
+        batch_op.drop_column("next_run_at")
+        batch_op.drop_column("updated_at")
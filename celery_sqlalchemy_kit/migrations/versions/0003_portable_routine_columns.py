@@ -0,0 +1,53 @@
+"""Store 'id' of table 'routines' as hex string and 'updated_at' with milliseconds on SQLite
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+"""
+import uuid
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from celery_sqlalchemy_kit.db.model import GUID, db_now
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # PostgreSQL keeps its native UUID type and now(), other databases stored 'id' as CHAR(32) already
+    if bind.dialect.name != "sqlite":
+        return
+    id_type = next(column["type"] for column in sa.inspect(bind).get_columns("routines") if column["name"] == "id")
+    if isinstance(id_type, sa.CHAR):
+        # created by 'create_table' of this version
+        return
+
+    # SQLite gave column type UUID numeric affinity, so ids that look like numbers were converted and cannot be
+    # restored. These routines get new ids, their run stats are kept.
+    names = bind.execute(sa.text("SELECT name FROM routines WHERE typeof(id) != 'text'")).scalars().all()
+
+    reflect_args = [sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True)]
+    with op.batch_alter_table("routines", reflect_args=reflect_args, recreate="always") as batch_op:
+        batch_op.alter_column("id", type_=GUID(), existing_nullable=False)
+        batch_op.alter_column("updated_at", server_default=db_now(), existing_type=sa.DateTime())
+
+    for name in names:
+        bind.execute(sa.text("UPDATE routines SET id = :id WHERE name = :name"), {"id": uuid.uuid4().hex, "name": name})
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "sqlite":
+        return
+    reflect_args = [sa.Column("id", GUID(), primary_key=True)]
+    with op.batch_alter_table("routines", reflect_args=reflect_args, recreate="always") as batch_op:
+        batch_op.alter_column("id", type_=postgresql.UUID(as_uuid=True), existing_nullable=False)
+        batch_op.alter_column("updated_at", server_default=sa.func.now(), existing_type=sa.DateTime())
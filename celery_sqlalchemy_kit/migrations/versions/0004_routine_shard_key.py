@@ -0,0 +1,40 @@
+"""Add 'shard_key' to table 'routines', so that beat instances sharing the routines only select their share
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from celery_sqlalchemy_kit.sharding import shard_key
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # created by 'create_table' already
+    if "shard_key" in {column["name"] for column in sa.inspect(bind).get_columns("routines")}:
+        return
+    op.add_column("routines", sa.Column("shard_key", sa.BigInteger()))
+    op.create_index("ix_routines_shard_key", "routines", ["shard_key"])
+
+    routines = sa.table("routines", sa.column("name", sa.String), sa.column("shard_key", sa.BigInteger))
+    names = bind.execute(sa.select(routines.c.name)).scalars().all()
+    if names:
+        stmt = sa.update(routines).where(routines.c.name == sa.bindparam("b_name"))
+        bind.execute(
+            stmt.values(shard_key=sa.bindparam("b_key")),
+            [{"b_name": name, "b_key": shard_key(name)} for name in names],
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_routines_shard_key", "routines")
+    op.drop_column("routines", "shard_key")
@@ -1,10 +1,16 @@
+import copy
+import heapq
 import os
-from typing import List
+import socket
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Set, Tuple
+from uuid import UUID, uuid4
 
 from celery import Celery
-from celery.schedules import crontab
+from celery.schedules import crontab, schedule as schedule_t
 from celery.utils.log import get_logger
-from celery.beat import Scheduler
+from celery.beat import Scheduler, event_t
 
 from sqlalchemy.exc import SQLAlchemyError, OperationalError, DBAPIError, InterfaceError
 
@@ -12,7 +18,12 @@ from sqlalchemy.orm import Session
 
 from .db import crud
 from .db import Routine, Base
-from .db import SessionWrapper
+from .db import SessionWrapper, LeaseLostError
+from .db import NOTIFY_CHANNEL, install_notify_trigger, notify_trigger_installed
+from .db import schedule_cache_info
+from .metrics import Metrics, metrics_from_config
+from .sharding import HashRing
+from .write_behind import WriteBehindBuffer
 
 logger = get_logger(__name__)
 
@@ -26,46 +37,229 @@ class RoutineScheduler(Scheduler):
     sync_every: int
     #: How many tasks can be called before a sync is forced.
     sync_every_tasks = None
+    #: How often the schedule is fully reloaded from DB, even if no change was detected.
+    reload_every: int
+    #: How many routines are fetched from DB per query.
+    batch_size: int
+    #: If set, only routines due within this many seconds are loaded, using the index on 'next_run_at'.
+    lookahead: float
+    #: Whether changed routines are pushed by PostgreSQL LISTEN/NOTIFY instead of polling for changes.
+    listen_notify: bool
+    #: Maximum time to sleep between polling for notifications, if 'listen_notify' is enabled.
+    notify_interval: float
+    #: Whether only the beat instance holding the lease in DB sends tasks, while others stand by.
+    leader_election: bool
+    #: Whether due routines are claimed in DB before sending, so that each run is sent only once by all schedulers.
+    claim_on_fire: bool
+    #: Whether routines are partitioned among all beat instances with the same 'lease_name' by consistent hashing.
+    sharding: bool
+    #: Seconds until the lease or membership expires, if it is not renewed. It is renewed every third of it.
+    lease_ttl: float
+    #: Name of the lease or group, beat instances with the same name elect one leader or share the routines.
+    lease_name: str
+    #: Whether run stats are written by a background thread instead of 'sync', so that ticks never wait for the DB.
+    write_behind: bool
+    #: Maximum age of unwritten run stats in seconds, if 'write_behind' is enabled.
+    sync_max_staleness: float
+    #: Maximum number of routines whose run stats are written with one statement, if 'write_behind' is enabled.
+    sync_batch_size: int
+    #: File to save unwritten run stats to while the DB is unavailable, if 'write_behind' is enabled.
+    sync_spool_file: str
+    #: Exporter of the metrics of the hot paths, None if metrics are disabled.
+    metrics: Metrics | None
+    #: Maximum number of due entries sent in one tick, through the producer of beat.
+    publish_batch_size: int
     _session: Session
-    _db_routines: List[Routine] | None = None
-    _db_routines_dict: dict | None = None
+    _db_routines_dict: Dict[str, UUID] | None = None
+    _schedule_cache: dict | None = None
+    _schedule_revision: Tuple[int, datetime | None] | None = None
+    _last_reload: float | None = None
+    #: content hashes of the cached routines, used to detect changed routines on reload
+    _routine_hashes: Dict[str, str] | None = None
+    #: version hashes of the cached routines, used to detect changed routines on reloads without 'kwargs' and 'options'
+    _routine_versions: Dict[str, str] | None = None
+    #: monotonic time of the last reload of all routines with all columns
+    _last_full_reload: float | None = None
+    #: names of routines whose events in heap are outdated, None if the heap has to be rebuilt completely
+    _heap_dirty: Set[str] | None = None
+    #: current event of every routine in heap by name, other events in heap are stale and skipped when popped
+    _heap_events: Dict[str, tuple] | None = None
+    #: fencing token of the lease, if this instance is the leader
+    _lease_token: int | None = None
+    #: monotonic time until which the lease is held for sure, if it cannot be renewed
+    _lease_deadline: float = 0
+    _lease_checked: float | None = None
+    #: monotonic time until which this member may send tasks, if sharding is enabled
+    _send_deadline: float = 0
+    #: consistent hash ring of the members of the group, if this instance owns routines
+    _ring: HashRing | None = None
+    #: monotonic time of the first renewal of the current membership
+    _joined_at: float | None = None
+    _write_behind: WriteBehindBuffer | None = None
 
     def __init__(self, *args, **kwargs):
 
         self.app: Celery = kwargs["app"]
         db_uri = self.app.conf.get("scheduler_db_uri") or os.getenv("SCHEDULER_DB_URI")
-        if not db_uri:
+        db_engine = self.app.conf.get("scheduler_db_engine")
+        if not db_uri and db_engine is None:
             raise RuntimeError("No scheduler DB URI provided (scheduler_db_uri / SCHEDULER_DB_URI).")
 
         self.max_interval = int(self.app.conf.get("scheduler_max_interval") or os.getenv("SCHEDULER_MAX_INTERVAL", 10))
 
         self.sync_every = int(self.app.conf.get("scheduler_sync_every") or os.getenv("SCHEDULER_SYNC_EVERY", 3 * 60))
 
-        self._task_db = SessionWrapper(scheduler_db_uri=db_uri)
+        self.batch_size = int(self.app.conf.get("scheduler_batch_size") or os.getenv("SCHEDULER_BATCH_SIZE", 1000))
+
+        self.reload_every = int(
+            self.app.conf.get("scheduler_reload_every") or os.getenv("SCHEDULER_RELOAD_EVERY", 5 * 60)
+        )
+
+        self.lookahead = float(self.app.conf.get("scheduler_lookahead") or os.getenv("SCHEDULER_LOOKAHEAD", 0))
+
+        self.listen_notify = str(
+            self.app.conf.get("scheduler_listen_notify") or os.getenv("SCHEDULER_LISTEN_NOTIFY", False)
+        ).lower() in ("1", "true", "yes")
+
+        self.notify_interval = float(
+            self.app.conf.get("scheduler_notify_interval") or os.getenv("SCHEDULER_NOTIFY_INTERVAL", 1)
+        )
+
+        self.claim_on_fire = str(
+            self.app.conf.get("scheduler_claim_on_fire") or os.getenv("SCHEDULER_CLAIM_ON_FIRE", False)
+        ).lower() in ("1", "true", "yes")
+
+        self.leader_election = str(
+            self.app.conf.get("scheduler_leader_election") or os.getenv("SCHEDULER_LEADER_ELECTION", False)
+        ).lower() in ("1", "true", "yes")
+
+        self.sharding = str(
+            self.app.conf.get("scheduler_sharding") or os.getenv("SCHEDULER_SHARDING", False)
+        ).lower() in ("1", "true", "yes")
+        if self.sharding and self.leader_election:
+            logger.warning("Sharding and leader election are exclusive, using sharding.")
+            self.leader_election = False
+
+        self.lease_ttl = float(self.app.conf.get("scheduler_lease_ttl") or os.getenv("SCHEDULER_LEASE_TTL", 10))
+
+        self.lease_name = self.app.conf.get("scheduler_lease_name") or os.getenv("SCHEDULER_LEASE_NAME", "beat")
+        self._lease_holder = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+        self.write_behind = str(
+            self.app.conf.get("scheduler_write_behind") or os.getenv("SCHEDULER_WRITE_BEHIND", False)
+        ).lower() in ("1", "true", "yes")
+
+        self.sync_max_staleness = float(
+            self.app.conf.get("scheduler_sync_max_staleness") or os.getenv("SCHEDULER_SYNC_MAX_STALENESS", 5)
+        )
+
+        self.sync_batch_size = int(
+            self.app.conf.get("scheduler_sync_batch_size") or os.getenv("SCHEDULER_SYNC_BATCH_SIZE", 500)
+        )
+
+        self.sync_spool_file = (
+            self.app.conf.get("scheduler_sync_spool_file")
+            or os.getenv("SCHEDULER_SYNC_SPOOL_FILE")
+            or f"{kwargs.get('schedule_filename') or 'celerybeat-schedule'}-pending.json"
+        )
+
+        self.publish_batch_size = int(
+            self.app.conf.get("scheduler_publish_batch_size") or os.getenv("SCHEDULER_PUBLISH_BATCH_SIZE", 1000)
+        )
+
+        metrics_port = self.app.conf.get("scheduler_metrics_port") or os.getenv("SCHEDULER_METRICS_PORT")
+        self.metrics = metrics_from_config(
+            self.app.conf.get("scheduler_metrics") or os.getenv("SCHEDULER_METRICS"),
+            port=int(metrics_port) if metrics_port else None,
+        )
+
+        if self.app.conf.get("scheduler_db_pool_pre_ping") is not None:
+            pool_pre_ping = bool(self.app.conf.get("scheduler_db_pool_pre_ping"))
+        else:
+            pool_pre_ping = os.getenv("SCHEDULER_DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+        self._task_db = SessionWrapper(
+            scheduler_db_uri=db_uri,
+            engine=db_engine,
+            pool_size=int(self.app.conf.get("scheduler_db_pool_size") or os.getenv("SCHEDULER_DB_POOL_SIZE", 2)),
+            max_overflow=int(
+                self.app.conf.get("scheduler_db_max_overflow") or os.getenv("SCHEDULER_DB_MAX_OVERFLOW", 10)
+            ),
+            pool_recycle=int(
+                self.app.conf.get("scheduler_db_pool_recycle") or os.getenv("SCHEDULER_DB_POOL_RECYCLE", 1800)
+            ),
+            pool_pre_ping=pool_pre_ping,
+            pool_timeout=float(
+                self.app.conf.get("scheduler_db_pool_timeout") or os.getenv("SCHEDULER_DB_POOL_TIMEOUT", 30)
+            ),
+            connect_timeout=int(
+                self.app.conf.get("scheduler_db_connect_timeout") or os.getenv("SCHEDULER_DB_CONNECT_TIMEOUT", 5)
+            ),
+            busy_timeout=float(
+                self.app.conf.get("scheduler_db_busy_timeout") or os.getenv("SCHEDULER_DB_BUSY_TIMEOUT", 5)
+            ),
+            null_pool=str(
+                self.app.conf.get("scheduler_db_null_pool") or os.getenv("SCHEDULER_DB_NULL_POOL", False)
+            ).lower() in ("1", "true", "yes"),
+            metrics=self.metrics,
+        )
         self._session = self._task_db.session
 
         if self.app.conf.get("create_table", True):
             try:
                 Base.metadata.create_all(bind=self._task_db.engine, checkfirst=True)
                 # checkfirst = True: will not attempt to recreate tables already present in the target database.
+                if self.listen_notify:
+                    # the table may have been created before, without trigger
+                    with self._task_db.engine.connect() as connection:
+                        install_notify_trigger(connection)
             except Exception as e:
                 logger.error(e, exc_info=True)
 
+        if self.listen_notify:
+            try:
+                with self._task_db.engine.connect() as connection:
+                    trigger_installed = notify_trigger_installed(connection)
+                if trigger_installed:
+                    self._task_db.listen(NOTIFY_CHANNEL)
+                else:
+                    # e.g. 'create_table' is not set and the migrations do not install the trigger
+                    logger.warning(
+                        "The trigger notifying about changed routines is not installed on table 'routines', "
+                        "polling for changes instead. Install it with install_notify_trigger()."
+                    )
+                    self.listen_notify = False
+            except Exception as e:
+                logger.error(f"Could not listen for changed routines, falling back to polling: {e}", exc_info=True)
+                self.listen_notify = False
+
+        if self.write_behind:
+            self._write_behind = WriteBehindBuffer(
+                self._write_run_stats,
+                max_staleness=self.sync_max_staleness,
+                max_batch=self.sync_batch_size,
+                spool_file=self.sync_spool_file,
+            )
+            # run stats saved by a former process have to be written before the schedule is loaded
+            if len(self._write_behind):
+                self._write_behind.flush()
+            self._write_behind.start()
+
         self._to_be_updated = set()
         self._schedule = {}
         super().__init__(*args, **kwargs)
 
+    @property
+    def db_degraded(self) -> bool:
+        """Whether the DB is unavailable. Tasks are sent from the schedule in memory meanwhile."""
+        return self._task_db.degraded
+
     def _safe_renew(self):
         """
-        Dispose broken connections and renew the SQLAlchemy session safely.
+        Dispose broken connections and renew the SQLAlchemy session in the background.
         Keeps the scheduler alive if the DB is temporarily unavailable.
         """
-        try:
-            self._task_db.engine.dispose()
-        except Exception:
-            pass
         self._task_db.renew()
-        self._session = self._task_db.session
 
     # Merge changes
     def merge_inplace(self, celery_task_schedules: dict):
@@ -80,23 +274,21 @@ class RoutineScheduler(Scheduler):
                         **Parameters**
         * `celery_task_schedules`: The schedules defined by celery beat on startup.
         """
-        # schedule = self.schedule
-        # get all routines from db, active and inactive
-        db_routines = crud.get_multiple(db=self._session)
-        db_routines = self.db_routines_to_schedule_entries(db_routines=db_routines)
+        # get the names of all routines from db, active and inactive
+        db_routine_names = crud.get_names(db=self._session)
 
         # compare which routines are
         # new in celery routines -> write to db
         write_to_db = {}
         for key in celery_task_schedules:
-            if key not in db_routines:
+            if key not in db_routine_names:
                 write_to_db[key] = celery_task_schedules[key]
 
         # deleted in celery -> delete in db
         delete_from_db = {}
-        for key in db_routines:
+        for key in db_routine_names:
             if key not in celery_task_schedules:
-                delete_from_db[key] = db_routines[key]
+                delete_from_db[key] = None
 
         # Update db
         logger.debug("Setup: Update db.")
@@ -105,12 +297,13 @@ class RoutineScheduler(Scheduler):
     def update_db(self, write_to_db: dict = None, delete_from_db: dict = None):
         """
         Updates the DB by inserting new schedules and deleting deprecated schedules.
+        Schedules inserted by another scheduler in the meantime are skipped.
         """
         if write_to_db:
             write_to_db = self.schedule_dict_to_db_routines(write_to_db)
             logger.debug("Setup: Add celery routines to db.")
             try:
-                crud.create_multiple(db=self._session, routines_in=write_to_db)
+                crud.create_multiple_if_missing(db=self._session, routines_in=write_to_db)
             except Exception as e:
                 logger.error(e, exc_info=True)
         if delete_from_db:
@@ -125,14 +318,12 @@ class RoutineScheduler(Scheduler):
         self.merge_inplace(self.app.conf.beat_schedule)
         self.install_default_entries(self.schedule)
 
-    def db_routines_to_schedule_entries(self, db_routines: list[Routine]) -> dict:
+    def db_routines_to_schedule_entries(self, db_routines: Iterable[Routine]) -> dict:
         schedule_entries = {}
         for routine in db_routines:
-            routine_dict = routine.to_dict()
-            del routine_dict["id"]
-            del routine_dict["active"]
+            routine_dict = routine.to_dict(exclude=["id", "active", "updated_at", "next_run_at", "shard_key"])
             # timedelta or crontab
-            routine_dict["schedule"] = routine.schedule_object
+            routine_dict["schedule"] = routine.schedule_for(self.app)
             entry = self.Entry(**dict(routine_dict, name=routine.name, app=self.app))
             schedule_entries[routine.name] = entry
         return schedule_entries
@@ -169,12 +360,29 @@ class RoutineScheduler(Scheduler):
         """
         Retrieve schedules from DB and return them as a db of schedule entries with schedule names as keys
         and entries as values.
+        The schedule is cached in memory. On every call only a cheap probe is sent to the DB and the routines
+        are reloaded only if table 'routines' changed or 'reload_every' seconds passed since the last reload.
+        While the DB is unavailable, the cached schedule is returned without trying to reach the DB.
         """
-        logger.debug("get schedule")
-        schedule_entries = {}
+        if self.db_degraded:
+            return self._schedule_cache if self._schedule_cache is not None else {}
         try:
-            self._db_routines = crud.get_multiple(db=self._session, active=True)
-            schedule_entries = self.db_routines_to_schedule_entries(db_routines=self._db_routines)
+            if self.listen_notify and self._schedule_cache is not None and not self._reload_due():
+                names = self._task_db.poll_notifications()
+                if names is not None:
+                    if names:
+                        logger.debug(f"Notified about changed routines: {set(names)}")
+                        self._load_schedule(names=set(names))
+                    return self._schedule_cache
+                # notifications may have been lost while the connection was down
+                self._schedule_revision = None
+            revision = crud.get_revision(db=self._session)
+            if self._schedule_cache is not None and revision == self._schedule_revision and not self._reload_due():
+                return self._schedule_cache
+            logger.debug("get schedule")
+            self._load_schedule()
+            self._schedule_revision = revision
+            self._last_reload = time.monotonic()
         except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError) as e:
             logger.warning(
                 "Database unavailable during get_schedule; keeping beat alive and retrying on next tick.",
@@ -182,12 +390,226 @@ class RoutineScheduler(Scheduler):
             )
             # Drop stale connections and renew the session; do not recurse.
             self._safe_renew()
-            # Safer default: pause scheduling for this tick to avoid duplicate fires.
-            return {}
+            # keep sending tasks from memory, run stats are kept there until they can be synced
+            return self._schedule_cache if self._schedule_cache is not None else {}
         except Exception as e:
             logger.error(e, exc_info=True)
-        logger.debug("Current schedule:\n" + "\n".join(repr(entry) for entry in schedule_entries.values()))
-        return schedule_entries
+            # force a reload on next tick
+            self._schedule_revision = None
+            return {}
+        logger.debug("Current schedule:\n" + "\n".join(repr(entry) for entry in self._schedule_cache.values()))
+        return self._schedule_cache
+
+    def _load_schedule(self, names: Set[str] | None = None):
+        """Reload the routines due within 'lookahead' or all routines, and export the duration and rows read."""
+        start = time.perf_counter() if self.metrics is not None else 0
+        if self.lookahead:
+            rows = self._reload_due_schedule()
+        else:
+            rows = self._reload_schedule(names=names)
+        if self.metrics is not None:
+            self.metrics.observe("schedule_load_duration_seconds", time.perf_counter() - start)
+            self.metrics.set("schedule_load_rows", rows)
+
+    def _reload_schedule(self, names: Set[str] | None = None) -> int:
+        """
+        Reload the routines from DB and only replace entries of new or changed routines in the cached schedule.
+        Unchanged entries are kept, as well as 'last_run_at' and 'total_run_count' of changed entries,
+        because the entries in memory may be more recent than the DB, if 'sync' did not run yet.
+        Columns 'kwargs' and 'options' are only loaded for new or changed routines (see _find_changed).
+        Return the number of routines read from DB, including the ones of other members.
+
+                        **Parameters**
+        * `names`: Only reload the routines with these names. All routines are reloaded if None.
+        """
+        cache = self._schedule_cache if self._schedule_cache is not None else {}
+        old_versions = self._routine_versions or {}
+        if names is None:
+            full = self._full_reload_due()
+            db_routines = crud.iter_multiple(
+                db=self._session,
+                active=True,
+                batch_size=self.batch_size,
+                load_json=full,
+                shard_ranges=self._shard_ranges(),
+            )
+            old_hashes = self._routine_hashes or {}
+            db_routines_dict, routine_hashes, routine_versions = {}, {}, {}
+        else:
+            # notified routines are changed anyway
+            full = True
+            db_routines = crud.get_multiple(db=self._session, names=list(names), active=True)
+            db_routines_dict = self._db_routines_dict
+            routine_hashes = self._routine_hashes
+            routine_versions = self._routine_versions
+            old_hashes = {name: routine_hashes.pop(name, None) for name in names}
+            for name in names:
+                db_routines_dict.pop(name, None)
+                routine_versions.pop(name, None)
+        owned_routines, unknown_shard_keys = [], []
+        rows = 0
+        for routine in db_routines:
+            rows += 1
+            if self.sharding and routine.shard_key is None:
+                unknown_shard_keys.append(routine.name)
+            if not self.owns(routine.name):
+                continue
+            db_routines_dict[routine.name] = routine.id
+            routine_versions[routine.name] = routine.version_hash
+            owned_routines.append(routine)
+        # e.g. inserted without SQLAlchemy, so that the other members do not load them anymore
+        crud.update_shard_keys(db=self._session, names=unknown_shard_keys)
+        changed_routines = self._find_changed(owned_routines, full, cache, old_hashes, old_versions, routine_hashes)
+        changed_entries = self.db_routines_to_schedule_entries(db_routines=changed_routines)
+        removed = cache.keys() - routine_hashes.keys()
+
+        for name, entry in changed_entries.items():
+            old_entry = cache.get(name)
+            if old_entry is not None:
+                entry.last_run_at = old_entry.last_run_at
+                entry.total_run_count = old_entry.total_run_count
+            cache[name] = entry
+        for name in removed:
+            del cache[name]
+        if self._heap_dirty is not None:
+            self._heap_dirty |= changed_entries.keys() | removed
+        logger.debug(
+            f"Reloaded schedule: {len(changed_entries)} new or changed, {len(removed)} removed routines. "
+            f"Compiled schedules: {schedule_cache_info()}"
+        )
+
+        self._schedule_cache = cache
+        self._routine_hashes = routine_hashes
+        self._routine_versions = routine_versions
+        self._db_routines_dict = db_routines_dict
+        if names is None and full:
+            self._last_full_reload = time.monotonic()
+        return rows
+
+    def _reload_due_schedule(self) -> int:
+        """
+        Load only the routines due within 'lookahead' seconds, using the index on 'next_run_at'.
+        Entries already in memory are kept with their run stats, since they may be more recent than the DB.
+        Routines with unknown 'next_run_at', e.g. new or edited ones, are loaded as well and get it written to DB.
+        Columns 'kwargs' and 'options' are only loaded for new or changed routines (see _find_changed).
+        Return the number of routines read from DB, including the ones of other members.
+        """
+        until = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=self.lookahead)
+        full = self._full_reload_due()
+        cache = self._schedule_cache if self._schedule_cache is not None else {}
+        old_hashes = self._routine_hashes or {}
+        old_versions = self._routine_versions or {}
+        old_db_routines_dict = self._db_routines_dict or {}
+        routine_hashes, routine_versions, db_routines_dict = {}, {}, {}
+        owned_routines, unknown_next_run, unknown_shard_keys = [], [], []
+        due_routines = crud.get_due(db=self._session, until=until, load_json=full, shard_ranges=self._shard_ranges())
+        rows = 0
+        for routine in due_routines:
+            rows += 1
+            if self.sharding and routine.shard_key is None:
+                unknown_shard_keys.append(routine.name)
+            if not self.owns(routine.name):
+                continue
+            db_routines_dict[routine.name] = routine.id
+            routine_versions[routine.name] = routine.version_hash
+            if routine.next_run_at is None:
+                unknown_next_run.append(routine.name)
+            owned_routines.append(routine)
+        crud.update_shard_keys(db=self._session, names=unknown_shard_keys)
+        changed_routines = self._find_changed(owned_routines, full, cache, old_hashes, old_versions, routine_hashes)
+        changed_entries = self.db_routines_to_schedule_entries(db_routines=changed_routines)
+        never_run = {r.name: r.next_run_at for r in owned_routines if r.last_run_at is None and r.next_run_at}
+        schedule = {name: cache[name] for name in routine_hashes if name not in changed_entries}
+        for name, entry in changed_entries.items():
+            old_entry = cache.get(name)
+            if old_entry is not None:
+                entry.last_run_at = old_entry.last_run_at
+                entry.total_run_count = old_entry.total_run_count
+            elif name in never_run and isinstance(entry.schedule, schedule_t):
+                # back in the window: due at the stored time, not a full interval after now
+                entry.last_run_at = never_run[name].replace(tzinfo=timezone.utc) - entry.schedule.run_every
+            schedule[name] = entry
+        crud.update_next_run_at(
+            db=self._session,
+            updates=[
+                {"id": db_routines_dict[name], "next_run_at": self._next_run_at(schedule[name])}
+                for name in unknown_next_run
+                if name in schedule
+            ],
+        )
+        # run stats of routines out of the window may still have to be synced
+        for name in self._to_be_updated:
+            if name not in db_routines_dict and name in old_db_routines_dict:
+                db_routines_dict[name] = old_db_routines_dict[name]
+        if self._heap_dirty is not None:
+            self._heap_dirty |= changed_entries.keys() | (cache.keys() - schedule.keys())
+        logger.debug(
+            f"Reloaded {len(schedule)} routines due until {until}: {len(changed_entries)} new or changed, "
+            f"{len(cache.keys() - schedule.keys())} out of window."
+        )
+
+        self._schedule_cache = schedule
+        self._routine_hashes = routine_hashes
+        self._routine_versions = routine_versions
+        self._db_routines_dict = db_routines_dict
+        if full:
+            self._last_full_reload = time.monotonic()
+        return rows
+
+    def _find_changed(
+            self,
+            db_routines: list[Routine],
+            full: bool,
+            cache: dict,
+            old_hashes: Dict[str, str],
+            old_versions: Dict[str, str],
+            routine_hashes: Dict[str, str],
+    ) -> list[Routine]:
+        """
+        Return the new or changed routines of 'db_routines' and store the content hashes of all of them
+        in 'routine_hashes'. Routines not found in DB anymore get no content hash.
+        If not 'full', 'db_routines' were loaded without 'kwargs' and 'options' and are compared by their
+        version hash. Only routines with a new version hash are loaded again with all columns.
+        """
+        changed_routines, reload_names = [], []
+        for routine in db_routines:
+            name = routine.name
+            known = name in cache and old_hashes.get(name) is not None
+            if full:
+                routine_hashes[name] = routine.content_hash
+                if not known or old_hashes[name] != routine_hashes[name]:
+                    changed_routines.append(routine)
+            elif known and old_versions.get(name) == routine.version_hash:
+                routine_hashes[name] = old_hashes[name]
+            else:
+                reload_names.append(name)
+        for i in range(0, len(reload_names), self.batch_size):
+            names = reload_names[i:i + self.batch_size]
+            for routine in crud.get_multiple(db=self._session, names=names, active=True):
+                name = routine.name
+                routine_hashes[name] = routine.content_hash
+                # e.g. only 'updated_at' changed
+                if name not in cache or old_hashes.get(name) != routine_hashes[name]:
+                    changed_routines.append(routine)
+        return changed_routines
+
+    def _full_reload_due(self) -> bool:
+        # 'kwargs' and 'options' are compared as well every 'reload_every' seconds, e.g. after changes with plain SQL
+        if self._schedule_cache is None or self._last_full_reload is None:
+            return True
+        return (time.monotonic() - self._last_full_reload) > self.reload_every
+
+    @staticmethod
+    def _next_run_at(entry) -> datetime:
+        """Next due time of an entry in UTC, as stored in column 'next_run_at'."""
+        is_due, next_time_to_run = entry.is_due()
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return now if is_due else now + timedelta(seconds=next_time_to_run)
+
+    def _reload_due(self) -> bool:
+        # the window of due routines is moved on every half of 'lookahead'
+        reload_every = min(self.reload_every, self.lookahead / 2) if self.lookahead else self.reload_every
+        return self._last_reload is None or (time.monotonic() - self._last_reload) > reload_every
 
     def set_schedule(self, new_schedule):
         logger.debug("set schedule")
@@ -195,60 +617,470 @@ class RoutineScheduler(Scheduler):
 
     schedule = property(get_schedule, set_schedule)
 
+    def is_leader(self) -> bool:
+        """
+        Return whether this instance holds the lease and may send tasks.
+        The lease is acquired or renewed, if a third of 'lease_ttl' passed since the last try.
+        If it cannot be renewed, leadership ends 'lease_ttl' seconds after the last successful renewal,
+        before any other instance can take the lease over.
+        """
+        now = time.monotonic()
+        renew = self._lease_checked is None or now - self._lease_checked >= self.lease_ttl / 3
+        # while the DB is unavailable, leadership ends at the deadline without trying to renew
+        if renew and not self.db_degraded:
+            self._lease_checked = now
+            try:
+                token = self._task_db.acquire_lease(self.lease_name, self._lease_holder, self.lease_ttl)
+            except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
+                logger.warning("Database unavailable while renewing the lease; retrying on next tick.", exc_info=True)
+                self._safe_renew()
+            else:
+                if token is not None:
+                    self._lease_deadline = now + self.lease_ttl
+                self._set_lease_token(token)
+        if self._lease_token is not None and time.monotonic() >= self._lease_deadline:
+            self._set_lease_token(None)
+        return self._lease_token is not None
+
+    def _set_lease_token(self, token: int | None):
+        if token == self._lease_token:
+            return
+        if token is None:
+            logger.warning(f"Lost lease {self.lease_name}, standing by. Unsynced run stats are discarded.")
+        else:
+            logger.info(f"Acquired lease {self.lease_name} with fencing token {token}, sending tasks.")
+        self._lease_token = token
+        self._to_be_updated = set()
+        if self._write_behind is not None:
+            self._write_behind.discard()
+        # the former leader may have sent tasks and synced run stats in the meantime
+        self._reset_schedule()
+
+    def update_membership(self):
+        """
+        Renew the membership of this instance in its group, if a third of 'lease_ttl' passed since the last try,
+        and rebalance the routines, if members joined or left.
+        A member only sends tasks until a third of 'lease_ttl' after its last renewal, which saw all members
+        that joined before. A new member only takes over routines after two thirds of 'lease_ttl', so by then
+        every other member either saw it and dropped the routines it owns now, or stopped sending.
+        If the membership cannot be renewed, this instance drops all routines before it expires.
+        """
+        now = time.monotonic()
+        renew = self._lease_checked is None or now - self._lease_checked >= self.lease_ttl / 3
+        if renew and not self.db_degraded:
+            self._lease_checked = now
+            try:
+                members = self._task_db.join_group(self.lease_name, self._lease_holder, self.lease_ttl)
+            except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
+                logger.warning("Database unavailable while renewing membership; retrying on next tick.", exc_info=True)
+                self._safe_renew()
+            else:
+                self._lease_deadline = now + self.lease_ttl
+                self._send_deadline = now + self.lease_ttl / 3
+                if self._joined_at is None:
+                    self._joined_at = now
+                settled = now - self._joined_at >= self.lease_ttl * 2 / 3
+                self._set_ring(HashRing(members) if settled else None)
+        if self._joined_at is not None and time.monotonic() >= self._lease_deadline:
+            # the other members consider this instance gone and take over its routines
+            self._joined_at = None
+            self._set_ring(None)
+
+    def owns(self, name: str) -> bool:
+        """Return whether this instance sends the routine 'name'. Always True, if sharding is disabled."""
+        if not self.sharding:
+            return True
+        return self._ring is not None and self._ring.owner(name) == self._lease_holder
+
+    def _shard_ranges(self) -> List[Tuple[int, int | None]] | None:
+        """Ranges of the shard keys of the routines this instance owns, None if sharding is disabled."""
+        if not self.sharding:
+            return None
+        return self._ring.ranges(self._lease_holder) if self._ring is not None else []
+
+    def _set_ring(self, ring: HashRing | None):
+        members = ring.members if ring is not None else None
+        if members == (self._ring.members if self._ring is not None else None):
+            return
+        if ring is None:
+            logger.warning(f"Not a member of group {self.lease_name} anymore, not sending any tasks.")
+        else:
+            logger.info(f"Group {self.lease_name} has {len(members)} members, rebalancing routines.")
+        # write run stats of routines that may move to other members, before they load them
+        self.sync()
+        if self._write_behind is not None:
+            self._write_behind.flush()
+        self._ring = ring
+        self._reset_schedule()
+
+    def _reset_schedule(self):
+        """Drop the cached schedule and heap, so that the schedule is loaded from DB again on next tick."""
+        self._schedule_cache = None
+        self._schedule_revision = None
+        self._routine_hashes = None
+        self._routine_versions = None
+        self._db_routines_dict = None
+        self._heap = None
+        self._heap_dirty = None
+        self._heap_events = None
+
+    def tick(self, *args, **kwargs):
+        if self.metrics is None:
+            return self._tick_and_wake_up(*args, **kwargs)
+        start = time.perf_counter()
+        interval = self._tick_and_wake_up(*args, **kwargs)
+        self.metrics.observe("tick_duration_seconds", time.perf_counter() - start)
+        backlog = len(self._to_be_updated) + (len(self._write_behind) if self._write_behind is not None else 0)
+        self.metrics.set("sync_backlog", backlog)
+        return interval
+
+    def _tick_and_wake_up(self, *args, **kwargs):
+        """Tick and return the time to sleep until beat has to wake up for the lease, notifications or reloads."""
+        if self.leader_election:
+            if not self.is_leader():
+                self._discard_notifications()
+                return self.lease_ttl / 3
+            # wake up in time to renew the lease
+            interval = min(self._tick(*args, **kwargs), self.lease_ttl / 3)
+        elif self.sharding:
+            self.update_membership()
+            # wake up in time to renew the membership
+            interval = min(self._tick(*args, **kwargs), self.lease_ttl / 3)
+        else:
+            interval = self._tick(*args, **kwargs)
+        if self.lookahead:
+            # wake up in time to move the window of due routines
+            interval = min(interval, self.lookahead / 2)
+        if self.listen_notify:
+            # wake up in time to apply notified changes
+            return min(interval, self.notify_interval)
+        return interval
+
+    def _tick(self, *args, **kwargs):
+        if self.claim_on_fire:
+            return self.tick_claim_on_fire()
+        return self.tick_batch()
+
+    def _pop_due(self, heap: list, limit: int | None = None, heappop=heapq.heappop) -> Tuple[list, float]:
+        """
+        Pop the events of all due entries from heap, at most 'limit'.
+        Returns them with the time until their next run, and the time until the first entry not due is due.
+        """
+        due = []
+        next_time_to_run = self.max_interval
+        events = self._heap_events
+        while heap and (limit is None or len(due) < limit):
+            if events is not None and events.get(heap[0][2].name) is not heap[0]:
+                # event of a changed or removed routine, replaced by populate_heap
+                heappop(heap)
+                continue
+            is_due, next_time_to_run = self.is_due(heap[0][2])
+            if not is_due:
+                break
+            due.append((heappop(heap), next_time_to_run))
+        return due, next_time_to_run
+
+    def _push_event(self, heap: list, event: tuple, heappush=heapq.heappush):
+        heappush(heap, event)
+        if self._heap_events is not None:
+            self._heap_events[event[2].name] = event
+
+    def _sleep_interval(self, next_time_to_run: float) -> float:
+        next_time_to_run = self.adjust(next_time_to_run)
+        return min(next_time_to_run if next_time_to_run is not None else self.max_interval, self.max_interval)
+
+    def tick_batch(self, event_t=event_t, heappush=heapq.heappush):
+        """
+        Like Scheduler.tick, but sends all entries that are due in this tick, at most 'publish_batch_size',
+        in one batch through the producer of beat. Scheduler.tick sends one entry per tick,
+        so every due entry would wait for a tick of its own, including the probe for changes of the schedule.
+        """
+        if self._heap is None or not self.schedules_equal(self.old_schedulers, self.schedule):
+            self.old_schedulers = copy.copy(self.schedule)
+            self.populate_heap()
+        heap = self._heap
+        if not heap:
+            return self.max_interval
+        due, next_time_to_run = self._pop_due(heap, self.publish_batch_size)
+        if not due:
+            return self._sleep_interval(next_time_to_run)
+
+        start = time.perf_counter()
+        producer = self.producer
+        for event, next_time_to_run in due:
+            entry = event[2]
+            next_entry = self.reserve(entry)
+            self.apply_entry(entry, producer=producer)
+            self._push_event(heap, event_t(self._when(next_entry, next_time_to_run), event[1], next_entry), heappush)
+        self._observe_batch(len(due), start)
+        return 0
+
+    def _observe_batch(self, batch_size: int, start: float):
+        elapsed = time.perf_counter() - start
+        logger.debug(f"Sent {batch_size} due tasks in {elapsed:.3f}s.")
+        if self.metrics is not None:
+            self.metrics.observe("publish_batch_duration_seconds", elapsed)
+            self.metrics.observe("publish_batch_size", batch_size)
+
+    def tick_claim_on_fire(self, event_t=event_t, heappop=heapq.heappop, heappush=heapq.heappush):
+        """
+        Like Scheduler.tick, but sends all entries that are due in this tick.
+        Their next runs are claimed in DB with one statement before sending (see crud.claim_runs).
+        Entries run by another scheduler in the meantime are not sent, but updated from DB.
+        A run is lost, if beat stops between claiming and sending.
+        """
+        if self._heap is None or not self.schedules_equal(self.old_schedulers, self.schedule):
+            self.old_schedulers = copy.copy(self.schedule)
+            self.populate_heap()
+        heap = self._heap
+        if not heap:
+            return self.max_interval
+        if self.db_degraded:
+            # due routines cannot be claimed, nothing is sent until the DB is back
+            return min(self.max_interval, 1)
+
+        due, next_time_to_run = self._pop_due(heap, heappop=heappop)
+        if not due:
+            return self._sleep_interval(next_time_to_run)
+
+        db_routines_dict = self._db_routines_dict or {}
+        next_entries = {event[2].name: next(event[2]) for event, _ in due}
+        claims = [
+            {
+                "id": db_routines_dict[name],
+                "last_run_at": entry.last_run_at,
+                "total_run_count": entry.total_run_count,
+                "expected_run_count": entry.total_run_count - 1,
+                "next_run_at": self._next_run_at(entry),
+            }
+            for name, entry in next_entries.items()
+            if name in db_routines_dict
+        ]
+        try:
+            claimed = crud.claim_runs(db=self._session, claims=claims)
+            lost = [claim["id"] for claim in claims if claim["id"] not in claimed]
+            run_stats = crud.get_run_stats(db=self._session, ids=lost) if lost else {}
+        except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
+            logger.warning("Database unavailable while claiming due routines; retrying on next tick.", exc_info=True)
+            for event in due:
+                heappush(heap, event[0])
+            self._safe_renew()
+            return 0
+
+        start = time.perf_counter()
+        for event, next_time_to_run in due:
+            entry = event[2]
+            routine_id = db_routines_dict.get(entry.name)
+            # entries not stored in DB cannot be claimed
+            if routine_id is None or routine_id in claimed:
+                next_entry = self._store_entry(next_entries[entry.name])
+                self.apply_entry(entry, producer=self.producer)
+                next_event = event_t(self._when(next_entry, next_time_to_run), event[1], next_entry)
+                self._push_event(heap, next_event, heappush)
+                continue
+            # run by another scheduler: continue from the run stats in DB
+            last_run_at, total_run_count = run_stats.get(routine_id, (None, None))
+            logger.info(f"Routine {entry.name} was run by another scheduler, not sending task.")
+            next_entry = self._store_entry(
+                entry.__class__(
+                    **dict(
+                        entry,
+                        last_run_at=last_run_at or next_entries[entry.name].last_run_at,
+                        total_run_count=total_run_count or 0,
+                    )
+                )
+            )
+            is_due, next_time_to_run = self.is_due(next_entry)
+            next_event = event_t(self._when(next_entry, 0 if is_due else next_time_to_run), event[1], next_entry)
+            self._push_event(heap, next_event, heappush)
+        self._observe_batch(len(due), start)
+        return 0
+
+    def apply_entry(self, entry, producer=None):
+        # the lease may have expired, while this tick was blocked by the DB
+        if self.leader_election and not self.is_leader():
+            logger.warning(f"Lost lease {self.lease_name}, not sending task {entry.name}.")
+            return
+        # a member that could not renew its membership in time may have missed a new one taking over
+        if self.sharding and (time.monotonic() >= self._send_deadline or not self.owns(entry.name)):
+            logger.warning(f"Routine {entry.name} is not owned by this instance anymore, not sending task.")
+            return
+        super().apply_entry(entry, producer=producer)
+        if self.metrics is not None:
+            # 'entry' is the entry before the run, it was due this long ago
+            lateness = -entry.schedule.remaining_estimate(entry.last_run_at).total_seconds()
+            self.metrics.observe("dispatch_lateness_seconds", max(lateness, 0), task=entry.task, routine=entry.name)
+
+    def _discard_notifications(self):
+        """Consume notifications while standing by, the schedule is reloaded completely on takeover anyway."""
+        if not self.listen_notify or self.db_degraded:
+            return
+        try:
+            self._task_db.poll_notifications()
+        except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError):
+            logger.warning("Database unavailable while polling for notifications.", exc_info=True)
+            self._safe_renew()
+
+    def schedules_equal(self, old_schedules, new_schedules):
+        # changes of the cached schedule are tracked on reload, no need to compare all entries on every tick
+        if new_schedules is self._schedule_cache and self._heap_dirty is not None:
+            return not self._heap_dirty
+        return super().schedules_equal(old_schedules, new_schedules)
+
+    def populate_heap(self, event_t=event_t, heapify=heapq.heapify, heappush=heapq.heappush):
+        """
+        Populate the heap with the data contained in the schedule.
+        If the heap was populated from the cached schedule before, only events of changed routines are pushed,
+        in O(log n) each. The former events of changed and removed routines stay in heap until they are popped
+        and skipped, the heap is only rebuilt when they outnumber the current events.
+        Events of unchanged routines are kept as they are.
+        """
+        schedule = self.schedule
+        if schedule is not self._schedule_cache or self._heap is None or self._heap_dirty is None:
+            super().populate_heap(event_t=event_t, heapify=heapify)
+            self._heap_dirty = set() if schedule is self._schedule_cache else None
+            self._heap_events = {event[2].name: event for event in self._heap}
+            return
+        events = self._heap_events
+        for name in self._heap_dirty:
+            events.pop(name, None)
+            entry = schedule.get(name)
+            if entry is None:
+                continue
+            is_due, next_call_delay = entry.is_due()
+            event = event_t(self._when(entry, 0 if is_due else next_call_delay) or 0, 5, entry)
+            self._push_event(self._heap, event, heappush)
+        if len(self._heap) > 2 * len(events):
+            self._heap = list(events.values())
+            heapify(self._heap)
+        self._heap_dirty = set()
+
     def sync(self):
         """
         Updates the two columns 'last_run_at' and 'total_run_count' in DB for executed tasks.
+        All pending updates are written with a single statement.
         Runs frequently depending on 'sync_every' and 'sync_every_tasks'.
+        Nothing to do if 'write_behind' is enabled, run stats are written by the write-behind buffer then.
         """
         logger.debug("Update routines in DB.")
-        _tried = set()
-        _failed = set()
-        if self._schedule:
+        if not self._schedule or not self._to_be_updated or self.db_degraded:
+            # run stats are kept in memory until the DB is back
+            return
+        names, self._to_be_updated = self._to_be_updated, set()
+        db_routines_dict = self._db_routines_dict or {}
+        updates = []
+        for name in names:
+            if name not in db_routines_dict:
+                logger.error(f"Could not find routine with name {name} in db.")
+                continue
+            updates.append(self._run_stats(db_routines_dict[name], self._schedule[name]))
+        start = time.perf_counter()
+        try:
+            if self.leader_election:
+                if self._lease_token is None:
+                    return
+                # rejected, if another instance took the lease over in the meantime
+                with self._task_db.fenced_session(self.lease_name, self._lease_holder, self._lease_token) as session:
+                    crud.update_run_stats(db=session, updates=updates)
+            else:
+                crud.update_run_stats(db=self._session, updates=updates)
+            self._observe_sync(len(updates), start)
+        except LeaseLostError:
+            logger.warning("Lease was taken over by another instance; run stats are not written.", exc_info=True)
+            self._set_lease_token(None)
+        except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError) as e:
+            logger.warning(
+                "Database unavailable during sync; deferring updates and will retry later.",
+                exc_info=True,
+            )
+            # retry later
+            self._to_be_updated |= names & db_routines_dict.keys()
+            self._safe_renew()
+        except Exception as e:
+            self._to_be_updated |= names & db_routines_dict.keys()
+            logger.error(e, exc_info=True)
+            logger.debug("Database error while sync: %r", e)
+
+    def _run_stats(self, routine_id: UUID, entry) -> dict:
+        return {
+            "id": routine_id,
+            "last_run_at": entry.last_run_at,
+            "total_run_count": entry.total_run_count,
+            "next_run_at": self._next_run_at(entry),
+        }
+
+    def _write_run_stats(self, updates: list, only_newer: bool):
+        """Write run stats buffered by the write-behind buffer. Runs in its thread, with a session of its own."""
+        if self.leader_election and not only_newer:
+            # only updates made with the current lease, a former one may have been lost and acquired again
+            token = self._lease_token
+            updates = [update for update in updates if update.get("lease_token") == token]
+            if token is None or not updates:
+                return
+            start = time.perf_counter()
             try:
-                while self._to_be_updated:
-                    name = self._to_be_updated.pop()
-                    try:
-                        # get db entry by name and update total_run_count and last_run_time
-                        db_routine = [routine for routine in self._db_routines if routine.name == name]
-                        if not db_routine:
-                            logger.error(f"Could not find routine with name {name} in db.")
-                        db_routine = db_routine[0]
-                        # update last_run_at and total_run_count
-                        obj_in = {
-                            "last_run_at": self._schedule[name].last_run_at,
-                            "total_run_count": self._schedule[name].total_run_count,
-                        }
-                        crud.update(db=self._session, db_obj=db_routine, obj_in=obj_in)
-                        _tried.add(name)
-                    except (OperationalError, DBAPIError, InterfaceError, SQLAlchemyError) as e:
-                        logger.warning(
-                            "Database unavailable during sync; deferring updates and will retry later.",
-                            exc_info=True,
-                        )
-                        # Re-queue and stop this tick to avoid tight loops while DB is down
-                        _failed.add(name)
-                        self._to_be_updated.add(name)
-                        self._safe_renew()
-                        break
-                    except Exception as e:
-                        _failed.add(name)
-                        logger.error(e, exc_info=True)
-                        logger.debug("Database error while sync: %r", e)
-            finally:
-                # retry later, only for the failed ones
-                self._to_be_updated |= _failed
+                with self._task_db.fenced_session(self.lease_name, self._lease_holder, token) as session:
+                    crud.update_run_stats(db=session, updates=updates, only_newer=only_newer)
+            except LeaseLostError:
+                # the lease is given up on next renewal
+                logger.warning("Lease was taken over by another instance; run stats are not written.", exc_info=True)
+            else:
+                self._observe_sync(len(updates), start)
+            return
+        # updates saved by a former process are written without fencing, they never overwrite newer run stats
+        start = time.perf_counter()
+        with self._task_db.connect() as connection, Session(bind=connection) as session:
+            crud.update_run_stats(db=session, updates=updates, only_newer=only_newer)
+        self._observe_sync(len(updates), start)
+
+    def _observe_sync(self, batch_size: int, start: float):
+        if self.metrics is not None:
+            self.metrics.observe("sync_duration_seconds", time.perf_counter() - start)
+            self.metrics.observe("sync_batch_size", batch_size)
 
     def reserve(self, entry):
         """
         Is being executed every tick (iteration) of the scheduler.
         Updates the next entry in heap and calls next() to update 'last_run_at' and 'total_run_count'.
         """
-        new_entry = next(entry)
-        self._schedule[entry.name] = new_entry
-        # Need to store entry by name, because the entry may change in the meantime.
-        self._to_be_updated.add(new_entry.name)
+        new_entry = self._store_entry(next(entry))
+        if self._write_behind is None:
+            # Need to store entry by name, because the entry may change in the meantime.
+            self._to_be_updated.add(new_entry.name)
+            return new_entry
+        routine_id = (self._db_routines_dict or {}).get(new_entry.name)
+        if routine_id is None:
+            logger.error(f"Could not find routine with name {new_entry.name} in db.")
+        else:
+            update = self._run_stats(routine_id, new_entry)
+            if self.leader_election:
+                update["lease_token"] = self._lease_token
+            self._write_behind.put(new_entry.name, update)
         return new_entry
 
+    def _store_entry(self, entry):
+        self._schedule[entry.name] = entry
+        # keep the cached schedule up to date, it is the base for changed entries and heap rebuilds
+        if self._schedule_cache is not None and entry.name in self._schedule_cache:
+            self._schedule_cache[entry.name] = entry
+        return entry
+
     def close(self):
         self.sync()
+        if self._write_behind is not None:
+            self._write_behind.stop()
+        if self.leader_election and self._lease_token is not None:
+            try:
+                # let a standby instance take over at once
+                self._task_db.release_lease(self.lease_name, self._lease_holder)
+            except Exception as e:
+                logger.error(e, exc_info=True)
+            self._lease_token = None
+        if self.sharding and self._joined_at is not None:
+            try:
+                # let the other members take over the routines of this instance at once
+                self._task_db.leave_group(self.lease_name, self._lease_holder)
+            except Exception as e:
+                logger.error(e, exc_info=True)
+            self._joined_at = None
         self._task_db.close()
@@ -0,0 +1,55 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Tuple
+
+
+def shard_key(key: str) -> int:
+    """
+    Position of 'key' on the hash ring. Stored for routine names in column 'shard_key' of table 'routines',
+    63 bits, so that it fits into a signed BIGINT.
+    """
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16) >> 1
+
+
+class HashRing:
+    """
+    Consistent hash ring, mapping routine names to the beat instances owning them.
+    If an instance joins or leaves, only the routines of this instance move, about 1/n of all routines.
+
+                    **Parameters**
+    * `members`: Ids of the beat instances
+    * `replicas`: Number of points per instance on the ring. More points spread routines more evenly.
+    """
+
+    def __init__(self, members: Iterable[str], replicas: int = 64):
+        self.members = sorted(set(members))
+        self._ring: List[Tuple[int, str]] = sorted(
+            (shard_key(f"{member}#{replica}"), member) for member in self.members for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    def owner(self, key: str) -> str | None:
+        """Return the member owning 'key', i.e. the first member clockwise on the ring, or None if empty."""
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._hashes, shard_key(key)) % len(self._ring)
+        return self._ring[index][1]
+
+    def ranges(self, member: str) -> List[Tuple[int, int | None]]:
+        """
+        Return the ranges of shard keys owned by 'member', so that its routines can be selected by 'shard_key'.
+        Ranges include their start and exclude their end, an end of None is unbounded.
+        """
+        ranges = []
+        for index, (point, owner) in enumerate(self._ring):
+            start = self._hashes[index - 1] if index else 0
+            if owner != member or start == point:
+                continue
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], point)
+            else:
+                ranges.append((start, point))
+        if self._ring and self._ring[0][1] == member:
+            # keys after the last point belong to the first one
+            ranges.append((self._hashes[-1], None))
+        return ranges
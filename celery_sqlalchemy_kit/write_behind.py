@@ -0,0 +1,187 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+from uuid import UUID
+
+from celery.utils.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Buffer of pending run stats updates of routines, written to DB by a background thread,
+    so that beat never waits for the DB while sending tasks.
+    Updates of the same routine are coalesced, only the latest one is written.
+    The buffer is flushed when its oldest update is 'max_staleness' seconds old or it holds 'max_batch' routines.
+    If the DB is unavailable, all pending updates are saved to 'spool_file' and written again on next start,
+    if beat stops before the DB is back. Failed writes are retried after 'max_staleness' seconds,
+    doubled after every further failure up to 'max_retry_delay'.
+
+                    **Parameters**
+    * `write`: Function writing a list of updates to DB, raises if the DB is unavailable.
+      If its second argument is True, updates must only be written if they are newer than the DB.
+    * `max_staleness`: Maximum age of a pending update in seconds, before it is written.
+    * `max_batch`: Maximum number of updates written with one call of 'write'.
+    * `spool_file`: File to save pending updates to while the DB is unavailable. Not saved if None.
+    * `max_retry_delay`: Maximum time in seconds between retries of failed writes.
+    """
+
+    def __init__(
+            self,
+            write: Callable[[List[Dict[str, Any]], bool], None],
+            *,
+            max_staleness: float,
+            max_batch: int,
+            spool_file: str | None = None,
+            max_retry_delay: float = 30,
+    ):
+        self._write = write
+        self.max_staleness = max_staleness
+        self.max_batch = max_batch
+        self.spool_file = spool_file
+        self.max_retry_delay = max_retry_delay
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        #: monotonic time of the oldest pending update
+        self._since: float | None = None
+        #: monotonic time before which no write is retried after a failure, None if the last write succeeded
+        self._retry_at: float | None = None
+        self._failures = 0
+        #: updates saved by a former beat process, only written if newer than the DB
+        self._spooled: List[Dict[str, Any]] = self._load_spool()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+
+    def __len__(self) -> int:
+        return len(self._pending) + len(self._spooled)
+
+    def put(self, name: str, update: Dict[str, Any]):
+        """Add the latest update of routine 'name', replacing a pending one."""
+        with self._cond:
+            self._pending[name] = update
+            if self._since is None:
+                # the thread waits without timeout while the buffer is empty
+                self._since = time.monotonic()
+                self._cond.notify()
+            elif len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def discard(self):
+        """Drop all pending updates, e.g. if they must not be written anymore."""
+        with self._cond:
+            self._pending = {}
+            self._since = None
+            self._retry_at, self._failures = None, 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="routine-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Stop the background thread and write all pending updates."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._flush_due():
+                    self._cond.wait(self._wait_timeout())
+                if self._stopped:
+                    return
+            self.flush()
+
+    def _wait_timeout(self) -> float | None:
+        if not self._pending:
+            # woken up by 'put'
+            return None
+        deadline = self._since + self.max_staleness
+        if self._retry_at is not None:
+            deadline = max(deadline, self._retry_at)
+        return deadline - time.monotonic()
+
+    def _flush_due(self) -> bool:
+        if self._retry_at is not None and time.monotonic() < self._retry_at:
+            # the DB failed, neither a full batch nor stale updates are written before the retry is due
+            return False
+        if len(self._pending) >= self.max_batch:
+            return True
+        return self._since is not None and time.monotonic() - self._since >= self.max_staleness
+
+    def flush(self) -> bool:
+        """
+        Write all pending updates in batches of 'max_batch'. Returns True, if all of them were written.
+        Unwritten updates stay pending and are saved to 'spool_file', if writing fails.
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending, self._since = self._pending, {}, None
+            try:
+                while self._spooled:
+                    self._write(self._spooled[:self.max_batch], True)
+                    del self._spooled[:self.max_batch]
+                names = list(batch)
+                for i in range(0, len(names), self.max_batch):
+                    chunk = names[i:i + self.max_batch]
+                    self._write([batch[name] for name in chunk], False)
+                    for name in chunk:
+                        del batch[name]
+            except Exception:
+                logger.warning(
+                    f"Could not write run stats of {len(batch) + len(self._spooled)} routines; retrying later.",
+                    exc_info=True,
+                )
+                with self._cond:
+                    # updates put in the meantime are newer
+                    self._pending = dict(batch, **self._pending)
+                    self._since = time.monotonic()
+                    self._failures += 1
+                    delay = min(max(self.max_staleness, 0.1) * 2 ** (self._failures - 1), self.max_retry_delay)
+                    self._retry_at = self._since + delay
+                    self._save_spool()
+                return False
+            with self._cond:
+                self._retry_at, self._failures = None, 0
+            if self.spool_file is not None and os.path.exists(self.spool_file):
+                with self._cond:
+                    if not self._pending:
+                        os.remove(self.spool_file)
+            return True
+
+    def _save_spool(self):
+        if self.spool_file is None:
+            return
+        updates = self._spooled + list(self._pending.values())
+        try:
+            tmp_file = f"{self.spool_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(updates, f, default=str)
+            os.replace(tmp_file, self.spool_file)
+        except OSError:
+            logger.error(f"Could not save pending run stats to {self.spool_file}.", exc_info=True)
+
+    def _load_spool(self) -> List[Dict[str, Any]]:
+        if self.spool_file is None or not os.path.exists(self.spool_file):
+            return []
+        try:
+            with open(self.spool_file) as f:
+                updates = json.load(f)
+        except (OSError, ValueError):
+            logger.error(f"Could not load pending run stats from {self.spool_file}.", exc_info=True)
+            return []
+        for update in updates:
+            update["id"] = UUID(update["id"])
+            for key in ("last_run_at", "next_run_at"):
+                if update.get(key) is not None:
+                    update[key] = datetime.fromisoformat(update[key])
+        logger.info(f"Loaded pending run stats of {len(updates)} routines from {self.spool_file}.")
+        return updates
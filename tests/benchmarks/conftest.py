@@ -0,0 +1,82 @@
+import os
+import uuid
+from typing import Callable, List
+
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit.db import Base, Routine
+
+HERE = os.path.dirname(__file__)
+
+_results: List[str] = []
+
+
+def benchmarks_enabled(config: pytest.Config) -> bool:
+    """Benchmarks only run with RUN_BENCHMARKS=1 or if selected by marker, e.g. 'pytest -m benchmark'."""
+    if os.getenv("RUN_BENCHMARKS", "").lower() in ("1", "true", "yes"):
+        return True
+    return "benchmark" in (config.getoption("markexpr", "") or "")
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    config.addinivalue_line("markers", "benchmark: slow benchmark, only run with RUN_BENCHMARKS=1 or -m benchmark")
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: List[pytest.Item]) -> None:
+    skip = pytest.mark.skip(reason="benchmark, set RUN_BENCHMARKS=1 or select with -m benchmark")
+    enabled = benchmarks_enabled(config)
+    for item in items:
+        if str(item.path).startswith(HERE):
+            item.add_marker(pytest.mark.benchmark)
+            if not enabled:
+                item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter) -> None:
+    if _results:
+        terminalreporter.section("benchmark results")
+        for line in _results:
+            terminalreporter.write_line(line)
+
+
+@pytest.fixture
+def report(request: pytest.FixtureRequest) -> Callable[[str], None]:
+    """Adds a result line of the test to the terminal summary."""
+    return lambda line: _results.append(f"{request.node.name}: {line}")
+
+
+@pytest.fixture(scope="module")
+def routine_columns() -> Callable[[int], dict]:
+    """Columns of the i-th routine besides name, task and schedule. Overridden by modules which need more."""
+    return lambda i: {}
+
+
+@pytest.fixture(scope="module")
+def sqlite_session(request: pytest.FixtureRequest, routine_columns: Callable[[int], dict]) -> Session:
+    """A session on an in-memory SQLite DB with the N_ROUTINES routines of the test module."""
+    engine = create_engine("sqlite://", future=True)
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine, expire_on_commit=False)
+    session.execute(
+        insert(Routine),
+        [
+            {
+                "id": uuid.uuid4(),
+                "name": f"routine {i}",
+                "task": f"task {i}",
+                "schedule": {"timedelta": 3600},
+                "active": True,
+                "total_run_count": 0,
+                **routine_columns(i),
+            }
+            for i in range(request.module.N_ROUTINES)
+        ],
+    )
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,142 @@
+"""
+Benchmark of RoutineScheduler against a SQLite file and celery's in-memory broker.
+
+Run it for one number of routines with
+
+    python tests/benchmarks/scheduler_suite.py 10000
+
+to print the metrics as JSON. test_scheduler_suite.py runs it in a fresh process per size,
+so that the peak RSS is the one of the scheduler alone, and compares it to scheduler_baseline.json.
+"""
+import json
+import math
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from celery import Celery
+from celery.schedules import crontab
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.engine import Engine
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Routine
+
+#: share of the routines that are due at the start of the ticks
+DUE_SHARE = 0.1
+
+
+def synthetic_schedule(n_routines: int) -> dict:
+    """Beat schedule with 'n_routines' routines, half of them intervals and half of them crontabs."""
+    schedule = {}
+    for i in range(n_routines):
+        if i % 2:
+            every = crontab(minute=str(i % 60)) if i % 4 == 1 else crontab(minute=str(i % 60), hour=str(i % 24))
+        else:
+            every = 60 + i % 3600
+        schedule[f"routine {i}"] = {"task": "benchmark.task", "schedule": every, "kwargs": {"i": i}}
+    return schedule
+
+
+def run(n_routines: int) -> dict:
+    """Drive the scheduler through startup, loading, ticking and syncing and return the metrics."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_uri = f"sqlite:///{tmp_dir}/routines.sqlite"
+        # only to prepare the routines, the scheduler creates its own engine in SQLite mode
+        engine = create_engine(db_uri, future=True)
+        app = Celery("benchmark", broker="memory://")
+        app.conf.update(
+            scheduler_db_uri=db_uri,
+            scheduler_sync_every=3600,
+            beat_schedule=synthetic_schedule(n_routines),
+        )
+        queries = []
+        # queries of all engines, only the scheduler runs queries while measuring
+        event.listen(Engine, "before_cursor_execute", lambda *args: queries.append(1))
+        try:
+            return _run(app, engine, queries, n_routines)
+        finally:
+            engine.dispose()
+
+
+def _run(app: Celery, engine, queries: list, n_routines: int) -> dict:
+    scheduler = RoutineScheduler(app=app, lazy=True)
+    metrics = {}
+    start = time.perf_counter()
+    scheduler.merge_inplace(app.conf.beat_schedule)
+    metrics["merge_inplace_s"] = time.perf_counter() - start
+
+    # let some routines be due, as if beat was stopped for two days
+    long_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=2)
+    with engine.begin() as connection:
+        due_names = [f"routine {i}" for i in range(0, n_routines, int(1 / DUE_SHARE))]
+        connection.execute(update(Routine).where(Routine.name.in_(due_names)).values(last_run_at=long_ago))
+
+    start = time.perf_counter()
+    schedule = scheduler.schedule
+    metrics["get_schedule_cold_s"] = time.perf_counter() - start
+    assert len(schedule) == n_routines
+    start = time.perf_counter()
+    scheduler.schedule
+    metrics["get_schedule_warm_s"] = time.perf_counter() - start
+
+    fired = []
+    apply_async = scheduler.apply_async
+
+    def count_apply_async(entry, *args, **kwargs):
+        fired.append(entry.name)
+        return apply_async(entry, *args, **kwargs)
+
+    scheduler.apply_async = count_apply_async
+    scheduler._last_sync = time.monotonic()
+    queries.clear()
+    tick_times = []
+    while len(tick_times) < 10 * len(due_names):
+        start = time.perf_counter()
+        interval = scheduler.tick()
+        tick_times.append(time.perf_counter() - start)
+        if interval > 0:
+            break
+    # crontabs may become due while ticking
+    assert len(fired) >= len(due_names), (len(fired), len(due_names))
+    # time until all due routines are sent
+    metrics["dispatch_s"] = sum(tick_times)
+    tick_times.sort()
+    metrics["ticks"] = len(tick_times)
+    metrics["tick_mean_ms"] = 1000 * sum(tick_times) / len(tick_times)
+    # nearest rank, so that few ticks give the slowest, not the fastest one
+    metrics["tick_p99_ms"] = 1000 * tick_times[math.ceil(0.99 * len(tick_times)) - 1]
+    metrics["tick_max_ms"] = 1000 * tick_times[-1]
+    metrics["queries_per_tick"] = len(queries) / len(tick_times)
+
+    queries.clear()
+    start = time.perf_counter()
+    scheduler.sync()
+    metrics["sync_s"] = time.perf_counter() - start
+    metrics["sync_queries"] = len(queries)
+    scheduler.close()
+    metrics["peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def peak_rss_mb() -> float:
+    """
+    Peak RSS of this process. ru_maxrss is kept across exec on Linux and would be the one of the
+    parent process, so VmHWM of the new process image is preferred.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 if sys.platform != "darwin" else maxrss / 1024 / 1024
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(int(sys.argv[1]))))
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Callable
+
+import pytest
+from celery import Celery
+
+from celery_sqlalchemy_kit.base_task import AsyncTask, stop_event_loop
+
+N_TASKS = 200
+#: Simulated cost of setting up a loop-bound resource like an async connection pool
+SETUP_SECONDS = 0.002
+
+
+class PoolTask(AsyncTask):
+    name = "pool task"
+
+    pools: dict = {}
+    setups: int = 0
+
+    async def execute(self, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        if loop not in self.pools:
+            await asyncio.sleep(SETUP_SECONDS)
+            PoolTask.setups += 1
+            self.pools[loop] = object()
+        await asyncio.sleep(0)
+
+
+@pytest.fixture(scope="function")
+def celery_app() -> Celery:
+    app = Celery("benchmark", broker="memory://", backend="cache+memory://")
+    try:
+        yield app
+    finally:
+        stop_event_loop()
+
+
+def tasks_per_second(task: PoolTask) -> float:
+    start = time.perf_counter()
+    for _ in range(N_TASKS):
+        task.run()
+    return N_TASKS / (time.perf_counter() - start)
+
+
+@pytest.mark.parametrize("persistent_loop", [False, True])
+def test_async_task_loop(celery_app: Celery, persistent_loop: bool, report: Callable[[str], None]) -> None:
+    """
+    Runs N_TASKS async tasks with a loop-bound resource, once with 'asyncio.run' per task
+    and once on the persistent event loop of the worker process.
+    """
+    celery_app.conf.update({"celery_persistent_loop": persistent_loop})
+    # registering binds the task class to the app, so every test needs its own class
+    task = celery_app.register_task(type("PoolTask", (PoolTask,), {})())
+    PoolTask.setups = 0
+    PoolTask.pools = {}
+
+    rate = tasks_per_second(task)
+
+    report(f"persistent loop {persistent_loop}: {rate:.0f} tasks/s, {PoolTask.setups} resource setups")
+    assert PoolTask.setups == (1 if persistent_loop else N_TASKS)
@@ -0,0 +1,84 @@
+import time
+from typing import Callable, List, Tuple
+
+import pytest
+from celery import Celery
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import crud, Base, Routine
+
+N_ROUTINES = 10_000
+
+
+@pytest.fixture(scope="function")
+def scheduler() -> RoutineScheduler:
+    """A scheduler with only what merging needs, on an empty in-memory SQLite DB."""
+    engine = create_engine("sqlite://", future=True, isolation_level="AUTOCOMMIT")
+    Base.metadata.create_all(bind=engine)
+    scheduler = RoutineScheduler.__new__(RoutineScheduler)
+    scheduler.app = Celery("benchmark")
+    scheduler.batch_size = 1000
+    scheduler._session = Session(bind=engine.connect(), expire_on_commit=False)
+    try:
+        yield scheduler
+    finally:
+        scheduler._session.close()
+        engine.dispose()
+
+
+def merge_by_entries(scheduler: RoutineScheduler, celery_task_schedules: dict):
+    """Merge as before: load all routines as schedule entries and insert new ones with the ORM."""
+    db_routines = crud.iter_multiple(db=scheduler._session, batch_size=scheduler.batch_size)
+    db_routines = scheduler.db_routines_to_schedule_entries(db_routines=db_routines)
+    write_to_db = {key: value for key, value in celery_task_schedules.items() if key not in db_routines}
+    crud.create_multiple(db=scheduler._session, routines_in=scheduler.schedule_dict_to_db_routines(write_to_db))
+    scheduler._session.flush()
+
+
+def timed(merge, scheduler, celery_task_schedules) -> Tuple[float, List[str]]:
+    """The duration of the merge and the statements it executed."""
+    statements = []
+
+    def listener(*args):
+        statements.append(args[2])
+
+    event.listen(scheduler._session.get_bind(), "before_cursor_execute", listener)
+    start = time.perf_counter()
+    merge(scheduler, celery_task_schedules)
+    duration = time.perf_counter() - start
+    event.remove(scheduler._session.get_bind(), "before_cursor_execute", listener)
+    return duration, statements
+
+
+def test_merge_startup(scheduler: RoutineScheduler, report: Callable[[str], None]) -> None:
+    """
+    Measures merging N_ROUTINES routines defined in code into the DB on the first start (all new)
+    and on a restart (all existing), before and after merging by name with bulk inserts.
+    """
+    celery_task_schedules = {f"routine {i}": {"task": f"task {i}", "schedule": 60} for i in range(N_ROUTINES)}
+    count = select(func.count(Routine.id))
+
+    (bulk_first, bulk_first_sql), (bulk_restart, bulk_restart_sql) = (
+        timed(RoutineScheduler.merge_inplace, scheduler, celery_task_schedules) for _ in range(2)
+    )
+    assert scheduler._session.execute(count).scalar() == N_ROUTINES
+
+    crud.remove_all(db=scheduler._session)
+    (entries_first, entries_first_sql), (entries_restart, entries_restart_sql) = (
+        timed(merge_by_entries, scheduler, celery_task_schedules) for _ in range(2)
+    )
+    assert scheduler._session.execute(count).scalar() == N_ROUTINES
+
+    report(
+        f"merge {N_ROUTINES} routines on first start / restart: "
+        f"entries and ORM {entries_first:.3f}s / {entries_restart:.3f}s, "
+        f"names and bulk insert {bulk_first:.3f}s / {bulk_restart:.3f}s"
+    )
+    # timings depend on the machine, the round trips do not
+    assert len(bulk_first_sql) == 2 < len(entries_first_sql)
+    # the entries are loaded in keyset-paginated batches, until an empty one
+    assert len(bulk_restart_sql) == 1 < len(entries_restart_sql) == N_ROUTINES // scheduler.batch_size + 1
+    # only the names are loaded on a restart
+    assert "routines.name" in bulk_restart_sql[0] and "routines.schedule" not in bulk_restart_sql[0]
@@ -0,0 +1,55 @@
+import time
+from typing import Callable
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit.db import crud
+
+N_ROUTINES = 20_000
+#: size of the JSON column 'kwargs' of every routine
+KWARGS_BYTES = 4096
+
+
+@pytest.fixture(scope="module")
+def routine_columns() -> Callable[[int], dict]:
+    """Routines with large kwargs."""
+    return lambda i: {"kwargs": {"payload": [i] * (KWARGS_BYTES // 8)}, "options": {"queue": "default"}}
+
+
+def test_reload_without_json_columns(sqlite_session: Session, report: Callable[[str], None]) -> None:
+    """
+    Compares a reload with all columns, comparing content hashes, against a reload without 'kwargs' and 'options',
+    comparing version hashes, as done by the scheduler between full reloads.
+    """
+    start = time.perf_counter()
+    content_hashes = {r.name: r.content_hash for r in crud.iter_multiple(db=sqlite_session, active=True)}
+    load_all = time.perf_counter() - start
+    assert len(content_hashes) == N_ROUTINES
+
+    statements = []
+
+    def listener(*args):
+        statements.append(args[2])
+
+    event.listen(sqlite_session.get_bind(), "before_cursor_execute", listener)
+    start = time.perf_counter()
+    routines = list(crud.iter_multiple(db=sqlite_session, active=True, load_json=False))
+    version_hashes = {r.name: r.version_hash for r in routines}
+    load_narrow = time.perf_counter() - start
+    event.remove(sqlite_session.get_bind(), "before_cursor_execute", listener)
+    assert len(version_hashes) == N_ROUTINES
+    with pytest.raises(InvalidRequestError):
+        routines[0].kwargs
+
+    # timings depend on the machine, the selected columns do not
+    assert statements and not any("routines.kwargs" in s or "routines.options" in s for s in statements)
+    report(f"reload {N_ROUTINES} routines: all columns {load_all:.3f}s, without json {load_narrow:.3f}s")
+
+    # a change made through SQLAlchemy changes the version hash
+    routine = crud.get_multiple(db=sqlite_session, name="routine 0")[0]
+    routine = crud.update(db=sqlite_session, db_obj=routine, obj_in={"kwargs": {"payload": []}})
+    sqlite_session.commit()
+    assert routine.version_hash != version_hashes["routine 0"]
@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Callable
+
+import pytest
+
+SUITE = os.path.join(os.path.dirname(__file__), "scheduler_suite.py")
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "scheduler_baseline.json")
+#: numbers of routines to benchmark, e.g. BENCHMARK_SIZES=1000,10000,100000
+SIZES = [int(size) for size in os.getenv("BENCHMARK_SIZES", "1000,10000").split(",")]
+#: how many times slower than the baseline a timing may be, machines differ
+TOLERANCE = float(os.getenv("BENCHMARK_TOLERANCE", 3))
+#: maximum factor and absolute slack per metric compared to the baseline
+LIMITS = {
+    "merge_inplace_s": (TOLERANCE, 0.1),
+    "get_schedule_cold_s": (TOLERANCE, 0.1),
+    "get_schedule_warm_s": (TOLERANCE, 0.01),
+    "dispatch_s": (TOLERANCE, 0.1),
+    "tick_mean_ms": (TOLERANCE, 1),
+    "tick_p99_ms": (TOLERANCE, 2),
+    "tick_max_ms": (TOLERANCE, 2),
+    "sync_s": (TOLERANCE, 0.1),
+    "queries_per_tick": (1, 0.05),
+    "sync_queries": (1, 0),
+    "peak_rss_mb": (1.5, 20),
+}
+
+
+def run_suite(n_routines: int) -> dict:
+    # a fresh process per size, so that the peak RSS is not the one of former runs
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run(
+        [sys.executable, SUITE, str(n_routines)], check=True, capture_output=True, text=True, env=env
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("n_routines", SIZES)
+def test_scheduler_suite(n_routines: int, report: Callable[[str], None]) -> None:
+    """
+    Runs the scheduler benchmark and fails if a metric regressed compared to scheduler_baseline.json.
+    Set BENCHMARK_UPDATE_BASELINE=1 to store the metrics of this run as new baseline.
+    """
+    metrics = run_suite(n_routines)
+    report(f"{n_routines} routines: " + ", ".join(f"{key} {value:.4g}" for key, value in metrics.items()))
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+    if os.getenv("BENCHMARK_UPDATE_BASELINE", "").lower() in ("1", "true", "yes"):
+        baselines[str(n_routines)] = {key: round(value, 4) for key, value in metrics.items()}
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return
+    baseline = baselines.get(str(n_routines))
+    if baseline is None:
+        pytest.skip(f"No baseline for {n_routines} routines, set BENCHMARK_UPDATE_BASELINE=1 to store one.")
+    regressions = [
+        f"{key}: {metrics[key]:.4g} > {factor} * {baseline[key]:.4g} + {slack}"
+        for key, (factor, slack) in LIMITS.items()
+        if key in baseline and metrics[key] > factor * baseline[key] + slack
+    ]
+    assert not regressions, regressions
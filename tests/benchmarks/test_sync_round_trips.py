@@ -0,0 +1,40 @@
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit.db import crud
+
+N_ROUTINES = 200
+
+
+def count_statements(session: Session) -> list:
+    statements = []
+    event.listen(session.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_sync_round_trips(sqlite_session: Session, report: Callable[[str], None]) -> None:
+    """
+    Compares the number of statements needed to write 'last_run_at' and 'total_run_count' of all routines:
+    one crud.update per routine (UPDATE + SELECT each) against one crud.update_run_stats.
+    """
+    routines = crud.get_multiple(db=sqlite_session)
+    now = datetime.now()
+
+    statements = count_statements(sqlite_session)
+    for routine in routines:
+        crud.update(db=sqlite_session, db_obj=routine, obj_in={"last_run_at": now, "total_run_count": 1})
+    sqlite_session.flush()
+    per_routine = len(statements)
+
+    statements.clear()
+    updates = [{"id": routine.id, "last_run_at": now, "total_run_count": 2} for routine in routines]
+    crud.update_run_stats(db=sqlite_session, updates=updates)
+    batched = len(statements)
+
+    report(f"statements per sync of {N_ROUTINES} routines: per routine {per_routine}, batched {batched}")
+    assert per_routine == 2 * N_ROUTINES
+    assert batched == 1
+    assert all(routine.total_run_count == 2 for routine in crud.get_multiple(db=sqlite_session))
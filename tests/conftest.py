@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from celery.beat import Scheduler
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit.db import Base, Routine, crud
+
+
+@pytest.fixture
+def due_routines(tmp_path) -> str:
+    """URI of a SQLite DB with three routines, that are due."""
+    db_uri = f"sqlite:///{tmp_path / 'routines.sqlite'}"
+    engine = create_engine(db_uri, future=True)
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as session:
+        last_run_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+        crud.create_multiple(
+            db=session,
+            routines_in=[
+                Routine(name=f"routine {i}", task="test", schedule={"timedelta": 60}, last_run_at=last_run_at)
+                for i in range(3)
+            ],
+        )
+        session.commit()
+    engine.dispose()
+    return db_uri
+
+
+@pytest.fixture
+def sent(monkeypatch) -> list:
+    """Names of the entries sent by any scheduler."""
+    sent = []
+    monkeypatch.setattr(Scheduler, "apply_entry", lambda self, entry, producer=None: sent.append(entry.name))
+    return sent
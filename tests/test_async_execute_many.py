@@ -0,0 +1,48 @@
+import asyncio
+
+from celery import Celery
+
+from celery_sqlalchemy_kit import AsyncTask
+
+
+class FanOutTask(AsyncTask):
+    name = "fan out"
+    concurrency = 3
+    item_timeout = 0.5
+
+    async def execute(self, *args, **kwargs):
+        pass
+
+
+def test_execute_many_limits_concurrency_and_reports_partial_results() -> None:
+    """
+    Runs items with one failing and one timing out item and checks the concurrency limit and partial results.
+    """
+    app = Celery("fan-out", broker="memory://", backend="cache+memory://")
+    task = app.register_task(FanOutTask())
+    running, peak = 0, 0
+
+    async def process(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            await asyncio.sleep(5 if item == 7 else 0.01)
+            if item == 3:
+                raise ValueError("bad item")
+            return item * 2
+        finally:
+            running -= 1
+
+    result = task.run_coroutine(task.execute_many(process, (i for i in range(10))))
+
+    assert peak == 3
+    assert not result.ok
+    assert set(result.errors) == {3, 7}
+    assert isinstance(result.errors[3], ValueError)
+    assert isinstance(result.errors[7], asyncio.TimeoutError)
+    assert result.results == [0, 2, 4, None, 8, 10, 12, None, 16, 18]
+
+    # an explicit timeout of 0 is not 'no timeout'
+    result = task.run_coroutine(task.execute_many(process, [1], timeout=0))
+    assert isinstance(result.errors[0], asyncio.TimeoutError)
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+from celery import Celery, current_task
+from sqlalchemy import create_engine, text
+
+from celery_sqlalchemy_kit import AsyncTask
+from celery_sqlalchemy_kit.base_task import get_async_db, run_in_event_loop, stop_event_loop
+
+
+@pytest.mark.parametrize("persistent_loop", [True, False])
+def test_request_in_execute(persistent_loop: bool) -> None:
+    """'self.request' and 'current_task' are the ones of the run in 'execute' and its items, on every event loop."""
+    app = Celery("async-task", broker="memory://", backend="cache+memory://")
+    app.conf.update(celery_persistent_loop=persistent_loop)
+    seen = []
+
+    # task classes are bound to the app of their first instance
+    class RequestTask(AsyncTask):
+        name = "request"
+
+        async def execute(self, *args, **kwargs):
+            seen.append((self.request.id, current_task.name if current_task else None))
+
+            async def item(_):
+                await asyncio.sleep(0.01)
+                seen.append((self.request.id, current_task.name if current_task else None))
+
+            await asyncio.sleep(0.01)
+            await self.execute_many(item, range(2))
+            seen.append((self.request.id, current_task.name if current_task else None))
+
+    app.set_current()
+    task = app.register_task(RequestTask())
+    assert task.persistent_loop is persistent_loop
+    task.apply(task_id="run-1").get()
+    assert seen == [("run-1", "request")] * 4
+
+
+@pytest.mark.parametrize("persistent_loop", [True, False])
+def test_async_session_commits_or_rolls_back(tmp_path, persistent_loop: bool) -> None:
+    """The session passed to 'execute' is committed if it returns and rolled back if it raises."""
+    pytest.importorskip("aiosqlite")
+    db_file = tmp_path / "db.sqlite"
+    engine = create_engine(f"sqlite:///{db_file}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE items (name VARCHAR PRIMARY KEY)"))
+    app = Celery("async-session", broker="memory://", backend="cache+memory://")
+    app.conf.update(
+        celery_persistent_loop=persistent_loop, worker_async_db_uri=f"sqlite+aiosqlite:///{db_file}",
+        celery_max_retry=0,
+    )
+
+    class InsertTask(AsyncTask):
+        name = "insert"
+        use_async_session = True
+
+        async def execute(self, name, fail=False, session=None):
+            await session.execute(text("INSERT INTO items (name) VALUES (:name)"), {"name": name})
+            if fail:
+                raise ValueError("failed")
+
+    app.set_current()
+    task = app.register_task(InsertTask())
+    try:
+        assert task.apply(("kept",)).successful()
+        assert task.apply(("rolled back",), {"fail": True}).failed()
+    finally:
+        stop_event_loop()
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT name FROM items")).scalars().all() == ["kept"]
+    engine.dispose()
+
+
+def test_async_dbs_by_uri_and_event_loop(tmp_path) -> None:
+    """Async DBs are shared by URI and pool settings on one event loop and created again on a new loop."""
+    pytest.importorskip("aiosqlite")
+    uris = [f"sqlite+aiosqlite:///{tmp_path / name}" for name in ("a.sqlite", "b.sqlite")]
+
+    async def get(uri):
+        return get_async_db(uri, 1, 0)
+
+    try:
+        a, b, a_again = (run_in_event_loop(get(uri)) for uri in (uris[0], uris[1], uris[0]))
+        assert a is a_again and a is not b
+        assert str(b.engine.url) == uris[1]
+        stop_event_loop()
+        assert run_in_event_loop(get(uris[0])) is not a
+    finally:
+        stop_event_loop()
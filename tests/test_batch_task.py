@@ -0,0 +1,160 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from celery import Celery, states
+from celery.worker.state import revoked
+
+from celery_sqlalchemy_kit import BatchTask, BatchItem
+
+
+class DoubleTask(BatchTask):
+    name = "double"
+
+    def run_batch(self, items):
+        return [ValueError("negative") if item.args[0] < 0 else item.args[0] * 2 for item in items]
+
+
+def test_batch_task_maps_results_and_retries_failed_items() -> None:
+    """
+    Runs one batch and checks that every item gets its own result and only failed items are sent again.
+    """
+    app = Celery("batch", broker="memory://", backend="cache+memory://")
+    app.conf.update({"celery_max_retry": 1})
+    task = app.register_task(DoubleTask())
+    sent = []
+    task.apply_async = lambda *args, **kwargs: sent.append((args, kwargs))
+
+    items = [BatchItem(id="a", args=(1,), kwargs={}), BatchItem(id="b", args=(-1,), kwargs={})]
+    task.apply_batch(items)
+
+    assert task.backend.get_state("a") == states.SUCCESS
+    assert task.backend.get_result("a") == 2
+    assert task.backend.get_state("b") == states.RETRY
+    assert sent == [(((-1,), {}), {"task_id": "b", "retries": 1, "countdown": task.retry_delay})]
+
+    # last retry fails for good
+    task.apply_batch([BatchItem(id="b", args=(-1,), kwargs={}, retries=1)])
+    assert task.backend.get_state("b") == states.FAILURE
+    assert len(sent) == 1
+
+
+class FakeConsumer:
+    """Records what the strategy does with the pool, timer and QoS of the worker."""
+
+    connection_errors = ()
+
+    def __init__(self):
+        self.batches = []
+        self.repeated = []
+        self.scheduled = []
+        self.prefetch = 0
+        self.pool = self
+        self.timer = self
+        self.qos = self
+
+    def apply_async(self, target, args, accept_callback, callback):
+        self.batches.append((args[1], accept_callback, callback))
+
+    def call_repeatedly(self, interval, fun):
+        self.repeated.append((interval, fun))
+
+    def call_at(self, eta, fun, args, priority):
+        self.scheduled.append((eta, fun, args))
+
+    def increment_eventually(self):
+        self.prefetch += 1
+
+    def decrement_eventually(self):
+        self.prefetch -= 1
+
+
+class FakeMessage:
+    def __init__(self, task_id: str, value: int, acks: list, **headers):
+        self.headers = {"id": task_id, "task": "double", **headers}
+        self.payload = ((value,), {}, {})
+        self.body = json.dumps(self.payload).encode()
+        self.ack = lambda *args: acks.append(task_id)
+
+
+def receive(handler, message: FakeMessage):
+    handler(message, message.body, message.ack, None, [])
+
+
+def test_batch_strategy_buffers_messages() -> None:
+    """
+    The worker strategy buffers messages until 'flush_every' calls, 'max_batch_bytes' or 'flush_interval',
+    acknowledges them when the batch is started, delays calls with eta and discards revoked and expired ones.
+    """
+    app = Celery("batch-strategy", broker="memory://", backend="cache+memory://")
+    task = app.register_task(DoubleTask())
+    task.flush_every = 3
+    task.flush_interval = 5
+    consumer = FakeConsumer()
+    handler = task.Strategy(task, app, consumer)
+    (interval, flush), = consumer.repeated
+    assert interval == 5
+    acks = []
+
+    # by count, acknowledged when the batch is accepted by the pool
+    for i in range(3):
+        receive(handler, FakeMessage(f"count-{i}", i, acks))
+    (items, accepted, returned), = consumer.batches
+    assert [item.id for item in items] == ["count-0", "count-1", "count-2"]
+    assert items[1] == BatchItem(id="count-1", args=(1,), kwargs={}, retries=0)
+    assert acks == []
+    accepted()
+    assert acks == ["count-0", "count-1", "count-2"]
+
+    # by interval
+    acks.clear()
+    receive(handler, FakeMessage("interval", 1, acks))
+    assert len(consumer.batches) == 1
+    flush()
+    assert [item.id for item in consumer.batches[-1][0]] == ["interval"]
+
+    # by size
+    task.max_batch_bytes = 2 * len(FakeMessage("size-0", 1, acks).body)
+    receive(handler, FakeMessage("size-0", 1, acks))
+    receive(handler, FakeMessage("size-1", 1, acks))
+    assert [item.id for item in consumer.batches[-1][0]] == ["size-0", "size-1"]
+    task.max_batch_bytes = None
+
+    # calls with eta are buffered when due
+    eta = datetime.now(timezone.utc) + timedelta(seconds=10)
+    receive(handler, FakeMessage("eta", 1, acks, eta=eta.isoformat(), retries=2))
+    (scheduled_eta, put, args), = consumer.scheduled
+    assert scheduled_eta == eta and consumer.prefetch == 1
+    put(*args)
+    assert consumer.prefetch == 0
+    flush()
+    assert consumer.batches[-1][0] == [BatchItem(id="eta", args=(1,), kwargs={}, retries=2)]
+
+    # revoked and expired calls are acknowledged and not run, when received or while buffered
+    acks.clear()
+    batches = len(consumer.batches)
+    revoked.add("revoked")
+    try:
+        receive(handler, FakeMessage("revoked", 1, acks))
+        past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+        receive(handler, FakeMessage("expired", 1, acks, expires=past))
+        receive(handler, FakeMessage("revoked-later", 1, acks))
+        revoked.add("revoked-later")
+        flush()
+    finally:
+        revoked.discard("revoked")
+        revoked.discard("revoked-later")
+    assert acks == ["revoked", "expired", "revoked-later"]
+    assert len(consumer.batches) == batches
+    for task_id in acks:
+        assert task.backend.get_state(task_id) == states.REVOKED
+
+    # with acks_late, messages are acknowledged when the batch returned
+    task.acks_late = True
+    acks.clear()
+    for i in range(3):
+        receive(handler, FakeMessage(f"late-{i}", i, acks))
+    _, accepted, returned = consumer.batches[-1]
+    accepted()
+    assert acks == []
+    returned()
+    assert acks == ["late-0", "late-1", "late-2"]
@@ -0,0 +1,131 @@
+import os
+from datetime import datetime
+
+import pytest
+from celery import Celery
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Base, Routine, SessionWrapper, crud
+
+
+def make_scheduler(db_uri: str) -> RoutineScheduler:
+    app = Celery("claim-on-fire", broker="memory://")
+    app.conf.update(scheduler_db_uri=db_uri, scheduler_claim_on_fire=True)
+    return RoutineScheduler(app=app, lazy=True)
+
+
+def test_run_of_a_routine_can_only_be_claimed_once(tmp_path) -> None:
+    """
+    Two schedulers claim the same run of a routine: only the first claim succeeds,
+    the second one gets the run stats written by the first.
+    """
+    db_uri = os.getenv("SCHEDULER_DB_URI") or f"sqlite:///{tmp_path / 'routines.sqlite'}"
+    engine = create_engine(db_uri, future=True, isolation_level="AUTOCOMMIT")
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+    session = Session(bind=engine.connect(), expire_on_commit=False)
+    routine = Routine(name=f"claim test {os.getpid()}", task="claim test", schedule={"timedelta": 10})
+    crud.create(db=session, routine_in=routine)
+    session.flush()
+    try:
+        run_at = datetime(2030, 1, 1, 12)
+        claim = {"id": routine.id, "last_run_at": run_at, "total_run_count": 1, "expected_run_count": 0}
+        assert crud.claim_runs(db=session, claims=[claim]) == {routine.id}
+        assert crud.claim_runs(db=session, claims=[dict(claim, last_run_at=datetime(2030, 1, 1, 13))]) == set()
+        assert crud.get_run_stats(db=session, ids=[routine.id]) == {routine.id: (run_at, 1)}
+    finally:
+        crud.remove_by_name(db=session, names=[routine.name])
+        session.close()
+        engine.dispose()
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_runs_are_claimed_in_one_statement(tmp_path, update_returning: bool) -> None:
+    """
+    Without PostgreSQL, all runs are claimed with one UPDATE, returning the claimed ids where supported,
+    otherwise the run stats are only read again if not all claims succeeded.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'routines.sqlite'}", future=True, isolation_level="AUTOCOMMIT")
+    engine.dialect.update_returning = update_returning
+    Base.metadata.create_all(bind=engine)
+    session, other_session = (Session(bind=engine.connect(), expire_on_commit=False) for _ in range(2))
+    routines = [Routine(name=f"routine {i}", task="claim test", schedule={"timedelta": 10}) for i in range(3)]
+    crud.create_multiple(db=session, routines_in=routines)
+    session.flush()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    try:
+        run_at = datetime(2030, 1, 1, 12, 0, 0, 500)
+        claims = [
+            {"id": routine.id, "last_run_at": run_at, "total_run_count": 1, "expected_run_count": 0}
+            for routine in routines
+        ]
+        assert crud.claim_runs(db=session, claims=claims[:2]) == {routines[0].id, routines[1].id}
+        assert len(statements) == 1
+
+        statements.clear()
+        other_claims = [dict(claim, last_run_at=datetime(2030, 1, 1, 12, 0, 1)) for claim in claims[1:]]
+        assert crud.claim_runs(db=other_session, claims=other_claims) == {routines[2].id}
+        assert len(statements) == (1 if update_returning else 2)
+        assert crud.get_run_stats(db=session, ids=[routines[1].id]) == {routines[1].id: (run_at, 1)}
+    finally:
+        session.close()
+        other_session.close()
+        engine.dispose()
+
+
+@pytest.mark.parametrize("update_returning", [True, False])
+def test_schedulers_send_every_run_once(due_routines: str, sent: list, update_returning: bool) -> None:
+    """
+    Two schedulers on one DB tick with the same due routines: the first one claims and sends them,
+    the second one loses the claims, sends nothing and continues from the run stats written by the first.
+    """
+    schedulers = [make_scheduler(due_routines) for _ in range(2)]
+    try:
+        for scheduler in schedulers:
+            scheduler._task_db.engine.dialect.update_returning = update_returning
+            scheduler.get_schedule()
+        assert schedulers[0].tick() == 0
+        assert sorted(sent) == ["routine 0", "routine 1", "routine 2"]
+        assert schedulers[1].tick() == 0
+        assert sorted(sent) == ["routine 0", "routine 1", "routine 2"]
+
+        for scheduler in schedulers:
+            assert scheduler.tick() > 0
+            for entry in scheduler.schedule.values():
+                assert entry.total_run_count == 1 and not entry.is_due()[0]
+        assert len(sent) == 3
+    finally:
+        for scheduler in schedulers:
+            scheduler.close()
+
+
+def test_due_routines_are_claimed_again_after_a_db_error(due_routines: str, sent: list, monkeypatch) -> None:
+    """
+    Nothing is sent while the DB is degraded. If claiming fails, the due events are pushed back to the heap,
+    the session is renewed and the routines are claimed and sent on the next tick.
+    """
+    scheduler = make_scheduler(due_routines)
+    try:
+        scheduler.get_schedule()
+        with monkeypatch.context() as patch:
+            patch.setattr(SessionWrapper, "degraded", property(lambda self: True))
+            assert 0 < scheduler.tick() <= 1
+        assert sent == [] and len(scheduler._heap) == 3
+
+        def claim_runs(**kwargs):
+            raise OperationalError("UPDATE routines", {}, ConnectionError("db down"))
+
+        renewals = []
+        with monkeypatch.context() as patch:
+            patch.setattr(crud, "claim_runs", claim_runs)
+            patch.setattr(scheduler._task_db, "renew", lambda: renewals.append(1))
+            assert scheduler.tick() == 0
+        assert sent == [] and renewals == [1] and len(scheduler._heap) == 3
+
+        assert scheduler.tick() == 0
+        assert sorted(sent) == ["routine 0", "routine 1", "routine 2"]
+    finally:
+        scheduler.close()
@@ -0,0 +1,75 @@
+import os
+import time
+
+import pytest
+from celery import Celery
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Base, SessionWrapper, LeaseLostError, crud
+
+
+def make_scheduler(db_uri: str) -> RoutineScheduler:
+    app = Celery("leader-lease", broker="memory://")
+    app.conf.update(scheduler_db_uri=db_uri, scheduler_leader_election=True, scheduler_lease_ttl=30)
+    return RoutineScheduler(app=app, lazy=True)
+
+
+def test_lease_changes_hands_only_after_expiry_and_fences_former_holder(tmp_path) -> None:
+    """
+    Two holders compete for one lease. The lease can only be taken over after it expired or was released,
+    and a former holder cannot write with its old fencing token anymore.
+    """
+    db = SessionWrapper(os.getenv("SCHEDULER_DB_URI") or f"sqlite:///{tmp_path / 'leases.sqlite'}")
+    Base.metadata.create_all(bind=db.engine, checkfirst=True)
+    name = f"test-{os.getpid()}"
+    try:
+        token_a = db.acquire_lease(name, "a", ttl=1)
+        assert token_a is not None
+        assert db.acquire_lease(name, "b", ttl=1) is None
+        assert db.acquire_lease(name, "a", ttl=1) == token_a
+
+        time.sleep(1.5)
+        token_b = db.acquire_lease(name, "b", ttl=30)
+        assert token_b == token_a + 1
+        assert db.acquire_lease(name, "a", ttl=30) is None
+
+        with pytest.raises(LeaseLostError):
+            with db.fenced_session(name, "a", token_a):
+                pass
+        with db.fenced_session(name, "b", token_b):
+            pass
+
+        db.release_lease(name, "b")
+        assert db.acquire_lease(name, "a", ttl=30) == token_b + 1
+    finally:
+        db.release_lease(name, "a")
+        db.close()
+
+
+def test_only_the_leader_sends_and_syncs(due_routines: str, sent: list) -> None:
+    """
+    A standby instance sends no tasks. The run stats of a leader that lost its lease are not written,
+    since the new leader may have sent and synced the same routines meanwhile.
+    """
+    leader, standby = make_scheduler(due_routines), make_scheduler(due_routines)
+    engine = create_engine(due_routines, future=True)
+    try:
+        assert leader.tick() == 0
+        assert sorted(sent) == ["routine 0", "routine 1", "routine 2"]
+        assert standby.tick() == standby.lease_ttl / 3
+        assert len(sent) == 3
+
+        # the lease expired, e.g. while the leader was blocked, and the standby took over
+        standby._task_db.release_lease(leader.lease_name, leader._lease_holder)
+        standby._lease_checked = None
+        assert standby.is_leader()
+        leader.sync()
+        assert leader._lease_token is None and not leader._to_be_updated
+        with Session(bind=engine) as session:
+            assert {routine.total_run_count for routine in crud.get_multiple(db=session)} == {0}
+    finally:
+        leader.close()
+        standby.close()
+        engine.dispose()
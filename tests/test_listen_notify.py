@@ -0,0 +1,79 @@
+import os
+import time
+
+import pytest
+from celery import Celery
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Base, Routine, crud, notify_trigger_installed
+from celery_sqlalchemy_kit.db.notify import drop_notify_trigger
+
+
+def make_scheduler(db_uri: str, **conf) -> RoutineScheduler:
+    app = Celery("listen-notify", broker="memory://")
+    app.conf.update(scheduler_db_uri=db_uri, scheduler_listen_notify=True, **conf)
+    return RoutineScheduler(app=app, lazy=True)
+
+
+def test_listen_notify_falls_back_to_polling_without_postgresql(tmp_path) -> None:
+    """Without PostgreSQL there is no trigger, the scheduler polls for changes."""
+    scheduler = make_scheduler(f"sqlite:///{tmp_path / 'routines.sqlite'}")
+    try:
+        assert not scheduler.listen_notify
+        assert scheduler.get_schedule() == {}
+    finally:
+        scheduler.close()
+
+
+@pytest.mark.skipif(
+    not os.getenv("SCHEDULER_DB_URI") or make_url(os.getenv("SCHEDULER_DB_URI")).get_backend_name() != "postgresql",
+    reason="needs PostgreSQL (SCHEDULER_DB_URI)",
+)
+def test_listen_notify_reloads_notified_routines(monkeypatch) -> None:
+    """
+    The trigger is only installed in listen mode, the scheduler polls for changes if it is missing.
+    With the trigger, only the notified routines are reloaded, without probing the table for changes.
+    """
+    db_uri = os.getenv("SCHEDULER_DB_URI")
+    engine = create_engine(db_uri, future=True, isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        Base.metadata.create_all(bind=connection, checkfirst=True)
+        connection.execute(drop_notify_trigger)
+        Base.metadata.create_all(bind=connection, checkfirst=True)
+        assert not notify_trigger_installed(connection)
+
+    scheduler = make_scheduler(db_uri, create_table=False)
+    try:
+        assert not scheduler.listen_notify
+    finally:
+        scheduler.close()
+
+    session = Session(bind=engine.connect(), expire_on_commit=False)
+    name = f"notify test {os.getpid()}"
+    scheduler = make_scheduler(db_uri)
+    try:
+        assert scheduler.listen_notify
+        with engine.connect() as connection:
+            assert notify_trigger_installed(connection)
+        assert name not in scheduler.get_schedule()
+
+        loads, revisions = [], []
+        load_schedule, get_revision = scheduler._load_schedule, crud.get_revision
+        monkeypatch.setattr(scheduler, "_load_schedule", lambda names=None: loads.append(names) or load_schedule(names))
+        monkeypatch.setattr(crud, "get_revision", lambda **kwargs: revisions.append(1) or get_revision(**kwargs))
+        crud.create(db=session, routine_in=Routine(name=name, task="notify test", schedule={"timedelta": 10}))
+        session.flush()
+        for _ in range(50):
+            if name in scheduler.get_schedule():
+                break
+            time.sleep(0.1)
+        assert name in scheduler.get_schedule()
+        assert loads == [{name}] and revisions == []
+    finally:
+        crud.remove_by_name(db=session, names=[name])
+        session.close()
+        scheduler.close()
+        engine.dispose()
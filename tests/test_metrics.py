@@ -0,0 +1,104 @@
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from celery import Celery
+from sqlalchemy import update
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Routine
+from celery_sqlalchemy_kit.metrics import Metrics, METRICS
+
+
+class RecordingMetrics(Metrics):
+    def __init__(self):
+        self.values = defaultdict(list)
+
+    def observe(self, name: str, value: float, **labels: str):
+        self.values[name].append((value, labels))
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        self.values[name].append((value, labels))
+
+    def set(self, name: str, value: float, **labels: str):
+        self.values[name].append((value, labels))
+
+
+def make_scheduler(tmp_path, metrics, overdue=("routine 0",), **conf) -> RoutineScheduler:
+    app = Celery("metrics", broker="memory://")
+    app.conf.update(
+        scheduler_db_uri=f"sqlite:///{tmp_path / 'routines.sqlite'}",
+        scheduler_metrics=metrics,
+        beat_schedule={f"routine {i}": {"task": "metrics.task", "schedule": 3600} for i in range(3)},
+        **conf,
+    )
+    scheduler = RoutineScheduler(app=app, lazy=True)
+    scheduler.merge_inplace(app.conf.beat_schedule)
+    # overdue by two hours
+    with scheduler._task_db.engine.connect() as connection:
+        long_ago = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=3)
+        connection.execute(update(Routine).where(Routine.name.in_(overdue)).values(last_run_at=long_ago))
+    # no sync on first tick
+    scheduler._last_sync = time.monotonic()
+    return scheduler
+
+
+def test_scheduler_exports_hot_path_metrics(tmp_path) -> None:
+    """Ticks, reloads, dispatches and syncs are exported to the configured exporter, with METRICS' names."""
+    metrics = RecordingMetrics()
+    scheduler = make_scheduler(tmp_path, metrics)
+    try:
+        while scheduler.tick() == 0:
+            pass
+        assert [labels for _, labels in metrics.values["dispatch_lateness_seconds"]] == [
+            {"task": "metrics.task", "routine": "routine 0"}
+        ]
+        lateness = metrics.values["dispatch_lateness_seconds"][0][0]
+        assert 2 * 3600 - 60 < lateness < 2 * 3600 + 60
+        assert metrics.values["schedule_load_rows"][0][0] == 3
+        # rows read by the reload, not the size of the schedule, e.g. when notified about one routine
+        scheduler._load_schedule(names={"routine 1"})
+        assert metrics.values["schedule_load_rows"][-1][0] == 1 and len(scheduler.schedule) == 3
+        assert metrics.values["sync_backlog"][-1][0] == 1
+        scheduler.sync()
+        assert metrics.values["sync_batch_size"] == [(1, {})]
+    finally:
+        scheduler.close()
+    assert metrics.values.keys() - METRICS.keys() == set()
+    for name in ("tick_duration_seconds", "schedule_load_duration_seconds", "pool_checkout_seconds",
+                 "sync_duration_seconds"):
+        assert metrics.values[name], name
+
+
+def test_due_routines_are_sent_in_one_tick(tmp_path) -> None:
+    """All due routines are sent in one tick, in batches of at most 'scheduler_publish_batch_size'."""
+    metrics = RecordingMetrics()
+    overdue = [f"routine {i}" for i in range(3)]
+    scheduler = make_scheduler(tmp_path, metrics, overdue=overdue, scheduler_publish_batch_size=2)
+    try:
+        assert scheduler.tick() == 0
+        assert scheduler.tick() == 0
+        assert scheduler.tick() > 0
+    finally:
+        scheduler.close()
+    assert [size for size, _ in metrics.values["publish_batch_size"]] == [2, 1]
+    assert len(metrics.values["publish_batch_duration_seconds"]) == 2
+    assert sorted(labels["routine"] for _, labels in metrics.values["dispatch_lateness_seconds"]) == overdue
+
+
+def test_prometheus_metrics(tmp_path) -> None:
+    """The Prometheus exporter registers all metrics and drops the routine label, unless 'per_routine' is set."""
+    prometheus_client = pytest.importorskip("prometheus_client")
+    from celery_sqlalchemy_kit.metrics import PrometheusMetrics
+
+    registry = prometheus_client.CollectorRegistry()
+    scheduler = make_scheduler(tmp_path, PrometheusMetrics(registry=registry))
+    try:
+        while scheduler.tick() == 0:
+            pass
+    finally:
+        scheduler.close()
+    assert registry.get_sample_value("celery_beat_dispatch_lateness_seconds_count", {"task": "metrics.task"}) == 1
+    assert registry.get_sample_value("celery_beat_tick_duration_seconds_count") >= 1
+    assert registry.get_sample_value("celery_beat_db_renews_total") == 0
@@ -0,0 +1,36 @@
+import os
+import time
+
+from sqlalchemy import create_engine, text
+
+from celery_sqlalchemy_kit.db import SessionWrapper
+
+
+def test_renew_reconnects_in_the_background(tmp_path) -> None:
+    """
+    Renewing the session after the DB became unavailable does not block. The wrapper is degraded
+    until the DB is reachable again and then provides a new session.
+    """
+    db = SessionWrapper(os.getenv("SCHEDULER_DB_URI") or f"sqlite:///{tmp_path / 'routines.sqlite'}")
+    engine = db.engine
+    try:
+        # an engine that cannot connect stands in for the unavailable DB
+        db.engine = create_engine("sqlite:////nonexistent/dir/db.sqlite")
+        start = time.monotonic()
+        db.renew()
+        assert time.monotonic() - start < 1
+        assert db.degraded
+
+        time.sleep(1.5)
+        assert db.degraded and db.db_tries >= 1
+
+        db.engine = engine
+        for _ in range(50):
+            if not db.degraded:
+                break
+            time.sleep(0.1)
+        assert not db.degraded
+        assert db.session.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        db.engine = engine
+        db.close()
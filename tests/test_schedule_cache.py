@@ -0,0 +1,174 @@
+import json
+import time
+from datetime import datetime
+
+from celery import Celery
+from celery.beat import ScheduleEntry
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Routine, crud, schedule_cache_info
+from celery_sqlalchemy_kit.db.model import SCHEDULE_CACHE_SIZE, compile_schedule
+
+
+def make_scheduler(tmp_path, **conf) -> RoutineScheduler:
+    app = Celery("schedule-cache", broker="memory://")
+    app.conf.update(
+        scheduler_db_uri=f"sqlite:///{tmp_path / 'routines.sqlite'}",
+        beat_schedule={f"routine {i}": {"task": "cache.task", "schedule": 60} for i in range(3)},
+        **conf,
+    )
+    scheduler = RoutineScheduler(app=app, lazy=True)
+    scheduler.merge_inplace(app.conf.beat_schedule)
+    return scheduler
+
+
+def test_schedule_is_only_reloaded_if_the_table_changed(tmp_path, monkeypatch) -> None:
+    """
+    The schedule is cached and only reloaded, if the number of routines or the latest 'updated_at' changed,
+    e.g. by an insert, delete or update of another client. Written run stats are no change.
+    """
+    scheduler = make_scheduler(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'routines.sqlite'}", future=True)
+    session = Session(bind=engine, expire_on_commit=False)
+    loads = []
+    load_schedule = scheduler._load_schedule
+    monkeypatch.setattr(scheduler, "_load_schedule", lambda names=None: loads.append(names) or load_schedule(names))
+    try:
+        schedule = scheduler.get_schedule()
+        assert sorted(schedule) == ["routine 0", "routine 1", "routine 2"]
+        assert scheduler.get_schedule() is schedule
+        assert len(loads) == 1
+
+        routine = crud.find_by_name(db=session, name="routine 0")
+        run_stats = {"id": routine.id, "last_run_at": datetime(2024, 1, 1), "total_run_count": 5}
+        crud.update_run_stats(db=session, updates=[run_stats])
+        session.commit()
+        assert scheduler.get_schedule() is schedule
+        assert len(loads) == 1
+
+        crud.create(db=session, routine_in=Routine(name="new", task="cache.task", schedule={"timedelta": 30}))
+        session.commit()
+        assert "new" in scheduler.get_schedule()
+        assert len(loads) == 2
+
+        routine = crud.find_by_name(db=session, name="new")
+        crud.update(db=session, db_obj=routine, obj_in={"schedule": {"timedelta": 10}})
+        session.commit()
+        assert scheduler.get_schedule()["new"].schedule.run_every.total_seconds() == 10
+        assert len(loads) == 3
+
+        crud.remove_by_name(db=session, names=["routine 1"])
+        session.commit()
+        assert "routine 1" not in scheduler.get_schedule()
+        assert len(loads) == 4
+        scheduler.get_schedule()
+        assert len(loads) == 4
+    finally:
+        session.close()
+        engine.dispose()
+        scheduler.close()
+
+
+def test_heap_is_patched_with_changed_routines(tmp_path) -> None:
+    """
+    After a reload, only events of changed routines are pushed to the heap. Events of unchanged routines
+    keep their identity and position, events of changed and removed routines are skipped when popped.
+    """
+    scheduler = make_scheduler(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'routines.sqlite'}", future=True)
+    session = Session(bind=engine, expire_on_commit=False)
+    try:
+        for i in range(3, 50):
+            routine = Routine(name=f"routine {i}", task="cache.task", schedule={"timedelta": 60 + i})
+            crud.create(db=session, routine_in=routine)
+        session.commit()
+        assert scheduler.tick() > 0
+        heap = scheduler._heap
+        events = dict(scheduler._heap_events)
+        positions = {name: heap.index(event) for name, event in events.items()}
+        assert len(heap) == 50
+
+        # scheduled later than all others, so pushing them moves no other event
+        routine = crud.find_by_name(db=session, name="routine 7")
+        crud.update(db=session, db_obj=routine, obj_in={"schedule": {"timedelta": 1000}})
+        crud.create(db=session, routine_in=Routine(name="new", task="cache.task", schedule={"timedelta": 2000}))
+        crud.remove_by_name(db=session, names=["routine 8"])
+        session.commit()
+        assert scheduler.tick() > 0
+
+        assert scheduler._heap is heap
+        assert len(heap) == 52
+        assert scheduler._heap_events.keys() == events.keys() - {"routine 8"} | {"new"}
+        for name, event in events.items():
+            if name not in ("routine 7", "routine 8"):
+                assert scheduler._heap_events[name] is event
+                assert heap.index(event) == positions[name]
+        assert scheduler._heap_events["routine 7"] is not events["routine 7"]
+        assert scheduler._heap_events["routine 7"][2].schedule.run_every.total_seconds() == 1000
+
+        scheduler.is_due = lambda entry: (True, 60)
+        due, _ = scheduler._pop_due(heap)
+        assert sorted(event[2].name for event, _ in due) == sorted(scheduler._heap_events)
+        assert heap == []
+    finally:
+        session.close()
+        engine.dispose()
+        scheduler.close()
+
+
+def test_compiled_schedules_are_shared_per_app_and_evicted() -> None:
+    """
+    Routines with the same schedule share one crontab per app, which entries of the app do not change.
+    The least recently used schedules are evicted, when more than SCHEDULE_CACHE_SIZE are compiled.
+    """
+    app, other_app = Celery("schedules"), Celery("other schedules")
+    compile_schedule.cache_clear()
+    a = Routine(name="a", task="t", schedule={"minute": "5", "hour": "1"})
+    b = Routine(name="b", task="t", schedule={"hour": "1", "minute": "5"})
+    crontab = a.schedule_for(app)
+    assert b.schedule_for(app) is crontab
+    assert schedule_cache_info().hits == 1
+    other_crontab = b.schedule_for(other_app)
+    assert other_crontab is not crontab and other_crontab == crontab
+
+    entries = [ScheduleEntry(name=name, task="t", schedule=a.schedule_for(app), app=app) for name in "xy"]
+    ScheduleEntry(name="z", task="t", schedule=b.schedule_for(other_app), app=other_app)
+    assert entries[0].schedule is entries[1].schedule is crontab
+    assert crontab.app is app and other_crontab.app is other_app
+
+    for i in range(SCHEDULE_CACHE_SIZE):
+        compile_schedule(json.dumps({"minute": str(i % 60), "hour": str(i // 60)}), app)
+    assert schedule_cache_info().currsize == SCHEDULE_CACHE_SIZE
+    misses = schedule_cache_info().misses
+    # used least recently, so compiled again
+    assert a.schedule_for(app) is not crontab
+    assert schedule_cache_info().misses == misses + 1
+
+
+def test_never_run_routine_is_due_at_its_next_run_when_back_in_the_window(tmp_path) -> None:
+    """
+    With 'scheduler_lookahead', routines leave the schedule until their 'next_run_at' is within the window.
+    A routine that never ran is then due at its stored 'next_run_at', not a full interval later.
+    """
+    scheduler = make_scheduler(tmp_path, scheduler_lookahead=1)
+    engine = create_engine(f"sqlite:///{tmp_path / 'routines.sqlite'}", future=True)
+    session = Session(bind=engine, expire_on_commit=False)
+    try:
+        crud.create(db=session, routine_in=Routine(name="new", task="cache.task", schedule={"timedelta": 2}))
+        session.commit()
+        assert "new" in scheduler.get_schedule()
+        assert crud.find_by_name(db=session, name="new").next_run_at is not None
+        # out of the window, e.g. after a reload
+        scheduler._reset_schedule()
+        assert "new" not in scheduler.get_schedule()
+
+        time.sleep(1.2)
+        scheduler._reset_schedule()
+        entry = scheduler.get_schedule()["new"]
+        assert entry.is_due()[1] < 1
+    finally:
+        session.close()
+        engine.dispose()
+        scheduler.close()
@@ -0,0 +1,108 @@
+import os
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from celery_sqlalchemy_kit.db import crud, Base, Routine
+from celery_sqlalchemy_kit.sharding import shard_key
+
+
+def test_migrations_upgrade_tables_of_0_2_0_to_the_model(tmp_path) -> None:
+    """
+    Creates table 'routines' of version 0.2.0 with routines, upgrades it with the shipped migrations
+    and compares the result with the model. On SQLite an id that looked like a number was stored as REAL
+    and is replaced.
+    """
+    pytest.importorskip("alembic")
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+    from celery_sqlalchemy_kit.migrations import upgrade, VERSION_TABLE
+
+    db_uri = f"sqlite:///{tmp_path / 'routines.db'}"
+    upgrade(db_uri, revision="0001")
+    engine = create_engine(db_uri, future=True)
+    ids = {"r": uuid.uuid4().hex, "numeric": "12345678123456781234567812345678"}
+    with engine.begin() as connection:
+        for name, routine_id in ids.items():
+            connection.execute(
+                text("INSERT INTO routines (id, name, task, schedule, active) VALUES (:id, :name, 't', '{}', 1)"),
+                {"id": routine_id, "name": name},
+            )
+    upgrade(db_uri)
+
+    with engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={"compare_type": True})
+        diffs = compare_metadata(context, Base.metadata)
+        assert [diff for diff in diffs if diff[0] != "remove_table" or diff[1].name != VERSION_TABLE] == []
+    session = Session(bind=engine)
+    routines = {routine.name: routine for routine in crud.get_multiple(db=session)}
+    assert routines["r"].id == uuid.UUID(ids["r"])
+    assert isinstance(routines["numeric"].id, uuid.UUID)
+    assert routines["r"].shard_key == shard_key("r")
+    session.close()
+    engine.dispose()
+
+
+def explain(session: Session, statements: list) -> list:
+    """The query plans of the captured statements."""
+    plans = []
+    dialect = session.get_bind().dialect.name
+    for statement, parameters in statements:
+        if dialect == "postgresql":
+            session.execute(text("SET enable_seqscan = off"))
+            rows = session.connection().exec_driver_sql("EXPLAIN " + statement, parameters)
+            plans.append("\n".join(row[0] for row in rows))
+        else:
+            rows = session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)
+            plans.append("\n".join(row[-1] for row in rows))
+    if dialect == "postgresql":
+        session.execute(text("RESET enable_seqscan"))
+    return plans
+
+
+@pytest.mark.parametrize("db_uri", ["sqlite://", os.getenv("SCHEDULER_DB_URI")])
+def test_scheduler_queries_use_indexes(db_uri: str) -> None:
+    """
+    Runs the queries of the scheduler, that select routines by name, id or due time, and checks with EXPLAIN
+    that they are index scans. On PostgreSQL sequential scans are disabled, so a seq scan means there is no index.
+    """
+    if not db_uri:
+        pytest.skip("needs a database (SCHEDULER_DB_URI)")
+    engine = create_engine(db_uri, future=True, isolation_level="AUTOCOMMIT")
+    Base.metadata.create_all(bind=engine, checkfirst=True)
+    session = Session(bind=engine.connect(), expire_on_commit=False)
+    name = f"explain test {os.getpid()}"
+    routine = Routine(name=name, task="explain test", schedule={"timedelta": 10})
+    crud.create(db=session, routine_in=routine)
+    session.flush()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        queries = {
+            "get_due": lambda: crud.get_due(db=session, until=datetime.now()),
+            "get_multiple": lambda: crud.get_multiple(db=session, names=[name], active=True),
+            "find_by_name": lambda: crud.find_by_name(db=session, name=name),
+            "get_run_stats": lambda: crud.get_run_stats(db=session, ids=[routine.id]),
+        }
+        for query_name, query in queries.items():
+            statements.clear()
+            query()
+            plans = explain(session, list(statements))
+            assert plans, query_name
+            for plan in plans:
+                # SQLite: SEARCH uses an index for the conditions, SCAN reads the whole table or index
+                assert "Seq Scan" not in plan and "SCAN routines" not in plan, f"{query_name}:\n{plan}"
+            if query_name == "get_due":
+                assert plans[0].count("ix_routines_active_next_run_at") == 2, plans[0]
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+        crud.remove_by_name(db=session, names=[name])
+        session.close()
+        engine.dispose()
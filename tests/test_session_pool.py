@@ -0,0 +1,99 @@
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from celery_sqlalchemy_kit.db import SessionWrapper, Base, Routine, crud
+
+
+def test_wrappers_share_engines_by_uri_and_pool_settings(tmp_path) -> None:
+    """
+    Wrappers with the same URI and pool settings share one pool, which is disposed with the last of them.
+    A given engine is used as is and not disposed.
+    """
+    uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    a = SessionWrapper(uri, connect_timeout=None)
+    b = SessionWrapper(uri, connect_timeout=None)
+    c = SessionWrapper(uri, connect_timeout=None, null_pool=True)
+    try:
+        assert a.engine.pool is b.engine.pool
+        assert isinstance(c.engine.pool, NullPool)
+        assert a.session.execute(text("SELECT 1")).scalar() == 1
+        a.close()
+        assert b.session.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        b.close()
+        c.close()
+
+    engine = create_engine(uri, pool_size=3)
+    d = SessionWrapper(engine=engine)
+    assert d.engine.pool is engine.pool
+    assert d.engine.get_execution_options()["isolation_level"] == "AUTOCOMMIT"
+    d.close()
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+    assert engine.pool.checkedout() == 0
+    engine.dispose()
+
+
+def test_sqlite_mode(tmp_path) -> None:
+    """
+    SQLite DBs are opened in WAL mode with the busy timeout, store ids that look like numbers unchanged
+    and track changes within a second by 'updated_at'.
+    """
+    db = SessionWrapper(f"sqlite:///{tmp_path / 'db.sqlite'}", busy_timeout=2)
+    try:
+        Base.metadata.create_all(bind=db.engine)
+        assert db.session.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert db.session.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert db.session.execute(text("PRAGMA busy_timeout")).scalar() == 2000
+
+        routine_id = uuid.UUID("12345678123456781234567812345678")
+        crud.create(db=db.session, routine_in=Routine(id=routine_id, name="r", task="t", schedule={"timedelta": 1}))
+        db.session.flush()
+        routine = crud.get_by_id(db=db.session, entry_id=routine_id)
+        assert routine.id == routine_id
+        _, created_at = crud.get_revision(db=db.session)
+        time.sleep(0.01)
+        crud.update(db=db.session, db_obj=routine, obj_in={"kwargs": {"a": 1}})
+        _, updated_at = crud.get_revision(db=db.session)
+        assert updated_at > created_at
+    finally:
+        db.close()
+
+
+def test_sqlite_memory_db_is_shared() -> None:
+    """All connections of a wrapper to an in-memory SQLite DB see the same DB."""
+    db = SessionWrapper("sqlite://")
+    try:
+        Base.metadata.create_all(bind=db.engine)
+        with db.engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM routines")).scalar() == 0
+    finally:
+        db.close()
+
+
+def test_renew_keeps_the_pool_of_other_wrappers(tmp_path) -> None:
+    """Renewing a wrapper only discards its own connection, the shared pool is only disposed for a single user."""
+    uri = f"sqlite:///{tmp_path / 'db.sqlite'}"
+    a = SessionWrapper(uri)
+    b = SessionWrapper(uri)
+    try:
+        pool = b.engine.pool
+        a.renew()
+        for _ in range(50):
+            if not a.degraded:
+                break
+            time.sleep(0.1)
+        assert not a.degraded
+        assert b.engine.pool is pool
+        assert b.session.execute(text("SELECT 1")).scalar() == 1
+        assert a.session.execute(text("SELECT 1")).scalar() == 1
+
+        b.close()
+        a.renew()
+        assert a.engine.pool is not pool
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,123 @@
+import os
+import time
+
+from celery import Celery
+from celery.beat import Scheduler
+from sqlalchemy import create_engine, event, text
+
+from celery_sqlalchemy_kit import RoutineScheduler
+from celery_sqlalchemy_kit.db import Base, SessionWrapper
+from celery_sqlalchemy_kit.sharding import HashRing, shard_key
+
+LEASE_TTL = 0.6
+
+
+def make_scheduler(db_uri: str) -> RoutineScheduler:
+    app = Celery("sharding", broker="memory://")
+    app.conf.update(
+        scheduler_db_uri=db_uri,
+        scheduler_sharding=True,
+        scheduler_lease_ttl=LEASE_TTL,
+        beat_schedule={f"routine {i}": {"task": "sharding.task", "schedule": 60} for i in range(100)},
+    )
+    scheduler = RoutineScheduler(app=app, lazy=True)
+    scheduler.merge_inplace(app.conf.beat_schedule)
+    return scheduler
+
+
+def test_hash_ring_spreads_routines_and_moves_only_the_share_of_a_new_member() -> None:
+    """
+    Routines are spread evenly over the members and a joining member only takes routines from the others.
+    """
+    names = [f"routine {i}" for i in range(10000)]
+    ring = HashRing(["a", "b", "c"])
+    owners = {name: ring.owner(name) for name in names}
+    for member in ring.members:
+        assert 2500 < list(owners.values()).count(member) < 4200
+
+    grown = HashRing(["a", "b", "c", "d"])
+    moved = [name for name in names if grown.owner(name) != owners[name]]
+    assert all(grown.owner(name) == "d" for name in moved)
+    assert 1500 < len(moved) < 3500
+
+    assert HashRing([]).owner("routine") is None
+
+
+def test_hash_ring_ranges_select_the_routines_of_a_member() -> None:
+    """The shard key of a routine is in the ranges of exactly one member, its owner."""
+    ring = HashRing(["a", "b", "c"])
+    ranges = {member: ring.ranges(member) for member in ring.members}
+    for i in range(10000):
+        key = shard_key(f"routine {i}")
+        owners = [m for m, r in ranges.items() if any(start <= key and (end is None or key < end) for start, end in r)]
+        assert owners == [ring.owner(f"routine {i}")]
+    assert HashRing([]).ranges("a") == []
+
+
+def test_group_membership_expires_and_can_be_left(tmp_path) -> None:
+    """
+    Members are listed while their membership is renewed, and are removed after leaving the group.
+    """
+    db = SessionWrapper(os.getenv("SCHEDULER_DB_URI") or f"sqlite:///{tmp_path / 'members.sqlite'}")
+    Base.metadata.create_all(bind=db.engine, checkfirst=True)
+    name = f"test-{os.getpid()}"
+    try:
+        assert db.join_group(name, "a", ttl=30) == ["a"]
+        assert db.join_group(name, "b", ttl=-1) == ["a", "b"]
+        # membership of b is expired
+        assert db.join_group(name, "a", ttl=30) == ["a"]
+        db.leave_group(name, "a")
+        assert db.join_group(name, "c", ttl=30) == ["c"]
+    finally:
+        db.leave_group(name, "c")
+        db.close()
+
+
+def test_members_only_select_and_send_their_routines(tmp_path, monkeypatch) -> None:
+    """
+    Settled members load only the routines in their shard key ranges, plus routines with unknown shard key,
+    whose keys they write. A member, that did not renew its membership within a third of 'lease_ttl',
+    does not send tasks anymore, since a new member may have taken over its routines meanwhile.
+    """
+    db_uri = f"sqlite:///{tmp_path / 'routines.sqlite'}"
+    schedulers = [make_scheduler(db_uri) for _ in range(2)]
+    engine = create_engine(db_uri, future=True)
+    statements = []
+    try:
+        with engine.begin() as connection:
+            connection.execute(
+                text("INSERT INTO routines (id, name, task, schedule, active) VALUES (:id, 'raw', 't', :s, 1)"),
+                {"id": "0" * 32, "s": '{"timedelta": 60}'},
+            )
+        for _ in range(3):
+            for scheduler in schedulers:
+                scheduler.update_membership()
+            time.sleep(LEASE_TTL / 3)
+        for scheduler in schedulers:
+            scheduler.update_membership()
+            assert scheduler._ring is not None and len(scheduler._ring.members) == 2
+
+        event.listen(schedulers[0]._task_db.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        schedules = [set(scheduler.get_schedule()) for scheduler in schedulers]
+        assert not schedules[0] & schedules[1]
+        assert schedules[0] | schedules[1] == {f"routine {i}" for i in range(100)} | {"raw"}
+        assert any("routines.shard_key >=" in statement for statement in statements)
+        with engine.connect() as connection:
+            keys = connection.execute(text("SELECT shard_key FROM routines WHERE name = 'raw'")).scalars().all()
+            assert keys == [shard_key("raw")]
+
+        sent = []
+        monkeypatch.setattr(Scheduler, "apply_entry", lambda self, entry, producer=None: sent.append(entry.name))
+        scheduler = schedulers[0]
+        entry = scheduler.get_schedule()[min(schedules[0])]
+        scheduler._lease_checked = None
+        scheduler.update_membership()
+        scheduler.apply_entry(entry)
+        assert sent == [entry.name]
+        time.sleep(LEASE_TTL / 3)
+        scheduler.apply_entry(entry)
+        assert sent == [entry.name]
+    finally:
+        for scheduler in schedulers:
+            scheduler.close()
+        engine.dispose()
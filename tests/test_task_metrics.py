@@ -0,0 +1,104 @@
+import asyncio
+import pstats
+import time
+from collections import defaultdict
+
+from celery import Celery
+
+from celery_sqlalchemy_kit import SyncTask, AsyncTask
+from celery_sqlalchemy_kit.metrics import Metrics
+
+
+class RecordingMetrics(Metrics):
+    def __init__(self):
+        self.values = defaultdict(list)
+
+    def observe(self, name: str, value: float, **labels: str):
+        self.values[name].append((value, labels))
+
+    def increment(self, name: str, value: float = 1, **labels: str):
+        self.values[name].append((value, labels))
+
+
+def busy_wait(seconds: float):
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+class CountTask(SyncTask):
+    name = "count"
+
+    def run(self, *args, **kwargs):
+        busy_wait(0.05)
+        return "x" * 1000
+
+
+class WaitTask(AsyncTask):
+    name = "wait"
+
+    async def execute(self, *args, **kwargs):
+        await asyncio.sleep(0.1)
+        busy_wait(0.05)
+        return "done"
+
+
+class FailingTask(AsyncTask):
+    name = "failing"
+
+    async def execute(self, *args, **kwargs):
+        raise ValueError("failed")
+
+
+def test_task_metrics_and_profiles(tmp_path) -> None:
+    """
+    Wall and CPU time, event loop busy time, result size and retries are exported per task,
+    and sampled runs are profiled, for async tasks on the event loop.
+    """
+    metrics = RecordingMetrics()
+    app = Celery("task-metrics", broker="memory://", backend="cache+memory://")
+    app.conf.update(
+        worker_metrics=metrics, worker_profile_rate=1, worker_profile_dir=str(tmp_path), celery_max_retry=0
+    )
+    # the tasks read the config of the current app
+    app.set_current()
+    count = app.register_task(CountTask())
+    wait = app.register_task(WaitTask())
+    failing = app.register_task(FailingTask())
+
+    count.apply()
+    wait.apply()
+    failing.apply()
+
+    values = {name: {labels["task"]: value for value, labels in entries} for name, entries in metrics.values.items()}
+    assert values["task_duration_seconds"]["count"] >= 0.05
+    assert values["task_cpu_seconds"]["count"] >= 0.05
+    assert values["task_result_bytes"]["count"] > 1000
+    assert values["task_duration_seconds"]["wait"] >= 0.15
+    # the sleep does not keep the event loop busy, the busy wait on it does
+    assert 0.05 <= values["task_loop_busy_seconds"]["wait"] < 0.1
+    assert values["task_cpu_seconds"]["wait"] >= 0.05
+    assert values["task_retries"] == {"failing": 1}
+
+    profiles = {path.name.split("-")[0]: path for path in tmp_path.glob("*.prof")}
+    assert profiles.keys() == {"count", "wait", "failing"}
+    for name in ("count", "wait"):
+        functions = {function for _, _, function in pstats.Stats(str(profiles[name])).stats}
+        assert "busy_wait" in functions, name
+
+
+def test_no_measurements_if_disabled() -> None:
+    """Without metrics and profiler, runs are not measured."""
+    app = Celery("task-metrics", broker="memory://", backend="cache+memory://")
+
+    # task classes are bound to the app of their first instance
+    class QuietTask(AsyncTask):
+        name = "quiet"
+
+        async def execute(self, *args, **kwargs):
+            await asyncio.sleep(0.01)
+
+    app.set_current()
+    quiet = app.register_task(QuietTask())
+    assert quiet.metrics is None and not quiet.profile_rate
+    assert quiet.apply().get() is None
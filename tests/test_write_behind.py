@@ -0,0 +1,106 @@
+import time
+import uuid
+from datetime import datetime
+
+from celery_sqlalchemy_kit.write_behind import WriteBehindBuffer
+
+
+def test_write_behind_coalesces_updates_and_spools_them_while_db_is_down(tmp_path) -> None:
+    """
+    Updates of the same routine are written once, within 'max_staleness'. Updates that could not be written
+    are saved to the spool file and written by the next buffer, only if newer than the DB.
+    """
+    writes = []
+    db_down = False
+
+    def write(updates, only_newer):
+        if db_down:
+            raise ConnectionError("db down")
+        writes.append((updates, only_newer))
+
+    spool_file = str(tmp_path / "pending.json")
+    routine_ids = [uuid.uuid4() for _ in range(3)]
+    buffer = WriteBehindBuffer(write, max_staleness=0.2, max_batch=2, spool_file=spool_file)
+    buffer.start()
+    for count in range(1, 4):
+        buffer.put("a", {"id": routine_ids[0], "last_run_at": datetime(2024, 1, 1, 0, count), "total_run_count": count})
+    time.sleep(0.5)
+    assert writes == [([{"id": routine_ids[0], "last_run_at": datetime(2024, 1, 1, 0, 3), "total_run_count": 3}], False)]
+
+    # a full batch is written at once
+    writes.clear()
+    buffer.put("a", {"id": routine_ids[0], "last_run_at": None, "total_run_count": 4})
+    buffer.put("b", {"id": routine_ids[1], "last_run_at": None, "total_run_count": 1})
+    time.sleep(0.1)
+    assert len(writes) == 1 and len(writes[0][0]) == 2
+
+    db_down = True
+    buffer.put("c", {"id": routine_ids[2], "last_run_at": datetime(2024, 1, 2), "total_run_count": 7})
+    time.sleep(0.5)
+    buffer.stop()
+    assert len(buffer) == 1
+
+    db_down = False
+    writes.clear()
+    recovered = WriteBehindBuffer(write, max_staleness=0.2, max_batch=2, spool_file=spool_file)
+    assert len(recovered) == 1
+    assert recovered.flush()
+    assert writes == [([{"id": routine_ids[2], "last_run_at": datetime(2024, 1, 2), "total_run_count": 7}], True)]
+    assert len(WriteBehindBuffer(write, max_staleness=0.2, max_batch=2, spool_file=spool_file)) == 0
+
+
+def test_write_behind_backs_off_while_db_is_down(tmp_path) -> None:
+    """A full batch that cannot be written is retried with backoff, not at once again and again."""
+    attempts = 0
+    db_down = True
+
+    def write(updates, only_newer):
+        nonlocal attempts
+        attempts += 1
+        if db_down:
+            raise ConnectionError("db down")
+
+    buffer = WriteBehindBuffer(
+        write, max_staleness=0.1, max_batch=2, spool_file=str(tmp_path / "pending.json"), max_retry_delay=0.4
+    )
+    buffer.start()
+    for name in "abc":
+        buffer.put(name, {"id": uuid.uuid4(), "last_run_at": None, "total_run_count": 1})
+    time.sleep(1)
+    # tries after 0, 0.1, 0.3 and 0.7 seconds
+    assert 3 <= attempts <= 5
+    assert len(buffer) == 3
+
+    db_down = False
+    time.sleep(0.6)
+    buffer.stop()
+    assert len(buffer) == 0
+
+
+def test_write_behind_idles_after_discarding_failed_updates(tmp_path) -> None:
+    """After a failed write, discarded updates leave no retry behind, the thread waits for new updates."""
+    db_down = True
+    writes, waits = [], []
+
+    def write(updates, only_newer):
+        if db_down:
+            raise ConnectionError("db down")
+        writes.append(updates)
+
+    buffer = WriteBehindBuffer(write, max_staleness=0.05, max_batch=10, max_retry_delay=0.05)
+    wait = buffer._cond.wait
+    buffer._cond.wait = lambda timeout=None: waits.append(timeout) or wait(timeout)
+    buffer.start()
+    buffer.put("a", {"id": uuid.uuid4(), "last_run_at": None, "total_run_count": 1})
+    time.sleep(0.2)
+    buffer.discard()
+    db_down = False
+    time.sleep(0.3)
+    waits.clear()
+    time.sleep(0.3)
+    assert len(waits) <= 1 and len(buffer) == 0 and writes == []
+
+    buffer.put("b", {"id": uuid.uuid4(), "last_run_at": None, "total_run_count": 1})
+    time.sleep(0.2)
+    buffer.stop()
+    assert len(writes) == 1